@@ -0,0 +1,429 @@
+"""
+ASGI entry point: the same API as main.py on Starlette, for uvicorn workers. Each worker runs one
+long-lived event loop, so every report in the process shares one pooled OpenAI client and one
+scheduler, and a report waiting on OpenAI costs a coroutine rather than a thread.
+
+Run from backend/:  uvicorn asgi:app --host 0.0.0.0 --port 8000 --workers 2
+
+For hundreds of reports in flight per worker, also raise OPENAI_GLOBAL_CONCURRENCY and
+OPENAI_MAX_CONNECTIONS (calls beyond them wait their turn) and PDF_RENDER_QUEUE_DEPTH
+(renders beyond it are refused with 503).
+"""
+import os
+import re
+import json
+import contextlib
+from email.utils import formatdate
+import anyio
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, FileResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from utils.report import (parse_report_request, run_report_pipeline, aiter_report_events, aiter_duplicate_report_events,
+                          format_sse_event, ReportRequestError)
+from utils.jobs import ReportJobQueue, JobQueueFullError
+from utils.uploads import save_palm_upload, UploadTooLargeError, PALM_UPLOAD_MAX_BYTES, REQUEST_MAX_BYTES
+from utils.images import InvalidImageError
+from utils.render_pool import start_render_pool, render_queue_depth, RenderQueueFullError
+from utils.report_store import report_store, start_report_janitor
+from utils.gpt import openai_session
+from utils.payments import create_payment_order, handle_webhook_event, verify_payment
+from utils.idempotency import (report_idempotency, report_idempotency_key, duplicate_report_response, job_accepted_response,
+                               follow_report, RUNNING, REPORT_DUPLICATE_WAIT)
+from utils import metrics
+
+load_dotenv()
+
+if not os.getenv("OPENAI_API_KEY"):
+    print("CRITICAL ERROR: OPENAI_API_KEY is missing. AI functionality will not work.")
+
+# Temporary directory for generated PDFs
+PDF_OUTPUT_DIR = "temp_reports"
+os.makedirs(PDF_OUTPUT_DIR, exist_ok=True)
+
+# Threads that parse report payloads (image decoding and resizing is CPU and memory heavy);
+# further requests wait for one, so a burst of reports doesn't decode every photo at once
+REQUEST_PARSE_THREADS = int(os.getenv("REQUEST_PARSE_THREADS", str(os.cpu_count() or 1)))
+_parse_limiter = anyio.CapacityLimiter(max(1, REQUEST_PARSE_THREADS))
+
+_RANGE = re.compile(r"bytes=(\d*)-(\d*)")
+
+# Background report generation (see /api/report-jobs). Jobs keep running on the queue's own threads.
+report_jobs = ReportJobQueue(run_report_pipeline)
+
+metrics.RENDER_QUEUE_DEPTH.set_function(render_queue_depth)
+metrics.REPORT_JOBS_PENDING.set_function(lambda: report_jobs.pending)
+
+
+def _error(message, status):
+    return JSONResponse({"status": "error", "message": message}, status_code=status)
+
+
+def _load_json(body):
+    try:
+        return json.loads(body) if body else None
+    except ValueError:
+        return None
+
+
+async def _read_report_payload(request):
+    """
+    Reads a report payload's JSON. The body is read from the stream rather than request.body(),
+    so the inline images aren't kept on the request.
+    """
+    body = b"".join([chunk async for chunk in request.stream()])
+    return await anyio.to_thread.run_sync(_load_json, body, limiter=_parse_limiter)
+
+
+async def _parse_report_payload(data):
+    """Validates a report payload; parsing and image normalization run on one of REQUEST_PARSE_THREADS threads."""
+    return await anyio.to_thread.run_sync(parse_report_request, data, limiter=_parse_limiter)
+
+
+async def _find_duplicate(idempotency_key):
+    """The report already claimed for this payment, checked before its images are decoded."""
+    if idempotency_key is None:
+        return None
+    return await run_in_threadpool(report_idempotency.find, idempotency_key)
+
+
+async def _duplicate_report(idempotency_key):
+    """Same as main.py: the original request's outcome, or 202 with a job to poll if it runs past REPORT_DUPLICATE_WAIT."""
+    record = await report_idempotency.wait_async(idempotency_key, timeout=REPORT_DUPLICATE_WAIT)
+    if record is not None and record["status"] == RUNNING:
+        return await _duplicate_job(idempotency_key, record)
+    body, status = duplicate_report_response(record)
+    return JSONResponse(body, status_code=status)
+
+
+async def _duplicate_job(idempotency_key, record):
+    """Same as main.py: the job already generating this payment's report, or one following its request."""
+    if record["job_id"]:
+        body, status = job_accepted_response(record["job_id"], job_status=record["status"],
+                                             message="A report job was already submitted for this payment.")
+        return JSONResponse(body, status_code=status)
+    try:
+        job_id = await run_in_threadpool(report_jobs.submit, {"idempotency_key": idempotency_key}, follow_report)
+    except JobQueueFullError as e:
+        return _error(str(e), 503)
+    body, status = job_accepted_response(job_id)
+    return JSONResponse(body, status_code=status)
+
+
+def _event_stream(events):
+    async def body():
+        async for event in events:
+            yield format_sse_event(event)
+
+    return StreamingResponse(body(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+class _BodyTooLarge(Exception):
+    pass
+
+
+class LimitRequestBody:
+    """
+    ASGI counterpart of Flask's MAX_CONTENT_LENGTH: answers 413 once a request body passes
+    `max_bytes`, whether it declares a Content-Length or arrives chunked without one.
+    """
+
+    def __init__(self, app, max_bytes=REQUEST_MAX_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        too_large = _error("Request body is too large.", 413)
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > self.max_bytes:
+            return await too_large(scope, receive, send)
+
+        received = 0
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise _BodyTooLarge()
+            return message
+
+        async def tracked_send(message):
+            nonlocal response_started
+            response_started = response_started or message["type"] == "http.response.start"
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except _BodyTooLarge:
+            if response_started:
+                raise
+            await too_large(scope, receive, send)
+
+
+# --- Routes ---
+
+async def index(request):
+    return PlainTextResponse("Backend is running. Please access the frontend at its own URL (aurapalm.in).")
+
+
+async def health_check(request):
+    return JSONResponse({"status": "healthy", "message": "Backend is up and running!"})
+
+
+async def prometheus_metrics(request):
+    """Prometheus scrape endpoint. Metrics are kept per process, as in main.py."""
+    return Response(metrics.render_metrics(), media_type='text/plain; version=0.0.4')
+
+
+async def create_order(request):
+    body, status = await run_in_threadpool(create_payment_order, await request.json())
+    return JSONResponse(body, status_code=status)
+
+
+async def razorpay_webhook(request):
+    body, status = handle_webhook_event(await request.json())
+    return JSONResponse(body, status_code=status)
+
+
+async def upload_palm_image(request):
+    """Same as main.py: one palm photo as multipart/form-data (field 'image'), answered with its id."""
+    content_length = request.headers.get('content-length')
+    if content_length and content_length.isdigit() and int(content_length) > PALM_UPLOAD_MAX_BYTES + 64 * 1024:
+        return _error("Palm image is too large.", 413)
+
+    form = await request.form(max_files=1)
+    image_file = form.get('image')
+    if image_file is None or isinstance(image_file, str):
+        return _error("Missing image file.", 400)
+
+    try:
+        image_id = await run_in_threadpool(save_palm_upload, image_file.file)
+    except UploadTooLargeError as e:
+        return _error(str(e), 413)
+    except InvalidImageError as e:
+        return _error(str(e), 400)
+    finally:
+        await form.close()
+
+    return JSONResponse({"status": "success", "image_id": image_id}, status_code=201)
+
+
+async def generate_report_api(request):
+    data = await _read_report_payload(request)
+    # The payment is checked first, as a resubmitted one is answered from the earlier request for it
+    payment_error = verify_payment(data) if data else None
+    if payment_error:
+        return _error(payment_error, 400)
+
+    idempotency_key = report_idempotency_key(data)
+    if await _find_duplicate(idempotency_key):
+        return await _duplicate_report(idempotency_key)
+
+    try:
+        report_args = await _parse_report_payload(data)
+    except ReportRequestError as e:
+        return _error(str(e), 400)
+
+    if idempotency_key:
+        if await run_in_threadpool(report_idempotency.claim, idempotency_key):
+            return await _duplicate_report(idempotency_key)
+        report_args['idempotency_key'] = idempotency_key
+
+    try:
+        download_url = await run_report_pipeline(**report_args)
+        return JSONResponse({
+            "status": "success",
+            "message": "Report generated successfully.",
+            "download_url": download_url
+        })
+    except RenderQueueFullError as e:
+        return _error(str(e), 503)
+    except Exception as e:
+        print(f"ERROR: Error during report generation: {e}")
+        return _error(f"An error occurred during report generation: {str(e)}", 500)
+
+
+async def generate_report_stream(request):
+    """Same as main.py: the report as text/event-stream, generated on this worker's event loop."""
+    data = await _read_report_payload(request)
+    payment_error = verify_payment(data) if data else None
+    if payment_error:
+        return _error(payment_error, 400)
+
+    idempotency_key = report_idempotency_key(data)
+    if await _find_duplicate(idempotency_key):
+        return _event_stream(aiter_duplicate_report_events(idempotency_key))
+
+    try:
+        report_args = await _parse_report_payload(data)
+    except ReportRequestError as e:
+        return _error(str(e), 400)
+
+    if idempotency_key:
+        if await run_in_threadpool(report_idempotency.claim, idempotency_key):
+            return _event_stream(aiter_duplicate_report_events(idempotency_key))
+        report_args['idempotency_key'] = idempotency_key
+
+    return _event_stream(aiter_report_events(report_args))
+
+
+async def submit_report_job(request):
+    data = await _read_report_payload(request)
+    payment_error = verify_payment(data) if data else None
+    if payment_error:
+        return _error(payment_error, 400)
+
+    idempotency_key = report_idempotency_key(data)
+    duplicate = await _find_duplicate(idempotency_key)
+    if duplicate:
+        return await _duplicate_job(idempotency_key, duplicate)
+
+    try:
+        report_args = await _parse_report_payload(data)
+    except ReportRequestError as e:
+        return _error(str(e), 400)
+
+    if idempotency_key:
+        duplicate = await run_in_threadpool(report_idempotency.claim, idempotency_key)
+        if duplicate:
+            return await _duplicate_job(idempotency_key, duplicate)
+        report_args['idempotency_key'] = idempotency_key
+
+    try:
+        job_id = await run_in_threadpool(report_jobs.submit, report_args)
+    except JobQueueFullError as e:
+        if idempotency_key:
+            await run_in_threadpool(report_idempotency.fail, idempotency_key, str(e))
+        return _error(str(e), 503)
+    if idempotency_key:
+        await run_in_threadpool(report_idempotency.attach_job, idempotency_key, job_id)
+
+    body, status = job_accepted_response(job_id)
+    return JSONResponse(body, status_code=status)
+
+
+async def report_job_status(request):
+    job_id = request.path_params['job_id']
+    job = await run_in_threadpool(report_jobs.get, job_id)
+    if job is None:
+        return _error("Report job not found.", 404)
+
+    response = {"status": "success", "job_id": job_id, "job_status": job["status"]}
+    if job.get("result"):
+        response["download_url"] = job["result"].get("download_url")
+    if job.get("error"):
+        response["error"] = job["error"]
+    return JSONResponse(response)
+
+
+def _etag_matches(request, etag):
+    if_none_match = request.headers.get('if-none-match')
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip().removeprefix('W/') for candidate in if_none_match.split(',')]
+    return '*' in candidates or etag in candidates
+
+
+def _stored_report_response(request, report):
+    """A report from the in-memory store, with the ETag and single-range support main.py gets from Werkzeug."""
+    etag = f'"{report["etag"]}"'
+    headers = {
+        'Content-Disposition': f'attachment; filename="{report["filename"]}"',
+        'ETag': etag,
+        'Last-Modified': formatdate(report['created_at'], usegmt=True),
+        'Cache-Control': 'private',
+        'Accept-Ranges': 'bytes',
+    }
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    size = report['size']
+    match = _RANGE.fullmatch(request.headers.get('range', '').strip())
+    if match and request.headers.get('if-range', etag) == etag and any(match.groups()):
+        first, last = match.groups()
+        if first:
+            start, end = int(first), min(int(last), size - 1) if last else size - 1
+        else:
+            start, end = max(0, size - int(last)), size - 1 # Suffix range: the last N bytes
+        if start > end or start >= size:
+            return Response(status_code=416, headers={**headers, 'Content-Range': f'bytes */{size}'})
+        return Response(report['data'][start:end + 1], status_code=206, media_type='application/pdf',
+                        headers={**headers, 'Content-Range': f'bytes {start}-{end}/{size}'})
+    return Response(report['data'], media_type='application/pdf', headers=headers)
+
+
+def _delete_report_file(file_path):
+    try:
+        os.remove(file_path)
+        print(f"INFO: Deleted temporary report file: {file_path}")
+    except Exception as e:
+        print(f"ERROR: Failed to delete temporary file {file_path}: {e}")
+
+
+async def download_report(request):
+    filename = request.path_params['filename']
+    # Reports rendered in memory are served straight from the store
+    if report_store is not None:
+        report = await run_in_threadpool(report_store.get, filename)
+        if report is not None:
+            return _stored_report_response(request, report)
+
+    file_path = os.path.join(PDF_OUTPUT_DIR, os.path.basename(filename))
+    try:
+        stat_result = await run_in_threadpool(os.stat, file_path)
+    except FileNotFoundError:
+        print(f"ERROR: Download requested for non-existent file: {file_path}")
+        return _error("Report file not found.", 404)
+
+    response = FileResponse(file_path, media_type='application/pdf', filename=filename, stat_result=stat_result)
+    if _etag_matches(request, response.headers['etag']):
+        return Response(status_code=304, headers={'ETag': response.headers['etag']})
+    # Keep the file for resumed (Range) downloads; a full download claims it. Unclaimed files are left to the janitor.
+    if 'range' not in request.headers:
+        response.background = BackgroundTask(_delete_report_file, file_path)
+    return response
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # Pre-fork the PDF render workers here rather than at import: uvicorn's --workers are
+    # themselves child processes, so main.py's parent_process() check would skip them.
+    start_render_pool()
+    # Evict reports that are never downloaded (in-memory store and orphaned files in temp_reports)
+    start_report_janitor()
+    # One OpenAI connection pool for every report on this worker's loop, closed at shutdown
+    async with openai_session():
+        yield
+
+
+app = Starlette(
+    routes=[
+        Route('/', index),
+        Route('/health', health_check, methods=['GET']),
+        Route('/metrics', prometheus_metrics, methods=['GET']),
+        Route('/api/create-order', create_order, methods=['POST']),
+        Route('/api/razorpay-webhook', razorpay_webhook, methods=['POST']),
+        Route('/api/palm-images', upload_palm_image, methods=['POST']),
+        Route('/api/generate-report', generate_report_api, methods=['POST']),
+        Route('/api/generate-report/stream', generate_report_stream, methods=['POST']),
+        Route('/api/report-jobs', submit_report_job, methods=['POST']),
+        Route('/api/report-jobs/{job_id}', report_job_status, methods=['GET']),
+        Route('/api/download-report/{filename}', download_report, methods=['GET']),
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*']), # As CORS(app) in main.py
+        Middleware(LimitRequestBody, max_bytes=REQUEST_MAX_BYTES), # As MAX_CONTENT_LENGTH in main.py
+    ],
+    lifespan=lifespan,
+)
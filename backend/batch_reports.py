@@ -0,0 +1,451 @@
+"""
+Offline batch report generation for bulk campaigns, using the OpenAI Batch API file format.
+
+Orders are read from JSONL, one per line, with the same fields as a /api/generate-report
+payload minus the Razorpay ones, plus a unique "order_id". Palm images may be given inline
+(*_image_base64) or as paths to image files (*_image_path), e.g.:
+
+    {"order_id": "promo-0001", "report_type": "individual", "language": "en",
+     "personal_details": {"name": "Asha K", "dob": "1990-01-02", "gender": "female"},
+     "left_palm_image_path": "palms/0001-left.jpg", "right_palm_image_path": "palms/0001-right.jpg"}
+
+Steps (run from backend/):
+    python batch_reports.py prepare --orders orders.jsonl   # writes WORKDIR/requests/requests-NNN.jsonl
+    (upload the request files to the Batch API and download the result files)
+    python batch_reports.py ingest results.jsonl [...]      # stores section texts
+    python batch_reports.py retry                           # re-emits requests for failed sections only
+    python batch_reports.py render --workers 4              # renders finished orders to WORKDIR/pdfs/
+    python batch_reports.py status
+
+Without network access, `fake-results` writes a results file for the prepared requests, and
+`run --orders orders.jsonl --fake` does prepare -> fake-results -> ingest -> render end to end.
+
+All progress is checkpointed in WORKDIR/checkpoint.sqlite3, so every step can be re-run after
+a crash: prepared orders are not re-emitted, results are upserted, rendered PDFs are skipped.
+"""
+import os
+import sys
+import json
+import base64
+import sqlite3
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from utils.images import PalmImage
+from utils.report import parse_report_request, ReportRequestError
+from utils.numerology import get_numerology_insights
+from utils.gpt import build_report_plan
+from utils.pdf import generate_pdf_report
+
+# --- Batch Configuration ---
+BATCH_WORKDIR = os.getenv("BATCH_WORKDIR", "batch_work")
+BATCH_MODEL = os.getenv("BATCH_MODEL", "gpt-4o") # Same model as generate_full_report_content
+BATCH_TEMPERATURE = 0.7
+# Batch API input limits are 50,000 requests and 200 MB per file; stay a little under the latter
+BATCH_MAX_REQUESTS_PER_FILE = int(os.getenv("BATCH_MAX_REQUESTS_PER_FILE", "50000"))
+BATCH_MAX_FILE_BYTES = int(os.getenv("BATCH_MAX_FILE_BYTES", str(190 * 1024 * 1024)))
+BATCH_RENDER_WORKERS = int(os.getenv("BATCH_RENDER_WORKERS", str(os.cpu_count() or 1)))
+
+IMAGE_FIELDS = [
+    'left_palm_image_base64', 'right_palm_image_base64',
+    'person1_left_palm_image_base64', 'person1_right_palm_image_base64',
+    'person2_left_palm_image_base64', 'person2_right_palm_image_base64',
+]
+# Keyword arguments of run_report_pipeline that hold PalmImageVariants
+VARIANT_ARGS = ['left_palm_image_base64', 'right_palm_image_base64',
+                'person2_left_palm_image_base64', 'person2_right_palm_image_base64']
+
+
+# --- Checkpoint ---
+
+def open_checkpoint(workdir):
+    os.makedirs(workdir, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(workdir, "checkpoint.sqlite3"))
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS orders ("
+        " order_id TEXT PRIMARY KEY, state TEXT NOT NULL, status TEXT NOT NULL,"
+        " pdf_path TEXT, error TEXT)"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS sections ("
+        " order_id TEXT NOT NULL, section_key TEXT NOT NULL, content TEXT NOT NULL,"
+        " PRIMARY KEY (order_id, section_key))"
+    )
+    conn.commit()
+    return conn
+
+
+def _load_state(row):
+    return json.loads(row["state"])
+
+
+# --- Prepare ---
+
+def _inline_image_paths(order):
+    """Replaces *_image_path fields with inline base64 so parse_report_request can load them."""
+    order = dict(order)
+    for field in IMAGE_FIELDS:
+        path = order.pop(field.replace('_image_base64', '_image_path'), None)
+        if path and not order.get(field):
+            with open(path, "rb") as f:
+                order[field] = base64.b64encode(f.read()).decode("ascii")
+    return order
+
+
+def _save_order_images(workdir, order_id, report_args):
+    """Writes both variants of every palm image under WORKDIR/images and returns their paths."""
+    image_dir = os.path.join(workdir, "images")
+    os.makedirs(image_dir, exist_ok=True)
+    paths = {}
+    for arg in VARIANT_ARGS:
+        variants = report_args.get(arg)
+        if variants is None:
+            continue
+        paths[arg] = {}
+        for name, data in variants._asdict().items():
+            path = os.path.join(image_dir, f"{order_id}.{arg}.{name}")
+            with open(path, "wb") as f:
+                f.write(data.data)
+            paths[arg][name] = path
+    return paths
+
+
+def _order_image(state, arg, variant):
+    path = state["images"].get(arg, {}).get(variant)
+    if path is None:
+        return None
+    with open(path, "rb") as f:
+        return PalmImage(f.read())
+
+
+def _order_plan(state):
+    """The report plan for an order: the same prompts generate_full_report_content sends, one per section."""
+    return build_report_plan(
+        state["user_details"], state["numerology_p1"],
+        _order_image(state, 'left_palm_image_base64', 'for_vision'), _order_image(state, 'right_palm_image_base64', 'for_vision'),
+        state["language"], state["report_type"],
+        state["person2_details"], state["numerology_p2"],
+        _order_image(state, 'person2_left_palm_image_base64', 'for_vision'), _order_image(state, 'person2_right_palm_image_base64', 'for_vision')
+    )
+
+
+class RequestFileWriter:
+    """Writes Batch API request lines, starting a new file at the request-count or size limit."""
+
+    def __init__(self, workdir):
+        self.request_dir = os.path.join(workdir, "requests")
+        os.makedirs(self.request_dir, exist_ok=True)
+        # Continue numbering after files from earlier runs, never appending to them
+        self.index = len([name for name in os.listdir(self.request_dir) if name.endswith(".jsonl")])
+        self.file = None
+        self.paths = []
+
+    def _rotate(self):
+        if self.file:
+            self.file.close()
+        self.index += 1
+        path = os.path.join(self.request_dir, f"requests-{self.index:03d}.jsonl")
+        self.file = open(path, "w", encoding="utf-8")
+        self.paths.append(path)
+        self.count = 0
+        self.size = 0
+
+    def write_order(self, lines):
+        """Writes all lines of one order to the same file, so an order is never split across batches."""
+        encoded = [json.dumps(line, ensure_ascii=False) + "\n" for line in lines]
+        order_bytes = sum(len(line.encode("utf-8")) for line in encoded)
+        if (self.file is None or self.count + len(encoded) > BATCH_MAX_REQUESTS_PER_FILE
+                or self.size + order_bytes > BATCH_MAX_FILE_BYTES):
+            self._rotate()
+        self.file.writelines(encoded)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.count += len(encoded)
+        self.size += order_bytes
+
+    def close(self):
+        if self.file:
+            self.file.close()
+
+
+def _request_lines(order_id, plan, only=None):
+    return [
+        {
+            "custom_id": f"{order_id}:{section_key}",
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {"model": BATCH_MODEL, "messages": messages, "max_tokens": max_tokens, "temperature": BATCH_TEMPERATURE},
+        }
+        for section_key, messages, max_tokens in plan if only is None or section_key in only
+    ]
+
+
+def prepare(orders_path, workdir):
+    """Reads orders, checkpoints each one and writes its section requests. Returns the new request files."""
+    conn = open_checkpoint(workdir)
+    known = {row["order_id"] for row in conn.execute("SELECT order_id FROM orders")}
+    writer = RequestFileWriter(workdir)
+    prepared = skipped = rejected = 0
+    try:
+        with open(orders_path, encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                order = json.loads(line)
+                order_id = str(order.get("order_id") or "")
+                if not order_id or ":" in order_id:
+                    print(f"ERROR: Line {line_number}: order_id is missing or contains ':'. Skipped.")
+                    rejected += 1
+                    continue
+                if order_id in known:
+                    skipped += 1
+                    continue
+                try:
+                    report_args = parse_report_request(_inline_image_paths(order), require_payment=False)
+                except (ReportRequestError, OSError) as e:
+                    print(f"ERROR: Order {order_id}: {e}")
+                    rejected += 1
+                    continue
+
+                person2_details = report_args["person2_details"]
+                state = {
+                    "user_details": report_args["user_details"],
+                    "person2_details": person2_details,
+                    "language": report_args["language"],
+                    "report_type": report_args["report_type"],
+                    "numerology_p1": get_numerology_insights(report_args["user_details"]["person1_dob"], report_args["user_details"]["person1_name"],
+                                                             report_args["language"]),
+                    "numerology_p2": get_numerology_insights(person2_details["person2_dob"], person2_details["person2_name"], report_args["language"])
+                                     if report_args["report_type"] == "couple" else None,
+                    "images": _save_order_images(workdir, order_id, report_args),
+                }
+                plan = _order_plan(state)
+                state["section_keys"] = [section_key for section_key, _, _ in plan]
+
+                # Requests are on disk before the order is checkpointed; a crash in between re-emits
+                # this order on resume, and the duplicate results are harmless upserts.
+                writer.write_order(_request_lines(order_id, plan))
+                conn.execute("INSERT INTO orders (order_id, state, status) VALUES (?, ?, 'prepared')", (order_id, json.dumps(state)))
+                conn.commit()
+                known.add(order_id)
+                prepared += 1
+    finally:
+        writer.close()
+        conn.close()
+
+    print(f"INFO: Prepared {prepared} orders ({skipped} already prepared, {rejected} rejected) into {len(writer.paths)} request files.")
+    for path in writer.paths:
+        print(f"INFO:   {path}")
+    return writer.paths
+
+
+def retry(workdir):
+    """Writes request files for the sections of unrendered orders that have no result yet."""
+    conn = open_checkpoint(workdir)
+    writer = RequestFileWriter(workdir)
+    sections = 0
+    try:
+        for row in conn.execute("SELECT * FROM orders WHERE status = 'prepared'").fetchall():
+            state = _load_state(row)
+            done = {r["section_key"] for r in conn.execute("SELECT section_key FROM sections WHERE order_id = ?", (row["order_id"],))}
+            missing = set(state["section_keys"]) - done
+            if missing:
+                writer.write_order(_request_lines(row["order_id"], _order_plan(state), only=missing))
+                sections += len(missing)
+    finally:
+        writer.close()
+        conn.close()
+    print(f"INFO: Wrote {sections} retry requests into {len(writer.paths)} request files.")
+    return writer.paths
+
+
+# --- Results ---
+
+def write_fake_results(request_paths, results_path):
+    """Answers every request in `request_paths` with placeholder text, in the Batch API output format."""
+    with open(results_path, "w", encoding="utf-8") as out:
+        for path in request_paths:
+            with open(path, encoding="utf-8") as f:
+                for index, line in enumerate(f):
+                    request = json.loads(line)
+                    section_key = request["custom_id"].split(":", 1)[1]
+                    content = f"Sample {section_key.replace('_', ' ')} text for offline testing of the batch pipeline."
+                    result = {
+                        "id": f"batch_req_fake_{index}",
+                        "custom_id": request["custom_id"],
+                        "response": {
+                            "status_code": 200,
+                            "request_id": f"fake_{index}",
+                            "body": {"object": "chat.completion", "model": request["body"]["model"],
+                                     "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}]},
+                        },
+                        "error": None,
+                    }
+                    out.write(json.dumps(result, ensure_ascii=False) + "\n")
+    print(f"INFO: Wrote fake results to {results_path}")
+
+
+def ingest(result_paths, workdir):
+    """Stores the section texts from Batch API result files. Safe to run again on the same files."""
+    conn = open_checkpoint(workdir)
+    known = {row["order_id"] for row in conn.execute("SELECT order_id FROM orders")}
+    stored = failed = unknown = 0
+    try:
+        for path in result_paths:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    result = json.loads(line)
+                    order_id, _, section_key = result.get("custom_id", "").partition(":")
+                    if order_id not in known:
+                        unknown += 1
+                        continue
+                    response = result.get("response") or {}
+                    try:
+                        content = response["body"]["choices"][0]["message"]["content"]
+                    except (KeyError, IndexError, TypeError):
+                        content = None
+                    if result.get("error") or response.get("status_code") != 200 or not content:
+                        failed += 1
+                        print(f"WARNING: No usable result for {result.get('custom_id')}: {result.get('error') or response.get('status_code')}")
+                        continue
+                    conn.execute("INSERT OR REPLACE INTO sections (order_id, section_key, content) VALUES (?, ?, ?)",
+                                 (order_id, section_key, content))
+                    stored += 1
+            conn.commit() # Checkpoint per file
+    finally:
+        conn.close()
+    print(f"INFO: Ingested {stored} sections ({failed} failed, {unknown} for unknown orders). "
+          f"Run 'retry' to re-request failed sections.")
+
+
+# --- Render ---
+
+def _render_order(state, report_content, pdf_path):
+    """Renders one order's PDF (runs in a worker process). Writes then renames, so a crash leaves no partial PDF."""
+    partial_path = f"{pdf_path}.part"
+    with open(partial_path, "wb") as target:
+        generate_pdf_report(
+            state["user_details"], state["numerology_p1"], report_content,
+            _order_image(state, 'left_palm_image_base64', 'for_print'), _order_image(state, 'right_palm_image_base64', 'for_print'),
+            state["language"], state["report_type"],
+            state["person2_details"], state["numerology_p2"],
+            _order_image(state, 'person2_left_palm_image_base64', 'for_print'), _order_image(state, 'person2_right_palm_image_base64', 'for_print'),
+            target=target
+        )
+    os.replace(partial_path, pdf_path)
+    return pdf_path
+
+
+def render(workdir, workers=BATCH_RENDER_WORKERS):
+    """Renders every order whose sections are all ingested, in parallel, checkpointing each PDF."""
+    conn = open_checkpoint(workdir)
+    pdf_dir = os.path.join(workdir, "pdfs")
+    os.makedirs(pdf_dir, exist_ok=True)
+
+    ready, incomplete = [], 0
+    for row in conn.execute("SELECT * FROM orders WHERE status = 'prepared'").fetchall():
+        state = _load_state(row)
+        sections = dict(conn.execute("SELECT section_key, content FROM sections WHERE order_id = ?", (row["order_id"],)).fetchall())
+        if not all(key in sections for key in state["section_keys"]):
+            incomplete += 1
+            continue
+        # Same layout as generate_full_report_content: sections in plan order
+        report_content = {key: sections[key] for key in state["section_keys"]}
+        ready.append((row["order_id"], state, report_content, os.path.join(pdf_dir, f"{row['order_id']}.pdf")))
+
+    rendered = failed = 0
+    if ready:
+        print(f"INFO: Rendering {len(ready)} reports with {workers} workers...")
+        # 'spawn' for the same reason as the web render pool: WeasyPrint state doesn't survive fork well
+        with ProcessPoolExecutor(max_workers=max(1, workers), mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = {pool.submit(_render_order, state, content, path): order_id for order_id, state, content, path in ready}
+            for future in as_completed(futures):
+                order_id = futures[future]
+                try:
+                    pdf_path = future.result()
+                    conn.execute("UPDATE orders SET status = 'rendered', pdf_path = ?, error = NULL WHERE order_id = ?", (pdf_path, order_id))
+                    rendered += 1
+                except Exception as e:
+                    print(f"ERROR: Rendering order {order_id} failed: {e}")
+                    conn.execute("UPDATE orders SET error = ? WHERE order_id = ?", (str(e), order_id))
+                    failed += 1
+                conn.commit()
+    conn.close()
+    print(f"INFO: Rendered {rendered} reports ({failed} failed, {incomplete} still waiting for results) into {pdf_dir}")
+
+
+def status(workdir):
+    conn = open_checkpoint(workdir)
+    counts = dict(conn.execute("SELECT status, COUNT(*) FROM orders GROUP BY status").fetchall())
+    sections = conn.execute("SELECT COUNT(*) FROM sections").fetchone()[0]
+    errors = conn.execute("SELECT COUNT(*) FROM orders WHERE error IS NOT NULL").fetchone()[0]
+    conn.close()
+    print(f"Orders prepared (not rendered): {counts.get('prepared', 0)}")
+    print(f"Orders rendered: {counts.get('rendered', 0)}")
+    print(f"Orders with render errors: {errors}")
+    print(f"Sections ingested: {sections}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workdir", default=BATCH_WORKDIR, help="Directory for request files, images, PDFs and the checkpoint")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    prepare_parser = commands.add_parser("prepare", help="Write Batch API request files for new orders")
+    prepare_parser.add_argument("--orders", required=True)
+
+    commands.add_parser("retry", help="Write request files for sections without a result")
+
+    fake_parser = commands.add_parser("fake-results", help="Write a placeholder results file for request files")
+    fake_parser.add_argument("requests", nargs="+")
+    fake_parser.add_argument("--out", required=True)
+
+    ingest_parser = commands.add_parser("ingest", help="Store section texts from Batch API result files")
+    ingest_parser.add_argument("results", nargs="+")
+
+    render_parser = commands.add_parser("render", help="Render PDFs for orders with all sections")
+    render_parser.add_argument("--workers", type=int, default=BATCH_RENDER_WORKERS)
+
+    commands.add_parser("status", help="Show checkpoint progress")
+
+    run_parser = commands.add_parser("run", help="prepare -> (fake) results -> ingest -> render")
+    run_parser.add_argument("--orders", required=True)
+    run_parser.add_argument("--fake", action="store_true", help="Use placeholder results instead of a real batch (no network)")
+    run_parser.add_argument("--results", nargs="*", default=[], help="Result files of an already completed batch")
+    run_parser.add_argument("--workers", type=int, default=BATCH_RENDER_WORKERS)
+
+    args = parser.parse_args(argv)
+    if args.command == "prepare":
+        prepare(args.orders, args.workdir)
+    elif args.command == "retry":
+        retry(args.workdir)
+    elif args.command == "fake-results":
+        write_fake_results(args.requests, args.out)
+    elif args.command == "ingest":
+        ingest(args.results, args.workdir)
+    elif args.command == "render":
+        render(args.workdir, args.workers)
+    elif args.command == "status":
+        status(args.workdir)
+    elif args.command == "run":
+        request_paths = prepare(args.orders, args.workdir)
+        result_paths = list(args.results)
+        if args.fake:
+            fake_path = os.path.join(args.workdir, "fake-results.jsonl")
+            write_fake_results(request_paths, fake_path)
+            result_paths.append(fake_path)
+        if not result_paths:
+            print("INFO: Submit the request files to the Batch API, then run 'ingest' and 'render'.")
+            return 0
+        ingest(result_paths, args.workdir)
+        render(args.workdir, args.workers)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
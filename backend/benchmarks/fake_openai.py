@@ -0,0 +1,256 @@
+"""
+Local stand-in for the OpenAI chat completions endpoint, with injectable latency and errors,
+and for the Razorpay orders API. Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1
+and RAZORPAY_BASE_URL=http://127.0.0.1:<port> (any OPENAI_API_KEY and Razorpay keys work).
+
+Run from backend/:  python benchmarks/fake_openai.py --port 8081 --latency 0.5 --error-rate 0.05 --rate-limit-rate 0.05
+or start it in-process with start_fake_openai() (see benchmarks/resilience_bench.py).
+
+Latency and output per request:
+  --latency          mean response time in seconds, drawn from --distribution (normal with --jitter as
+                     the standard deviation, lognormal with --jitter as sigma, or exponential)
+  --model-latency    per-model mean response time, e.g. --model-latency gpt-4o-mini=0.4 (repeatable)
+  --token-latency    seconds added per completion token (generation speed)
+  --completion-tokens  tokens in each answer (capped at the request's max_tokens)
+  --razorpay-latency mean response time of POST /v1/orders
+
+Faults are drawn per request:
+  --error-rate       fraction answered with 500
+  --rate-limit-rate  fraction answered with 429 and a Retry-After header (--retry-after seconds)
+  --tail-rate        fraction delayed by --tail-latency instead of --latency (slow stragglers)
+  --tpm-limit        tokens per minute (prompt estimate + max_tokens) before answering 429, like the real account limit
+Streamed requests (stream=true) are sent as SSE chunks, ending with a usage chunk.
+GET /stats returns the answer counts so far (see start_fake_openai).
+"""
+import re
+import sys
+import json
+import math
+import time
+import uuid
+import random
+import argparse
+import threading
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+IMAGE_TOKENS = 765 # What OpenAI bills for a 1024px image at high detail
+DATA_URL = re.compile(r'"data:[^"]*"')
+REPLY_SENTENCE = "Your palm shows a long, clear head line and a strong mount of Jupiter. "
+DISTRIBUTIONS = ("normal", "lognormal", "exponential")
+
+
+@dataclass
+class Faults:
+    latency: float = 0.2
+    jitter: float = 0.1
+    tail_rate: float = 0.0
+    tail_latency: float = 10.0
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after: float = 1.0
+    tpm_limit: int = 0
+    model_latency: dict = field(default_factory=dict)
+    distribution: str = "normal"
+    token_latency: float = 0.0
+    completion_tokens: int = 140
+    razorpay_latency: float = 0.05
+
+    def draw_latency(self, mean):
+        """One response time with the given mean, from the configured distribution."""
+        if mean <= 0:
+            return 0.0
+        if self.distribution == "lognormal":
+            sigma = self.jitter
+            return random.lognormvariate(math.log(mean) - sigma * sigma / 2, sigma)
+        if self.distribution == "exponential":
+            return random.expovariate(1 / mean)
+        return max(0.0, random.gauss(mean, self.jitter))
+
+
+def _reply(tokens):
+    """About `tokens` tokens of palm reading text (4 characters per token)."""
+    characters = tokens * 4
+    return (REPLY_SENTENCE * (characters // len(REPLY_SENTENCE) + 1))[:characters]
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    faults = Faults()
+    stats = None
+    stats_lock = None
+    budget = None # [tokens left, last refill] for --tpm-limit
+
+    def _over_tpm_limit(self, tokens):
+        """Continuously refilled per-minute token bucket, like OpenAI's own limit."""
+        limit = self.faults.tpm_limit
+        if not limit:
+            return False
+        with self.stats_lock:
+            now = time.monotonic()
+            level = min(limit, self.budget[0] + (now - self.budget[1]) * limit / 60)
+            self.budget[1] = now
+            if level < tokens:
+                self.budget[0] = level
+                return True
+            self.budget[0] = level - tokens
+            return False
+
+    def log_message(self, format, *args):
+        pass # Keep benchmark output readable
+
+    def _send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _count(self, outcome):
+        with self.stats_lock:
+            self.stats[outcome] = self.stats.get(outcome, 0) + 1
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            with self.stats_lock:
+                self._send_json(200, dict(self.stats))
+            return
+        self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_POST(self):
+        try:
+            path = self.path.split("?", 1)[0].rstrip("/")
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if path.endswith("/chat/completions"):
+                self._answer(request)
+            elif path == "/v1/orders":
+                self._create_order(request)
+            else:
+                self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+        except (BrokenPipeError, ConnectionResetError):
+            pass # The client gave up (timeout or a hedged duplicate won)
+
+    def _create_order(self, request):
+        """Razorpay POST /v1/orders: echoes the order back as created."""
+        time.sleep(self.faults.draw_latency(self.faults.razorpay_latency))
+        self._count("order")
+        amount = int(request.get("amount", 0))
+        self._send_json(200, {"id": f"order_{uuid.uuid4().hex[:14]}", "entity": "order", "amount": amount,
+                              "amount_paid": 0, "amount_due": amount, "currency": request.get("currency", "INR"),
+                              "receipt": request.get("receipt"), "status": "created", "attempts": 0,
+                              "notes": [], "created_at": int(time.time())})
+
+    def _answer(self, request):
+        faults = self.faults
+
+        # Roughly what OpenAI counts: text at 4 characters per token, a flat rate per image
+        messages_json = json.dumps(request.get("messages", []))
+        prompt_tokens = len(DATA_URL.sub('""', messages_json)) // 4 + IMAGE_TOKENS * len(DATA_URL.findall(messages_json))
+        estimated_tokens = prompt_tokens + request.get("max_tokens", 0)
+        roll = random.random()
+        if roll < faults.rate_limit_rate or self._over_tpm_limit(estimated_tokens):
+            self._count("429")
+            self._send_json(429, {"error": {"message": "Rate limit reached (fake)", "type": "requests"}},
+                            {"Retry-After": str(faults.retry_after)})
+            return
+        if roll < faults.rate_limit_rate + faults.error_rate:
+            self._count("500")
+            self._send_json(500, {"error": {"message": "The server had an error (fake)", "type": "server_error"}})
+            return
+
+        completion_tokens = min(faults.completion_tokens, request.get("max_tokens") or faults.completion_tokens)
+        slow = random.random() < faults.tail_rate
+        latency = faults.model_latency.get(request.get("model"), faults.latency)
+        time.sleep((faults.tail_latency if slow else faults.draw_latency(latency)) + completion_tokens * faults.token_latency)
+        self._count("slow" if slow else "ok")
+
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens, "prompt_tokens_details": {"cached_tokens": 0}}
+        content = _reply(completion_tokens)
+        if (request.get("response_format") or {}).get("type") == "json_object":
+            content = json.dumps({"readings": {}}) # The app falls back to per-hand calls for missing readings
+        base = {"id": "chatcmpl-fake", "created": int(time.time()), "model": request.get("model", "gpt-4o")}
+
+        if not request.get("stream"):
+            self._send_json(200, {**base, "object": "chat.completion", "usage": usage, "choices": [
+                {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}]})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        words = content.split(" ")
+        for i in range(0, len(words), 8):
+            chunk = {**base, "object": "chat.completion.chunk", "choices": [
+                {"index": 0, "finish_reason": None, "delta": {"content": " ".join(words[i:i + 8]) + " "}}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(0.01)
+        self.wfile.write(f"data: {json.dumps({**base, 'object': 'chat.completion.chunk', 'choices': [], 'usage': usage})}\n\n".encode("utf-8"))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+
+def start_fake_openai(port=0, faults=None):
+    """
+    Starts the fake server on a daemon thread. Returns (server, base_url, stats) where stats
+    counts the answers given ('ok', 'slow', '429', '500', 'order'); server.shutdown() stops it.
+    base_url is the OpenAI one; Razorpay's is the same without the /v1 suffix.
+    """
+    handler = type("Handler", (FakeOpenAIHandler,), {
+        "faults": faults or Faults(), "stats": {}, "stats_lock": threading.Lock(),
+        "budget": [(faults or Faults()).tpm_limit, time.monotonic()]})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-openai", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1", handler.stats
+
+
+def add_fault_arguments(parser):
+    defaults = Faults()
+    parser.add_argument("--latency", type=float, default=defaults.latency, help="Mean response time in seconds")
+    parser.add_argument("--jitter", type=float, default=defaults.jitter)
+    parser.add_argument("--tail-rate", type=float, default=defaults.tail_rate)
+    parser.add_argument("--tail-latency", type=float, default=defaults.tail_latency)
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate)
+    parser.add_argument("--rate-limit-rate", type=float, default=defaults.rate_limit_rate)
+    parser.add_argument("--retry-after", type=float, default=defaults.retry_after)
+    parser.add_argument("--tpm-limit", type=int, default=defaults.tpm_limit)
+    parser.add_argument("--model-latency", action="append", default=[], metavar="MODEL=SECONDS")
+    parser.add_argument("--distribution", choices=DISTRIBUTIONS, default=defaults.distribution)
+    parser.add_argument("--token-latency", type=float, default=defaults.token_latency)
+    parser.add_argument("--completion-tokens", type=int, default=defaults.completion_tokens)
+    parser.add_argument("--razorpay-latency", type=float, default=defaults.razorpay_latency)
+
+
+def faults_from_args(args):
+    return Faults(latency=args.latency, jitter=args.jitter, tail_rate=args.tail_rate, tail_latency=args.tail_latency,
+                  error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after,
+                  tpm_limit=args.tpm_limit,
+                  model_latency={model: float(seconds) for model, seconds in (item.split("=", 1) for item in args.model_latency)},
+                  distribution=args.distribution, token_latency=args.token_latency,
+                  completion_tokens=args.completion_tokens, razorpay_latency=args.razorpay_latency)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8081)
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    server, base_url, _ = start_fake_openai(args.port, faults_from_args(args))
+    print(f"Fake OpenAI listening on {base_url}, Razorpay on {base_url[:-len('/v1')]} (Ctrl+C to stop)", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,333 @@
+"""
+Load generator for the paid report flow: POST /api/create-order -> POST /api/generate-report ->
+GET /api/download-report, driven against the app under Gunicorn (main.py) or uvicorn (asgi.py,
+--server uvicorn) with the fake OpenAI and Razorpay server (benchmarks/fake_openai.py) in place
+of the real APIs, so it costs nothing.
+
+Starts the fake server and the app server as subprocesses, runs `--concurrency` closed-loop users for
+`--duration` seconds and reports p50/p95/p99 latency per step and for the whole flow, reports/min,
+and the peak RSS and CPU use of every server worker (with its PDF render processes). RSS and
+CPU are read from /proc, so those columns need Linux.
+
+App settings are taken from the environment, so a scaling change can be compared run against run:
+  REPORT_OUTPUT_MODE=memory PDF_RENDER_WORKERS=2 python benchmarks/loadgen.py --workers 2
+
+The AI section cache is off unless AI_CACHE_BACKEND is set. Fake server options (--latency,
+--distribution, --token-latency, --completion-tokens, ...) are passed through to it.
+
+Run from backend/:  python benchmarks/loadgen.py --workers 2 --threads 4 --concurrency 8 --duration 60
+               python benchmarks/loadgen.py --server uvicorn --workers 1 --concurrency 200 --duration 60
+"""
+import io
+import os
+import sys
+import json
+import time
+import shlex
+import base64
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+
+from PIL import Image
+from fake_openai import add_fault_arguments
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STEPS = ("create-order", "generate-report", "download", "flow")
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for(url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=2):
+                return
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+def _percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))] if samples else float("nan")
+
+
+def _sample_palm_image():
+    buffer = io.BytesIO()
+    Image.new("RGB", (3024, 4032), (214, 170, 150)).save(buffer, format="JPEG", quality=90) # Phone-sized photo
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def _report_payload(report_type, palm_image, order_id, index):
+    """A /api/generate-report body; names are unique per report so nothing repeats a previous prompt."""
+    payment = {"razorpay_order_id": order_id, "razorpay_payment_id": f"pay_load{index}", "razorpay_signature": "fake"}
+    person1 = {"name": f"Arjun Sharma {index}", "dob": "1990-05-15", "gender": "male"}
+    if report_type == "individual":
+        return {"report_type": "individual", "language": "en", **payment, "personal_details": person1,
+                "left_palm_image_base64": palm_image, "right_palm_image_base64": palm_image}
+    return {"report_type": "couple", "language": "en", **payment,
+            "person1_details": person1, "person2_details": {"name": f"Priya Verma {index}", "dob": "1991-03-22", "gender": "female"},
+            "person1_left_palm_image_base64": palm_image, "person1_right_palm_image_base64": palm_image,
+            "person2_left_palm_image_base64": palm_image, "person2_right_palm_image_base64": palm_image}
+
+
+def _request(method, url, body=None, timeout=600):
+    """Sends one request and returns (status, body bytes)."""
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    request = urllib.request.Request(url, data=data, method=method, headers={"Content-Type": "application/json"} if data else {})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+class LoadRun:
+    """Closed-loop users: each runs the paid report flow back to back until the run ends."""
+
+    def __init__(self, app_url, report_type, palm_image):
+        self.app_url = app_url
+        self.report_type = report_type
+        self.palm_image = palm_image
+        self.latencies = {step: [] for step in STEPS}
+        self.errors = {}
+        self.completed = 0
+        self._index = 0
+        self._lock = threading.Lock()
+
+    def _fail(self, step, status):
+        with self._lock:
+            key = f"{step} {status}"
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+    def _step(self, step, method, path_or_url, body=None):
+        started = time.perf_counter()
+        try:
+            status, content = _request(method, path_or_url if "://" in path_or_url else self.app_url + path_or_url, body)
+        except (urllib.error.URLError, ConnectionError, TimeoutError) as e:
+            self._fail(step, type(e).__name__)
+            return None
+        if status != 200:
+            self._fail(step, status)
+            return None
+        with self._lock:
+            self.latencies[step].append(time.perf_counter() - started)
+        return content
+
+    def one_flow(self):
+        with self._lock:
+            self._index += 1
+            index = self._index
+        started = time.perf_counter()
+        order = self._step("create-order", "POST", "/api/create-order", {"amount": 499})
+        if order is None:
+            return
+        order_id = json.loads(order)["order_id"]
+        report = self._step("generate-report", "POST", "/api/generate-report",
+                            _report_payload(self.report_type, self.palm_image, order_id, index))
+        if report is None:
+            return
+        if self._step("download", "GET", json.loads(report)["download_url"]) is None:
+            return
+        with self._lock:
+            self.latencies["flow"].append(time.perf_counter() - started)
+            self.completed += 1
+
+    def user(self, stop_at):
+        while time.monotonic() < stop_at:
+            self.one_flow()
+
+
+# --- Process sampling (/proc) ---
+
+def _children(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def _descendants(pid):
+    found = []
+    for child in _children(pid):
+        found += [child] + _descendants(child)
+    return found
+
+
+def _rss_and_cpu(pid):
+    """(RSS bytes, CPU seconds used so far) of one process, or None once it has exited."""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return rss, (int(fields[11]) + int(fields[12])) / CLOCK_TICKS # utime + stime
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+class ProcessSampler:
+    """
+    Samples every server worker and its child processes (render pool) once a second.
+    With `single_process` the server process is the only worker (uvicorn with one worker).
+    """
+
+    def __init__(self, master_pid, single_process=False):
+        self.master_pid = master_pid
+        self.single_process = single_process
+        self.workers = {} # worker pid -> {"rss": peak worker RSS, "children_rss": peak summed child RSS, "cpu": {pid: seconds}}
+        self._cpu_at_start = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampler", daemon=True)
+
+    def start(self):
+        for pid in [self.master_pid] + _descendants(self.master_pid):
+            sample = _rss_and_cpu(pid)
+            if sample:
+                self._cpu_at_start[pid] = sample[1]
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+
+    def _run(self):
+        while not self._stop.wait(1.0):
+            self.sample()
+
+    def sample(self):
+        for worker in [self.master_pid] if self.single_process else _children(self.master_pid):
+            stats = self.workers.setdefault(worker, {"rss": 0, "children_rss": 0, "cpu": {}})
+            children_rss = 0
+            for pid in [worker] + _descendants(worker):
+                sample = _rss_and_cpu(pid)
+                if sample is None:
+                    continue
+                rss, cpu = sample
+                stats["cpu"][pid] = cpu - self._cpu_at_start.get(pid, 0.0)
+                if pid == worker:
+                    stats["rss"] = max(stats["rss"], rss)
+                else:
+                    children_rss += rss
+            stats["children_rss"] = max(stats["children_rss"], children_rss)
+
+
+def _fake_server_command(args, port):
+    command = [sys.executable, os.path.join(BACKEND_DIR, "benchmarks", "fake_openai.py"), "--port", str(port),
+               "--latency", str(args.latency), "--jitter", str(args.jitter), "--distribution", args.distribution,
+               "--tail-rate", str(args.tail_rate), "--tail-latency", str(args.tail_latency),
+               "--error-rate", str(args.error_rate), "--rate-limit-rate", str(args.rate_limit_rate),
+               "--retry-after", str(args.retry_after), "--tpm-limit", str(args.tpm_limit),
+               "--token-latency", str(args.token_latency), "--completion-tokens", str(args.completion_tokens),
+               "--razorpay-latency", str(args.razorpay_latency)]
+    for item in args.model_latency:
+        command += ["--model-latency", item]
+    return command
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", choices=("gunicorn", "uvicorn"), default="gunicorn",
+                        help="gunicorn runs main:app (WSGI), uvicorn runs asgi:app")
+    parser.add_argument("--workers", type=int, default=2, help="Server worker processes")
+    parser.add_argument("--threads", type=int, default=4, help="Gunicorn threads per worker")
+    parser.add_argument("--server-args", default="", help="Extra server arguments, e.g. \"--worker-class gthread\"")
+    parser.add_argument("--concurrency", type=int, default=8, help="Simultaneous users")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds of load after the warm-up")
+    parser.add_argument("--warmup", type=int, default=1, help="Flows per user before measuring")
+    parser.add_argument("--report-type", choices=("individual", "couple"), default="individual")
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    fake_port, app_port = _free_port(), _free_port()
+    fake_url, app_url = f"http://127.0.0.1:{fake_port}", f"http://127.0.0.1:{app_port}"
+    workdir = tempfile.mkdtemp(prefix="loadgen-")
+    env = {**os.environ, "OPENAI_BASE_URL": f"{fake_url}/v1", "OPENAI_API_KEY": "sk-fake",
+           "RAZORPAY_BASE_URL": fake_url, "RAZORPAY_KEY_ID": "rzp_test_fake", "RAZORPAY_KEY_SECRET": "fake",
+           "AI_CACHE_BACKEND": os.environ.get("AI_CACHE_BACKEND", "off"),
+           # Keep the run's SQLite files out of backend/
+           "OPENAI_RATE_LIMIT_PATH": os.path.join(workdir, "openai_rate_limit.sqlite3"),
+           "REPORT_STORE_DB_PATH": os.path.join(workdir, "report_store.sqlite3"),
+           "REPORT_JOB_DB_PATH": os.path.join(workdir, "report_jobs.sqlite3")}
+
+    processes = []
+    try:
+        processes.append(subprocess.Popen(_fake_server_command(args, fake_port), stdout=subprocess.DEVNULL))
+        _wait_for(f"{fake_url}/stats", 30)
+        server_log = open(os.path.join(workdir, f"{args.server}.log"), "w")
+        if args.server == "gunicorn":
+            command = [sys.executable, "-m", "gunicorn", "--chdir", BACKEND_DIR, "--bind", f"127.0.0.1:{app_port}",
+                       "--workers", str(args.workers), "--threads", str(args.threads), "--timeout", "600",
+                       *shlex.split(args.server_args), "main:app"]
+            description = f"{args.workers} workers x {args.threads} threads"
+        else:
+            command = [sys.executable, "-m", "uvicorn", "--app-dir", BACKEND_DIR, "--host", "127.0.0.1", "--port", str(app_port),
+                       "--workers", str(args.workers), "--no-access-log", *shlex.split(args.server_args), "asgi:app"]
+            description = f"{args.workers} workers"
+        server = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=server_log, stderr=subprocess.STDOUT)
+        processes.append(server)
+        _wait_for(f"{app_url}/health", 120)
+        print(f"{args.server}: {description} at {app_url} (log: {server_log.name})")
+        print(f"Fake OpenAI/Razorpay at {fake_url}: latency {args.latency}s {args.distribution}, "
+              f"{args.completion_tokens} completion tokens at {args.token_latency}s/token")
+
+        run = LoadRun(app_url, args.report_type, _sample_palm_image())
+        warmup = [threading.Thread(target=lambda: [run.one_flow() for _ in range(args.warmup)]) for _ in range(args.concurrency)]
+        for thread in warmup:
+            thread.start()
+        for thread in warmup:
+            thread.join()
+        run.latencies, run.errors, run.completed = {step: [] for step in STEPS}, {}, 0
+
+        print(f"{args.concurrency} users x {args.report_type} reports for {args.duration:.0f}s ...")
+        sampler = ProcessSampler(server.pid, single_process=args.server == "uvicorn" and args.workers == 1)
+        sampler.start()
+        started = time.monotonic()
+        users = [threading.Thread(target=run.user, args=(started + args.duration,)) for _ in range(args.concurrency)]
+        for thread in users:
+            thread.start()
+        for thread in users:
+            thread.join()
+        elapsed = time.monotonic() - started
+        sampler.stop()
+
+        print(f"\n{'step':<16} {'count':>6} {'p50':>8} {'p95':>8} {'p99':>8}")
+        for step in STEPS:
+            samples = run.latencies[step]
+            print(f"{step:<16} {len(samples):6d} {_percentile(samples, 0.50):7.2f}s {_percentile(samples, 0.95):7.2f}s "
+                  f"{_percentile(samples, 0.99):7.2f}s")
+        print(f"\nreports/min {run.completed / elapsed * 60:.1f}  ({run.completed} in {elapsed:.0f}s)  errors {run.errors or 'none'}")
+
+        total_cpu = 0.0
+        print(f"\n{'worker pid':<11} {'peak RSS':>10} {'render RSS':>11} {'CPU':>7}")
+        for worker, stats in sorted(sampler.workers.items()):
+            cpu = sum(stats["cpu"].values())
+            total_cpu += cpu
+            print(f"{worker:<11} {stats['rss'] / 2 ** 20:8.0f}MB {stats['children_rss'] / 2 ** 20:9.0f}MB "
+                  f"{cpu / elapsed:6.0%}")
+        print(f"all workers: {total_cpu / elapsed:.0%} CPU ({total_cpu / elapsed / (os.cpu_count() or 1):.0%} of {os.cpu_count()} cores)")
+        print(f"fake server answers: {json.loads(_request('GET', f'{fake_url}/stats')[1])}")
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Throughput of the scalar numerology functions versus the vectorized batch engine
+(utils/numerology_batch.py), on synthetic CRM-like rows. Also checks that both agree on
+every row, including master numbers and the irregular inputs that take the fallback path,
+and that the table-driven scalar paths match the original digit-by-digit algorithms.
+
+Run from backend/:  python benchmarks/numerology_bench.py [--rows 200000]
+"""
+import os
+import sys
+import time
+import random
+import string
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from utils.numerology import (calculate_life_path, calculate_destiny_number, transliterate_name, reduce_number,
+                              _reduce_by_digits, NUMEROLOGY_MAP, MASTER_NUMBERS)
+from utils.numerology_batch import batch_life_path, batch_destiny, INVALID
+
+FIRST_NAMES = ["Aisha", "Arjun", "Priya", "Rahul", "Sofia", "Mateo", "Ananya", "Vikram", "Lucia", "Kabir"]
+LAST_NAMES = ["Khan", "Sharma", "Verma", "Patel", "Garcia", "Lopez", "Iyer", "Nair", "O'Brien", "Smith-Jones"]
+# Rows that exercise the scalar fallback and edge cases (invalid dates, non-ASCII names, empty names)
+IRREGULAR_DOBS = ["1990-13-15", "1990/05/15", "", "1990-05", " 1990-05-15", "+1990-05-15", "١٩٩٠-٠٥-١٥", "abc"]
+IRREGULAR_NAMES = ["José Ñúñez", "Straße", "", "123Test", "Zoë", "  ", "प्रिया"]
+
+
+def make_rows(count, seed=7):
+    rng = random.Random(seed)
+    dobs, names = [], []
+    for i in range(count):
+        if i % 100 == 0:
+            dobs.append(rng.choice(IRREGULAR_DOBS))
+            names.append(rng.choice(IRREGULAR_NAMES))
+        else:
+            dobs.append(f"{rng.randint(1940, 2010)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}")
+            names.append(f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}")
+    return dobs, names
+
+
+def _reference_destiny(full_name):
+    """calculate_destiny_number as it was before the lookup tables (non-ASCII letters score 0)."""
+    clean_name = "".join(filter(str.isalpha, full_name)).upper()
+    return _reduce_by_digits(sum(NUMEROLOGY_MAP.get(char, 0) for char in clean_name))
+
+
+def check_scalar_tables(iterations=50000, seed=0):
+    """Randomized equivalence and property checks of reduce_number and destiny scoring."""
+    rng = random.Random(seed)
+    alphabet = string.printable + "ÁÉÍÓÚáéíóúÑñßÇçÖöÜüıİ ﬁदेवनागरी"
+    for _ in range(iterations):
+        number = rng.choice([rng.randint(0, 99), rng.randint(0, 9999), rng.randint(0, 10 ** 12)])
+        reduced = reduce_number(number)
+        assert reduced == _reduce_by_digits(number), number
+        assert reduced <= 9 or reduced in MASTER_NUMBERS, number
+        name = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+        assert calculate_destiny_number(name, transliterate=False) == _reference_destiny(name), name
+        # Transliteration only changes how non-ASCII letters score, and is idempotent
+        transliterated = transliterate_name(name)
+        assert transliterated.isascii() and transliterate_name(transliterated) == transliterated, name
+        assert calculate_destiny_number(name) == _reference_destiny(transliterated), name
+        if name.isascii():
+            assert calculate_destiny_number(name) == calculate_destiny_number(name, transliterate=False), name
+    assert all(reduce_number(n) in MASTER_NUMBERS for n in (11, 22, 33, 29, 38, 499, 2929))
+    assert calculate_destiny_number("José Straße") == calculate_destiny_number("Jose Strasse")
+    print(f"Table-driven reduce_number and destiny scoring match the reference on {iterations} random inputs.")
+
+
+def scalar(dobs, names):
+    life_paths = [calculate_life_path(dob) for dob in dobs]
+    destinies = [calculate_destiny_number(name) for name in names]
+    return life_paths, destinies
+
+
+def batch(dobs, names):
+    return batch_life_path(dobs), batch_destiny(names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200000)
+    args = parser.parse_args()
+
+    check_scalar_tables()
+    dobs, names = make_rows(args.rows)
+    results = {}
+    for label, run in (("scalar", scalar), ("numpy", batch)):
+        started = time.perf_counter()
+        results[label] = run(dobs, names)
+        elapsed = time.perf_counter() - started
+        print(f"{label:<7} {elapsed:7.3f} s  {args.rows / elapsed:12,.0f} rows/sec")
+
+    life_paths, destinies = results["scalar"]
+    expected_life_paths = np.array([INVALID if lp is None else lp for lp in life_paths])
+    assert np.array_equal(expected_life_paths, results["numpy"][0]), "Life Path numbers differ"
+    assert np.array_equal(np.array(destinies), results["numpy"][1]), "Destiny numbers differ"
+
+    # Every master number must come through unreduced
+    masters = {int(n) for n in np.concatenate(results["numpy"]) if n in (11, 22, 33)}
+    print(f"Results identical on all {args.rows} rows (master numbers seen: {sorted(masters)}).")
+
+
+if __name__ == '__main__':
+    main()
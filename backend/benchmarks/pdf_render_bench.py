@@ -0,0 +1,105 @@
+"""
+Micro-benchmark for PDF rendering: per-render time of the old path (template compiled and
+stylesheet parsed on every call) versus the cached template environment and stylesheet, and
+the cached path with palm images as PalmImage handles served by the url_fetcher instead of
+base64 data: URLs inlined in the HTML.
+
+Run from backend/:  python benchmarks/pdf_render_bench.py [--iterations 5]
+"""
+import os
+import io
+import sys
+import time
+import base64
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jinja2 import Environment
+from PIL import Image
+from weasyprint import HTML, CSS
+from utils.numerology import get_numerology_insights
+from utils.images import PalmImage
+from utils.pdf import REPORT_CSS, REPORT_TEMPLATE, get_report_stylesheet, render_report_html, image_src, palm_url_fetcher
+
+LOREM = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. Sed do eiusmod tempor incididunt ut labore et dolore magna aliqua. "
+INDIVIDUAL_SECTIONS = ['introduction', 'numerology_detailed', 'left_palm_detailed', 'right_palm_detailed',
+                       'career_outlook', 'relationship_traits', 'year_by_year_forecast', 'conclusion']
+COUPLE_SECTIONS = ['introduction', 'person1_numerology', 'person1_left_palm', 'person1_right_palm',
+                   'person2_numerology', 'person2_left_palm', 'person2_right_palm', 'relationship_compatibility',
+                   'combined_path_purpose', 'challenges_growth', 'shared_future_outlook', 'conclusion_couple']
+
+
+def _sample_palm_image():
+    buffer = io.BytesIO()
+    Image.new("RGB", (1200, 1600), (214, 170, 150)).save(buffer, format="JPEG", quality=85)
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def _template_data(report_type, palm_image):
+    user = {"person1_name": "Arjun Sharma", "person1_dob": "1990-05-15", "person1_gender": "male",
+            "person2_name": "Priya Verma", "person2_dob": "1991-03-22", "person2_gender": "female"}
+    sections = INDIVIDUAL_SECTIONS if report_type == 'individual' else COUPLE_SECTIONS
+    return {
+        'user': user,
+        'numerology': get_numerology_insights(user['person1_dob'], user['person1_name']),
+        'report_content': {section: LOREM * 12 for section in sections},
+        'left_palm_image_base64': palm_image,
+        'right_palm_image_base64': palm_image,
+        'language': 'en',
+        'report_type': report_type,
+        'generated_date': "January 01, 2025",
+        'person2': user if report_type == 'couple' else None,
+        'numerology_p2': get_numerology_insights(user['person2_dob'], user['person2_name']) if report_type == 'couple' else None,
+        'person2_left_palm_image_base64': palm_image if report_type == 'couple' else None,
+        'person2_right_palm_image_base64': palm_image if report_type == 'couple' else None,
+    }
+
+
+def render_uncached(template_data):
+    """The pre-change path: compile the template and parse the CSS on every render."""
+    env = Environment(autoescape=True)
+    env.filters['image_src'] = image_src
+    html = env.from_string(REPORT_TEMPLATE).render(**template_data)
+    return HTML(string=html).write_pdf(stylesheets=[CSS(string=REPORT_CSS)])
+
+
+def render_cached(template_data):
+    """Precompiled template, shared stylesheet and font configuration."""
+    stylesheet, font_config = get_report_stylesheet()
+    url_fetcher = palm_url_fetcher([template_data['left_palm_image_base64'], template_data['person2_left_palm_image_base64']])
+    return HTML(string=render_report_html(template_data), url_fetcher=url_fetcher).write_pdf(
+        stylesheets=[stylesheet], font_config=font_config)
+
+
+def _time_renders(render, template_data, iterations):
+    render(template_data) # Warm-up (imports, first font lookup)
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        render(template_data)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=5)
+    args = parser.parse_args()
+
+    palm_image = _sample_palm_image()
+    palm_handle = PalmImage(base64.b64decode(palm_image))
+    for report_type in ('individual', 'couple'):
+        runs = (("uncached", render_uncached, palm_image), ("cached", render_cached, palm_image),
+                ("handles", render_cached, palm_handle))
+        for label, render, image in runs:
+            template_data = _template_data(report_type, image)
+            samples = _time_renders(render, template_data, args.iterations)
+            html_kb = len(render_report_html(template_data)) / 1024
+            print(f"{report_type:<10} {label:<8} mean {statistics.mean(samples) * 1000:8.1f} ms  "
+                  f"min {min(samples) * 1000:8.1f} ms  html {html_kb:7.1f} KB  ({args.iterations} renders)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Throughput under an account TPM limit, with and without the shared rate limiter (utils/rate_limit.py).
+Starts the fake OpenAI server with --tpm-limit and runs several worker processes (like Gunicorn
+workers) that each keep `--concurrency` section calls in flight for `--duration` seconds.
+
+Without the limiter the workers overshoot, collect 429s and back off independently; with it they
+share one SQLite token bucket and stay near the limit.
+
+Run from backend/:  python benchmarks/rate_limit_bench.py --workers 4 --tpm-limit 300000 --duration 30
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_openai import start_fake_openai, Faults
+
+MAX_TOKENS = 600
+
+
+def _worker(base_url, limiter_env, duration, concurrency):
+    """One worker process: closed-loop calls through call_openai_api until `duration` is up."""
+    os.environ.update({"OPENAI_BASE_URL": base_url, "OPENAI_API_KEY": "sk-fake", "AI_CACHE_BACKEND": "off",
+                       "OPENAI_BACKOFF_BASE": "0.5", "OPENAI_BREAKER_THRESHOLD": "1000000", **limiter_env})
+    from utils import gpt
+
+    async def run():
+        started = time.monotonic()
+        stop_at = started + duration
+        latencies, failures = [], 0
+
+        async def loop_calls(worker_slot):
+            nonlocal failures
+            i = 0
+            while time.monotonic() < stop_at:
+                i += 1
+                messages = [{"role": "user", "content": f"Worker {os.getpid()}/{worker_slot} section {i} " + "x" * 1600}]
+                call_started = time.monotonic()
+                try:
+                    await gpt.call_openai_api(messages, max_tokens=MAX_TOKENS)
+                    latencies.append(time.monotonic() - call_started)
+                except Exception:
+                    failures += 1
+
+        async with gpt.openai_session():
+            await asyncio.gather(*(loop_calls(slot) for slot in range(concurrency)))
+        return latencies, failures, time.monotonic() - started
+
+    return asyncio.run(run())
+
+
+def _run(label, limiter_env, args):
+    # A fresh server per run, so each starts with the account's full minute of budget
+    server, base_url, stats = start_fake_openai(faults=Faults(latency=args.latency, jitter=0.05, tpm_limit=args.tpm_limit, retry_after=1.0))
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(args.workers) as pool:
+        results = pool.starmap(_worker, [(base_url, limiter_env, args.duration, args.concurrency)] * args.workers)
+    server.shutdown()
+    elapsed = max(worker_elapsed for _, _, worker_elapsed in results)
+    latencies = sorted(latency for worker_latencies, _, _ in results for latency in worker_latencies)
+    failures = sum(worker_failures for _, worker_failures, _ in results)
+    p95 = latencies[int(0.95 * (len(latencies) - 1))] if latencies else float("nan")
+    print(f"{label:<11} {len(latencies) / elapsed * 60:7.0f} sections/min  failed {failures:4d}  "
+          f"p95 {p95:6.2f}s  server answers {dict(sorted(stats.items()))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--tpm-limit", type=int, default=300000)
+    parser.add_argument("--latency", type=float, default=0.3)
+    args = parser.parse_args()
+
+    tokens_per_call = (1600 + 120) // 4 + MAX_TOKENS # Matches the fake server's estimate of the prompt below
+    print(f"Fake OpenAI with TPM limit {args.tpm_limit} (about {args.tpm_limit / tokens_per_call:.0f} sections/min), "
+          f"{args.workers} workers x {args.concurrency} concurrent calls for {args.duration:.0f}s")
+
+    _run("no limiter", {"OPENAI_TPM_LIMIT": "0"}, args)
+    with tempfile.TemporaryDirectory() as tmp:
+        _run("shared TPM", {"OPENAI_TPM_LIMIT": str(args.tpm_limit), "OPENAI_RATE_LIMIT_BACKEND": "sqlite",
+                            "OPENAI_RATE_LIMIT_PATH": os.path.join(tmp, "rate_limit.sqlite3")}, args)
+
+
+if __name__ == '__main__':
+    main()
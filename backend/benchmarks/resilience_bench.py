@@ -0,0 +1,100 @@
+"""
+Fault-injection harness for the OpenAI resilience layer (utils/resilience.py). Starts the fake
+OpenAI server in-process, fires concurrent section calls through call_openai_api under three
+policies and reports success rate, latency percentiles, retries and hedged requests:
+
+  no-retry  one attempt, no hedging (roughly the behaviour before the resilience layer)
+  retry     deadlines, jittered backoff and Retry-After
+  hedged    retry plus a duplicate request after the p90 latency of the warm-up calls
+
+Run from backend/:  python benchmarks/resilience_bench.py --calls 200 --error-rate 0.05 --rate-limit-rate 0.05 --tail-rate 0.05
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["AI_CACHE_BACKEND"] = "off" # Every call must reach the (fake) API
+os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+
+from fake_openai import start_fake_openai, add_fault_arguments, faults_from_args
+
+
+def _percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))] if samples else float("nan")
+
+
+def _counter_total(counter):
+    with counter._lock:
+        return sum(counter._values.values())
+
+
+async def _run_calls(gpt, calls, concurrency):
+    slots = asyncio.Semaphore(concurrency)
+    latencies, failures = [], 0
+
+    async def one(i):
+        nonlocal failures
+        messages = [{"role": "user", "content": f"Section {i} at {time.time()}"}]
+        async with slots:
+            started = time.perf_counter()
+            try:
+                await gpt.call_openai_api(messages, max_tokens=600)
+                latencies.append(time.perf_counter() - started)
+            except Exception:
+                failures += 1
+
+    async with gpt.openai_session():
+        await asyncio.gather(*(one(i) for i in range(calls)))
+    return latencies, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--attempt-timeout", type=float, default=5.0)
+    parser.add_argument("--deadline", type=float, default=20.0)
+    add_fault_arguments(parser)
+    parser.set_defaults(error_rate=0.05, rate_limit_rate=0.05, tail_rate=0.05, tail_latency=4.0, retry_after=0.5)
+    args = parser.parse_args()
+
+    server, base_url, stats = start_fake_openai(faults=faults_from_args(args))
+    os.environ["OPENAI_BASE_URL"] = base_url
+    from utils import gpt, metrics, resilience
+
+    resilience.OPENAI_ATTEMPT_TIMEOUT = args.attempt_timeout
+    resilience.OPENAI_CALL_DEADLINE = args.deadline
+    resilience.OPENAI_BACKOFF_BASE = 0.2
+    # Faults are injected on purpose; the breaker would turn them into fast failures and muddy the comparison
+    resilience.openai_breaker.failure_threshold = 10 ** 9
+
+    policies = (("no-retry", 0, 0.0), ("retry", 4, 0.0), ("hedged", 4, 0.9))
+    print(f"Fake OpenAI at {base_url}: {args.calls} calls per policy, concurrency {args.concurrency}")
+    for label, max_retries, hedge_quantile in policies:
+        resilience.OPENAI_MAX_RETRIES = max_retries
+        resilience.OPENAI_HEDGE_QUANTILE = hedge_quantile
+        resilience.latency_tracker = resilience.LatencyTracker()
+        if hedge_quantile:
+            asyncio.run(_run_calls(gpt, resilience.OPENAI_HEDGE_MIN_SAMPLES * 2, args.concurrency)) # Warm-up samples
+
+        retries_before, hedges_before = _counter_total(metrics.OPENAI_RETRIES), _counter_total(metrics.OPENAI_HEDGES)
+        stats.clear()
+        started = time.perf_counter()
+        latencies, failures = asyncio.run(_run_calls(gpt, args.calls, args.concurrency))
+        elapsed = time.perf_counter() - started
+        print(f"{label:<9} success {len(latencies) / args.calls:6.1%}  "
+              f"p50 {_percentile(latencies, 0.50):5.2f}s  p95 {_percentile(latencies, 0.95):5.2f}s  "
+              f"p99 {_percentile(latencies, 0.99):5.2f}s  mean {statistics.fmean(latencies) if latencies else 0:5.2f}s  "
+              f"retries {_counter_total(metrics.OPENAI_RETRIES) - retries_before:4.0f}  "
+              f"hedges {_counter_total(metrics.OPENAI_HEDGES) - hedges_before:4.0f}  "
+              f"wall {elapsed:5.1f}s  server answers {dict(sorted(stats.items()))}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
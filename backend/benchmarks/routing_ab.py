@@ -0,0 +1,104 @@
+"""
+A/B harness for model routing profiles (utils/data/model_routing.json): generates the same
+reports under each profile and compares report latency, tokens per model and estimated cost.
+
+By default it runs against the local fake OpenAI server, where GPT-4o mini answers faster
+(--model-latency); --live uses the real API with OPENAI_API_KEY and costs money.
+
+Run from backend/:  python benchmarks/routing_ab.py --profiles gpt-4o tiered economy --reports 3
+"""
+import io
+import os
+import sys
+import base64
+import asyncio
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["AI_CACHE_BACKEND"] = "off" # Each profile must really call the models
+
+from PIL import Image
+from fake_openai import start_fake_openai, Faults
+
+
+def _sample_palm_image():
+    buffer = io.BytesIO()
+    Image.new("RGB", (768, 1024), (214, 170, 150)).save(buffer, format="JPEG", quality=80)
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def _report_args(report_type, palm_image, index):
+    from utils.numerology import get_numerology_insights
+    person1 = {"person1_name": f"Arjun Sharma {index}", "person1_dob": "1990-05-15", "person1_gender": "male"}
+    person2 = {"person2_name": f"Priya Verma {index}", "person2_dob": "1991-03-22", "person2_gender": "female"}
+    couple = report_type == 'couple'
+    return dict(
+        user_details=person1,
+        numerology_data=get_numerology_insights(person1["person1_dob"], person1["person1_name"]),
+        left_palm_image_base64=palm_image, right_palm_image_base64=palm_image,
+        language='en', report_type=report_type,
+        person2_details=person2 if couple else None,
+        numerology_data_p2=get_numerology_insights(person2["person2_dob"], person2["person2_name"]) if couple else None,
+        person2_left_palm_image_base64=palm_image if couple else None,
+        person2_right_palm_image_base64=palm_image if couple else None,
+    )
+
+
+async def _run_profile(gpt, report_types, reports, palm_image):
+    totals, usages = [], []
+    async with gpt.openai_session():
+        for index in range(reports):
+            for report_type in report_types:
+                timings, token_usage = {}, {}
+                await gpt.generate_full_report_content(**_report_args(report_type, palm_image, index),
+                                                       timings=timings, token_usage=token_usage)
+                totals.append(timings['total'])
+                usages.append(token_usage)
+    return totals, usages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", nargs="+", default=["gpt-4o", "tiered", "economy"])
+    parser.add_argument("--reports", type=int, default=3, help="Reports per report type and profile")
+    parser.add_argument("--report-types", nargs="+", default=["individual", "couple"])
+    parser.add_argument("--live", action="store_true", help="Use the real OpenAI API instead of the fake server")
+    parser.add_argument("--model-latency", action="append", default=["gpt-4o=2.0", "gpt-4o-mini=0.8"], metavar="MODEL=SECONDS",
+                        help="Fake server mean latency per model")
+    args = parser.parse_args()
+
+    server = None
+    if not args.live:
+        model_latency = {model: float(seconds) for model, seconds in (item.split("=", 1) for item in args.model_latency)}
+        server, base_url, _ = start_fake_openai(faults=Faults(jitter=0.2, model_latency=model_latency))
+        os.environ["OPENAI_BASE_URL"] = base_url
+        os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+        print(f"Fake OpenAI at {base_url}, mean latency {model_latency}")
+    from utils import gpt, metrics, model_routing
+
+    palm_image = _sample_palm_image()
+    print(f"{args.reports} x {'/'.join(args.report_types)} reports per profile")
+    for profile in args.profiles:
+        model_routing.model_router = model_routing.create_router(profile)
+        totals, usages = asyncio.run(_run_profile(gpt, args.report_types, args.reports, palm_image))
+
+        by_model = {}
+        cost = 0.0
+        for token_usage in usages:
+            for counts in token_usage.values():
+                model_totals = by_model.setdefault(counts["model"], {"prompt": 0, "completion": 0})
+                model_totals["prompt"] += counts["prompt_tokens"]
+                model_totals["completion"] += counts["completion_tokens"]
+                cost += metrics.estimate_cost(counts["model"], counts) or 0.0
+        tokens = ", ".join(f"{model} {t['prompt'] / len(usages):,.0f}+{t['completion'] / len(usages):,.0f}"
+                           for model, t in sorted(by_model.items()))
+        print(f"{model_routing.model_router.profile_name:<8} report p50 {statistics.median(totals):6.2f}s  "
+              f"max {max(totals):6.2f}s  tokens/report (prompt+completion) {tokens}  "
+              f"est. ${cost / len(usages):.4f}/report")
+    if server is not None:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,35 +1,35 @@
 import os
-import datetime
+import multiprocessing
 import base64 # Needed for image handling (though images are passed as base64 from frontend)
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response
 from flask_cors import CORS
-import razorpay
-from razorpay.errors import BadRequestError, ServerError
+from werkzeug.exceptions import RequestEntityTooLarge
 
 # Import our utility functions
-from utils.numerology import get_numerology_insights
-from utils.gpt import generate_full_report_content
-from utils.pdf import generate_pdf_report
+from utils.report import (parse_report_request, run_report_pipeline, iter_report_events, iter_duplicate_report_events,
+                          format_sse_event, ReportRequestError)
+from utils.jobs import ReportJobQueue, JobQueueFullError
+from utils.uploads import save_palm_upload, UploadTooLargeError, PALM_UPLOAD_MAX_BYTES, REQUEST_MAX_BYTES
+from utils.images import InvalidImageError
+from utils.render_pool import start_render_pool, render_queue_depth, RenderQueueFullError
+from utils.report_store import report_store, start_report_janitor
+from utils.payments import create_payment_order, handle_webhook_event, verify_payment
+from utils.idempotency import (report_idempotency, report_idempotency_key, duplicate_report_response, job_accepted_response,
+                               follow_report, RUNNING, REPORT_DUPLICATE_WAIT)
+from utils import metrics
 
 # Load environment variables from .env file
 load_dotenv()
 
 app = Flask(__name__)
 CORS(app) # Enable CORS for all routes
+# Werkzeug refuses bodies past this with 413, including chunked ones that send no Content-Length
+app.config['MAX_CONTENT_LENGTH'] = REQUEST_MAX_BYTES
 
 # --- Configuration (loaded from .env) ---
-RAZORPAY_KEY_ID = os.getenv("RAZORPAY_KEY_ID")
-RAZORPAY_KEY_SECRET = os.getenv("RAZORPAY_KEY_SECRET")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY") # Picked up automatically by OpenAI client
 
-# Initialize Razorpay client
-if RAZORPAY_KEY_ID and RAZORPAY_KEY_SECRET:
-    razorpay_client = razorpay.Client(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET))
-else:
-    razorpay_client = None
-    print("WARNING: Razorpay API keys are not loaded. Payment functionality will be disabled.")
-
 # Ensure essential keys are present
 if not OPENAI_API_KEY:
     print("CRITICAL ERROR: OPENAI_API_KEY is missing. AI functionality will not work.")
@@ -38,9 +38,28 @@ if not OPENAI_API_KEY:
 PDF_OUTPUT_DIR = "temp_reports"
 os.makedirs(PDF_OUTPUT_DIR, exist_ok=True) # Ensure it exists
 
+# Pre-fork the PDF render workers so the first report doesn't pay for WeasyPrint start-up.
+# Spawned render workers re-import this module when it is run as a script; they must not start pools of their own.
+if multiprocessing.parent_process() is None:
+    start_render_pool()
+
+# Evict reports that are never downloaded (in-memory store and orphaned files in temp_reports)
+start_report_janitor()
+
+# Background report generation (see /api/report-jobs)
+report_jobs = ReportJobQueue(run_report_pipeline, context=app.app_context)
+
+# Queue depths are read when /metrics is scraped
+metrics.RENDER_QUEUE_DEPTH.set_function(render_queue_depth)
+metrics.REPORT_JOBS_PENDING.set_function(lambda: report_jobs.pending)
+
 
 # --- Routes ---
 
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    return jsonify({"status": "error", "message": "Request body is too large."}), 413
+
 @app.route('/')
 def index():
     return "Backend is running. Please access the frontend at its own URL (aurapalm.in)."
@@ -49,185 +68,115 @@ def index():
 def health_check():
     return jsonify({"status": "healthy", "message": "Backend is up and running!"})
 
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """
+    Prometheus scrape endpoint. Metrics are kept per process: under gunicorn with several
+    workers each scrape sees one worker, so run a single worker per container (the
+    default) or scrape each worker separately.
+    """
+    return Response(metrics.render_metrics(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/create-order', methods=['POST'])
 def create_order():
-    if not razorpay_client:
-        return jsonify({"status": "error", "message": "Razorpay not configured."}), 500
+    body, status = create_payment_order(request.get_json())
+    return jsonify(body), status
 
-    data = request.get_json()
-    amount_in_inr = data.get('amount')
-    if not amount_in_inr:
-        return jsonify({"status": "error", "message": "Amount is required."}), 400
 
-    amount_in_paise = int(amount_in_inr * 100) # Razorpay expects amount in smallest currency unit (paise)
-
-    try:
-        receipt_id = f"rcpt_{datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')}"
-        order_details = razorpay_client.order.create({
-            "amount": amount_in_paise,
-            "currency": "INR",
-            "receipt": receipt_id,
-            "payment_capture": '1' # Auto capture payment
-        })
-        print(f"DEBUG: Razorpay order created: {order_details}")
+@app.route('/api/razorpay-webhook', methods=['POST'])
+def razorpay_webhook():
+    body, status = handle_webhook_event(request.get_json())
+    return jsonify(body), status
 
-        return jsonify({
-            "order_id": order_details['id'],
-            "amount": order_details['amount'],
-            "currency": order_details['currency'],
-            "key_id": RAZORPAY_KEY_ID # Send Key ID to frontend for checkout.js
-        })
-    except BadRequestError as e:
-        print(f"ERROR: Razorpay BadRequestError: {e}")
-        return jsonify({"status": "error", "message": f"Razorpay error: {e.description}"}), 400
-    except ServerError as e:
-        print(f"ERROR: Razorpay ServerError: {e}")
-        return jsonify({"status": "error", "message": "Razorpay service is temporarily unavailable."}), 503
-    except Exception as e:
-        print(f"ERROR: Failed to create order: {e}")
-        return jsonify({"status": "error", "message": "Failed to create payment order."}), 500
 
+@app.route('/api/palm-images', methods=['POST'])
+def upload_palm_image():
+    """
+    Accepts one palm photo as multipart/form-data (field 'image') and returns an id that
+    /api/generate-report and /api/report-jobs accept in place of the inline base64 image.
+    """
+    # Reject oversized bodies before Werkzeug starts parsing (small allowance for multipart headers)
+    if request.content_length and request.content_length > PALM_UPLOAD_MAX_BYTES + 64 * 1024:
+        return jsonify({"status": "error", "message": "Palm image is too large."}), 413
 
-@app.route('/api/razorpay-webhook', methods=['POST'])
-def razorpay_webhook():
-    # Placeholder for webhook. For robust production, verify signature.
-    # from razorpay.utils import verify_webhook_signature
-    # WEBHOOK_SECRET = os.getenv("RAZORPAY_WEBHOOK_SECRET")
-    # try:
-    #     verify_webhook_signature(request.data, request.headers.get('X-Razorpay-Signature'), WEBHOOK_SECRET)
-    # except Exception as e:
-    #     print(f"ERROR: Webhook signature verification failed: {e}")
-    #     return jsonify({"status": "error", "message": "Invalid webhook signature."}), 400
+    image_file = request.files.get('image')
+    if not image_file:
+        return jsonify({"status": "error", "message": "Missing image file."}), 400
 
-    payload = request.get_json()
-    event = payload.get('event')
-    print(f"DEBUG: Received Razorpay webhook event: {event}")
+    try:
+        image_id = save_palm_upload(image_file.stream)
+    except UploadTooLargeError as e:
+        return jsonify({"status": "error", "message": str(e)}), 413
+    except InvalidImageError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    finally:
+        image_file.close()
+
+    return jsonify({"status": "success", "image_id": image_id}), 201
+
+
+async def _duplicate_report(idempotency_key):
+    """
+    Waits for the report already claimed for this payment and answers with its outcome. If it
+    is still running after REPORT_DUPLICATE_WAIT, answers 202 with a job to poll instead of
+    holding the worker until the original finishes.
+    """
+    record = await report_idempotency.wait_async(idempotency_key, timeout=REPORT_DUPLICATE_WAIT)
+    if record is not None and record["status"] == RUNNING:
+        return _duplicate_job(idempotency_key, record)
+    body, status = duplicate_report_response(record)
+    return jsonify(body), status
+
+
+def _duplicate_job(idempotency_key, record):
+    """
+    The job already generating this payment's report. If a /api/generate-report request claimed
+    it instead, a job that follows that request, so the client still gets a status_url to poll.
+    """
+    if record["job_id"]:
+        body, status = job_accepted_response(record["job_id"], job_status=record["status"],
+                                             message="A report job was already submitted for this payment.")
+        return jsonify(body), status
+    try:
+        job_id = report_jobs.submit({"idempotency_key": idempotency_key}, pipeline=follow_report)
+    except JobQueueFullError as e:
+        return jsonify({"status": "error", "message": str(e)}), 503
+    body, status = job_accepted_response(job_id)
+    return jsonify(body), status
 
-    if event == 'payment.captured':
-        payment_id = payload['payload']['payment']['entity']['id']
-        order_id = payload['payload']['payment']['entity']['order_id']
-        amount = payload['payload']['payment']['entity']['amount']
-        print(f"INFO: Payment captured - Payment ID: {payment_id}, Order ID: {order_id}, Amount: {amount}")
 
-    return jsonify({"status": "success", "message": "Webhook received."}), 200
+def _event_stream(events):
+    response = Response((format_sse_event(event) for event in events), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no' # Stop nginx-style proxies from buffering the stream
+    return response
 
 
 @app.route('/api/generate-report', methods=['POST'])
 async def generate_report_api():
-    data = request.get_json()
-
-    # Determine report type and required fields
-    report_type = data.get('report_type')
-    if report_type not in ['individual', 'couple']:
-        return jsonify({"status": "error", "message": "Invalid report type specified."}), 400
-
-    required_fields_common = ['language', 'razorpay_payment_id', 'razorpay_order_id', 'razorpay_signature']
-    required_fields_individual = ['personal_details', 'left_palm_image_base64', 'right_palm_image_base64']
-    required_fields_couple = [
-        'person1_details', 'person1_left_palm_image_base64', 'person1_right_palm_image_base64',
-        'person2_details', 'person2_left_palm_image_base64', 'person2_right_palm_image_base64'
-    ]
-
-    # Validate common fields
-    for field in required_fields_common:
-        if field not in data or not data[field]:
-            return jsonify({"status": "error", "message": f"Missing common required data: {field}"}), 400
-
-    # Validate report-specific fields and prepare data structures
-    user_details = {}
-    person2_details = None
-    left_palm_image_base64 = None
-    right_palm_image_base64 = None
-    person2_left_palm_image_base64 = None
-    person2_right_palm_image_base64 = None
-
-    if report_type == 'individual':
-        for field in required_fields_individual:
-            if field not in data or not data[field]:
-                return jsonify({"status": "error", "message": f"Missing individual report data: {field}"}), 400
-        
-        user_details = data['personal_details'] # This is person1_details
-        user_details['person1_name'] = user_details.get('name') # Alias for consistency
-        user_details['person1_dob'] = user_details.get('dob')
-        user_details['person1_gender'] = user_details.get('gender')
-
-        left_palm_image_base64 = data['left_palm_image_base64']
-        right_palm_image_base64 = data['right_palm_image_base64']
-
-    elif report_type == 'couple':
-        for field in required_fields_couple:
-            if field not in data or not data[field]:
-                return jsonify({"status": "error", "message": f"Missing couple report data: {field}"}), 400
-        
-        # Person 1 details
-        user_details = data['person1_details']
-        user_details['person1_name'] = user_details.get('name') # Alias for consistency
-        user_details['person1_dob'] = user_details.get('dob')
-        user_details['person1_gender'] = user_details.get('gender')
-        left_palm_image_base64 = data['person1_left_palm_image_base64']
-        right_palm_image_base64 = data['person1_right_palm_image_base64']
-
-        # Person 2 details
-        person2_details = data['person2_details']
-        person2_details['person2_name'] = person2_details.get('name') # Alias for consistency
-        person2_details['person2_dob'] = person2_details.get('dob')
-        person2_details['person2_gender'] = person2_details.get('gender')
-        person2_left_palm_image_base64 = data['person2_left_palm_image_base64']
-        person2_right_palm_image_base64 = data['person2_right_palm_image_base64']
-
-    language = data['language']
-
-    # For a production app, you would VERIFY the Razorpay payment details here again
-    # using razorpay_client.utility.verify_payment_signature to prevent fraud.
-    # We are skipping for quick setup, relying on frontend callback and webhook for now.
-    # from razorpay.utils import verify_payment_signature
-    # params_dict = {
-    #     'razorpay_order_id': data['razorpay_order_id'],
-    #     'razorpay_payment_id': data['razorpay_payment_id'],
-    #     'razorpay_signature': data['razorpay_signature']
-    # }
-    # try:
-    #     razorpay_client.utility.verify_payment_signature(params_dict)
-    #     print("DEBUG: Razorpay signature verified successfully.")
-    # except Exception as e:
-    #     print(f"ERROR: Razorpay signature verification failed: {e}")
-    #     return jsonify({"status": "error", "message": "Payment verification failed."}), 400
+    data = request.get_json(cache=False) # Not kept on the request: inline images are freed once decoded
+    # The payment is checked first, as a resubmitted one is answered from the earlier request for it
+    payment_error = verify_payment(data) if data else None
+    if payment_error:
+        return jsonify({"status": "error", "message": payment_error}), 400
+
+    # A resubmitted payment gets the report already generating (or generated) for it, before its images are decoded
+    idempotency_key = report_idempotency_key(data)
+    if idempotency_key and report_idempotency.find(idempotency_key):
+        return await _duplicate_report(idempotency_key)
+
+    try:
+        report_args = parse_report_request(data)
+    except ReportRequestError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    if idempotency_key:
+        if report_idempotency.claim(idempotency_key):
+            return await _duplicate_report(idempotency_key) # Lost the race to a concurrent duplicate
+        report_args['idempotency_key'] = idempotency_key
 
     try:
-        # 1. Calculate Numerology Insights for Person 1
-        print(f"INFO: Calculating numerology for {user_details.get('person1_name')}...")
-        numerology_insights_p1 = get_numerology_insights(user_details['person1_dob'], user_details['person1_name'])
-
-        numerology_insights_p2 = None
-        if report_type == 'couple' and person2_details:
-            print(f"INFO: Calculating numerology for {person2_details.get('person2_name')}...")
-            numerology_insights_p2 = get_numerology_insights(person2_details['person2_dob'], person2_details['person2_name'])
-
-        # 2. Generate Report Content via OpenAI (multiple calls)
-        print("INFO: Generating AI report content...")
-        report_content_sections = await generate_full_report_content(
-            user_details, numerology_insights_p1,
-            left_palm_image_base64, right_palm_image_base64,
-            language, report_type,
-            person2_details, numerology_insights_p2,
-            person2_left_palm_image_base64, person2_right_palm_image_base64
-        )
-        print("INFO: AI report content generated.")
-
-        # 3. Generate PDF Report
-        print("INFO: Generating PDF report...")
-        pdf_path = generate_pdf_report(
-            user_details, numerology_insights_p1, report_content_sections,
-            left_palm_image_base64, right_palm_image_base64,
-            language, report_type,
-            person2_details, numerology_insights_p2,
-            person2_left_palm_image_base64, person2_right_palm_image_base64
-        )
-        print(f"INFO: PDF generated at {pdf_path}")
-
-        # Construct the download URL relative to the backend
-        download_filename = os.path.basename(pdf_path)
-        download_url = f"/api/download-report/{download_filename}"
+        download_url = await run_report_pipeline(**report_args)
 
         return jsonify({
             "status": "success",
@@ -235,27 +184,127 @@ async def generate_report_api():
             "download_url": download_url
         })
 
+    except RenderQueueFullError as e:
+        return jsonify({"status": "error", "message": str(e)}), 503
     except Exception as e:
-        print(f"ERROR: Error during report generation: {e}", exc_info=True) # exc_info for full traceback
+        print(f"ERROR: Error during report generation: {e}")
         return jsonify({"status": "error", "message": f"An error occurred during report generation: {str(e)}"}), 500
 
 
+@app.route('/api/generate-report/stream', methods=['POST'])
+def generate_report_stream():
+    """
+    Same payload as /api/generate-report, but answers with text/event-stream: report text is
+    streamed section by section ('sections', 'delta', 'section_done' events) as the model
+    writes it, followed by 'rendering' and a final 'done' event with the PDF download_url.
+    Failures after the stream has started arrive as an 'error' event. A resubmitted payment
+    gets keep-alives until the original report is done, then its 'done' event.
+    """
+    data = request.get_json(cache=False)
+    payment_error = verify_payment(data) if data else None
+    if payment_error:
+        return jsonify({"status": "error", "message": payment_error}), 400
+
+    idempotency_key = report_idempotency_key(data)
+    if idempotency_key and report_idempotency.find(idempotency_key):
+        return _event_stream(iter_duplicate_report_events(idempotency_key))
+
+    try:
+        report_args = parse_report_request(data)
+    except ReportRequestError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    if idempotency_key:
+        if report_idempotency.claim(idempotency_key):
+            return _event_stream(iter_duplicate_report_events(idempotency_key))
+        report_args['idempotency_key'] = idempotency_key
+
+    return _event_stream(iter_report_events(report_args))
+
+
+@app.route('/api/report-jobs', methods=['POST'])
+def submit_report_job():
+    """
+    Accepts the same payload as /api/generate-report but returns a job id immediately.
+    A resubmitted payment gets the id of the job already generating its report.
+    """
+    data = request.get_json(cache=False)
+    payment_error = verify_payment(data) if data else None
+    if payment_error:
+        return jsonify({"status": "error", "message": payment_error}), 400
+
+    idempotency_key = report_idempotency_key(data)
+    duplicate = report_idempotency.find(idempotency_key) if idempotency_key else None
+    if duplicate:
+        return _duplicate_job(idempotency_key, duplicate)
+
+    try:
+        report_args = parse_report_request(data)
+    except ReportRequestError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    if idempotency_key:
+        duplicate = report_idempotency.claim(idempotency_key)
+        if duplicate:
+            return _duplicate_job(idempotency_key, duplicate)
+        report_args['idempotency_key'] = idempotency_key
+
+    try:
+        job_id = report_jobs.submit(report_args)
+    except JobQueueFullError as e:
+        if idempotency_key:
+            report_idempotency.fail(idempotency_key, str(e))
+        return jsonify({"status": "error", "message": str(e)}), 503
+    if idempotency_key:
+        report_idempotency.attach_job(idempotency_key, job_id)
+
+    body, status = job_accepted_response(job_id)
+    return jsonify(body), status
+
+
+@app.route('/api/report-jobs/<job_id>', methods=['GET'])
+def report_job_status(job_id):
+    job = report_jobs.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Report job not found."}), 404
+
+    response = {"status": "success", "job_id": job_id, "job_status": job["status"]}
+    if job.get("result"):
+        response["download_url"] = job["result"].get("download_url")
+    if job.get("error"):
+        response["error"] = job["error"]
+    return jsonify(response)
+
+
 @app.route('/api/download-report/<filename>', methods=['GET'])
 def download_report(filename):
-    file_path = os.path.join(PDF_OUTPUT_DIR, filename)
+    # Reports rendered in memory are served straight from the store, with ETag and Range support
+    if report_store is not None:
+        report = report_store.get(filename)
+        if report is not None:
+            response = Response(report['data'], mimetype='application/pdf')
+            response.headers['Content-Disposition'] = f'attachment; filename="{report["filename"]}"'
+            response.set_etag(report['etag'])
+            response.last_modified = report['created_at']
+            response.cache_control.private = True
+            return response.make_conditional(request, accept_ranges=True, complete_length=report['size'])
+
+    file_path = os.path.join(PDF_OUTPUT_DIR, os.path.basename(filename))
     if not os.path.exists(file_path):
         print(f"ERROR: Download requested for non-existent file: {file_path}")
         return jsonify({"status": "error", "message": "Report file not found."}), 404
 
     try:
-        response = send_file(file_path, as_attachment=True, download_name=filename)
-        @response.call_on_close
-        def on_close():
-            try:
-                os.remove(file_path)
-                print(f"INFO: Deleted temporary report file: {file_path}")
-            except Exception as e:
-                print(f"ERROR: Failed to delete temporary file {file_path}: {e}")
+        response = send_file(file_path, as_attachment=True, download_name=filename, conditional=True, etag=True)
+        # Keep the file for resumed (Range) downloads; a full download claims it. Unclaimed files are left to the janitor.
+        if response.status_code == 200:
+            @response.call_on_close
+            def on_close():
+                try:
+                    os.remove(file_path)
+                    print(f"INFO: Deleted temporary report file: {file_path}")
+                except Exception as e:
+                    print(f"ERROR: Failed to delete temporary file {file_path}: {e}")
         return response
     except Exception as e:
         print(f"ERROR: Failed to serve or delete file {file_path}: {e}")
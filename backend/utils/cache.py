@@ -0,0 +1,322 @@
+import os
+import json
+import time
+import shelve
+import sqlite3
+import fnmatch
+import hashlib
+import threading
+from collections import OrderedDict
+
+# --- Cache Configuration ---
+AI_CACHE_BACKEND = os.getenv("AI_CACHE_BACKEND", "memory").lower() # 'memory', 'sqlite', 'shelve', 'redis' or 'off'
+AI_CACHE_TTL = float(os.getenv("AI_CACHE_TTL", str(7 * 24 * 3600))) # Seconds; 0 disables expiry
+AI_CACHE_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", "5000"))
+AI_CACHE_PATH = os.getenv("AI_CACHE_PATH") # Defaults per backend, see create_cache
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+def make_cache_key(model, messages, max_tokens, temperature, response_format=None):
+    """
+    Content-addressed key for a chat completion request. Image data URLs are part of
+    `messages`, so the hash covers the image bytes as well as the prompt text.
+    """
+    request = {"model": model, "messages": messages, "max_tokens": max_tokens, "temperature": temperature}
+    if response_format is not None:
+        request["response_format"] = response_format # Only when set, so existing keys stay valid
+    payload = json.dumps(request, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _CacheBackend:
+    """Shared hit/miss bookkeeping. Subclasses implement _get, _set and __len__."""
+
+    # Whether get/set may block on I/O (callers on an event loop run these in a thread)
+    blocking = True
+
+    def __init__(self, ttl=AI_CACHE_TTL, max_entries=AI_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._stats_lock = threading.Lock()
+
+    def _expires_at(self):
+        return time.time() + self.ttl if self.ttl else None
+
+    @staticmethod
+    def _is_expired(expires_at):
+        return expires_at is not None and expires_at <= time.time()
+
+    def get(self, key):
+        value = self._get(key)
+        with self._stats_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self._set(key, value)
+
+    def _count_evictions(self, count):
+        if count:
+            with self._stats_lock:
+                self.evictions += count
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self).__name__,
+            "entries": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class MemoryLRUCache(_CacheBackend):
+    """Process-local LRU cache with TTL expiry."""
+
+    blocking = False
+
+    def __init__(self, ttl=AI_CACHE_TTL, max_entries=AI_CACHE_MAX_ENTRIES):
+        super().__init__(ttl, max_entries)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if self._is_expired(expires_at):
+                del self._entries[key]
+                self._count_evictions(1)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _set(self, key, value):
+        with self._lock:
+            self._entries[key] = (self._expires_at(), value)
+            self._entries.move_to_end(key)
+            evicted = 0
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+        self._count_evictions(evicted)
+
+
+class SQLiteCache(_CacheBackend):
+    """On-disk cache shared by every worker on the host. Evicts least recently used rows."""
+
+    def __init__(self, path="ai_cache.sqlite3", ttl=AI_CACHE_TTL, max_entries=AI_CACHE_MAX_ENTRIES):
+        super().__init__(ttl, max_entries)
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ai_cache ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ai_cache_last_access ON ai_cache (last_access)")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def __len__(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM ai_cache").fetchone()[0]
+
+    def _get(self, key):
+        with self._connect() as conn:
+            row = conn.execute("SELECT value, expires_at FROM ai_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if self._is_expired(expires_at):
+                conn.execute("DELETE FROM ai_cache WHERE key = ?", (key,))
+                self._count_evictions(1)
+                return None
+            conn.execute("UPDATE ai_cache SET last_access = ? WHERE key = ?", (time.time(), key))
+            return value
+
+    def _set(self, key, value):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO ai_cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, self._expires_at(), now)
+            )
+            evicted = conn.execute("DELETE FROM ai_cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)).rowcount
+            evicted += conn.execute(
+                "DELETE FROM ai_cache WHERE key IN ("
+                " SELECT key FROM ai_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            ).rowcount
+        self._count_evictions(evicted)
+
+
+class ShelveCache(_CacheBackend):
+    """On-disk cache in a shelve file. Single-process only: shelve has no cross-process locking."""
+
+    def __init__(self, path="ai_cache.shelve", ttl=AI_CACHE_TTL, max_entries=AI_CACHE_MAX_ENTRIES):
+        super().__init__(ttl, max_entries)
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock, shelve.open(self.path) as db:
+            return len(db)
+
+    def _get(self, key):
+        with self._lock, shelve.open(self.path) as db:
+            entry = db.get(key)
+            if entry is None:
+                return None
+            expires_at, _, value = entry
+            if self._is_expired(expires_at):
+                del db[key]
+                self._count_evictions(1)
+                return None
+            db[key] = (expires_at, time.time(), value)
+            return value
+
+    def _set(self, key, value):
+        with self._lock, shelve.open(self.path) as db:
+            db[key] = (self._expires_at(), time.time(), value)
+            if len(db) <= self.max_entries:
+                return
+            entries = sorted(((db[k][1], k) for k in db.keys()), reverse=True)
+            stale = [k for _, k in entries[self.max_entries:]]
+            for k in stale:
+                del db[k]
+        self._count_evictions(len(stale))
+
+
+class RedisCache(_CacheBackend):
+    """
+    Cache on any client speaking the redis-py get/set/delete/scan_iter interface.
+    TTL maps to SET EX; size-based eviction is left to the server's maxmemory-policy
+    (configure allkeys-lru), since Redis enforces it far more cheaply than a client can.
+    """
+
+    def __init__(self, redis_client, ttl=AI_CACHE_TTL, max_entries=AI_CACHE_MAX_ENTRIES, prefix="aurapalm:ai:"):
+        super().__init__(ttl, max_entries)
+        self.redis = redis_client
+        self.prefix = prefix
+
+    def __len__(self):
+        # Only this cache's keys: the DB may be shared (rate limiter, job store). SCAN is O(DB size), fine for stats()
+        return sum(1 for _ in self.redis.scan_iter(match=self.prefix + "*", count=1000))
+
+    def _get(self, key):
+        value = self.redis.get(self.prefix + key)
+        if isinstance(value, bytes):
+            value = value.decode("utf-8")
+        return value
+
+    def _set(self, key, value):
+        self.redis.set(self.prefix + key, value, ex=int(self.ttl) if self.ttl else None)
+
+
+class FakeRedis:
+    """Minimal in-process stand-in for a Redis server, for local runs and tests of RedisCache."""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            entry = self._data.get(name)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[name]
+                return None
+            return value
+
+    def set(self, name, value, ex=None):
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        with self._lock:
+            self._data[name] = (value, time.time() + ex if ex else None)
+        return True
+
+    def delete(self, *names):
+        with self._lock:
+            return sum(1 for name in names if self._data.pop(name, None) is not None)
+
+    def scan_iter(self, match=None, count=None):
+        with self._lock:
+            now = time.time()
+            names = [name for name, (_, expires_at) in self._data.items() if expires_at is None or expires_at > now]
+        return iter(name for name in names if match is None or fnmatch.fnmatchcase(name, match))
+
+    def dbsize(self):
+        with self._lock:
+            return len(self._data)
+
+    def flushdb(self):
+        with self._lock:
+            self._data.clear()
+        return True
+
+
+def create_cache(backend=AI_CACHE_BACKEND, path=AI_CACHE_PATH, ttl=AI_CACHE_TTL, max_entries=AI_CACHE_MAX_ENTRIES):
+    """Builds the cache selected by AI_CACHE_BACKEND. Returns None when caching is off."""
+    if backend in ("off", "none", ""):
+        return None
+    if backend == "sqlite":
+        return SQLiteCache(path or "ai_cache.sqlite3", ttl, max_entries)
+    if backend == "shelve":
+        return ShelveCache(path or "ai_cache.shelve", ttl, max_entries)
+    if backend == "redis":
+        try:
+            import redis
+        except ImportError:
+            print("WARNING: AI_CACHE_BACKEND=redis but the 'redis' package is not installed. Falling back to in-memory cache.")
+            return MemoryLRUCache(ttl, max_entries)
+        return RedisCache(redis.Redis.from_url(REDIS_URL), ttl, max_entries)
+    if backend == "fakeredis":
+        return RedisCache(FakeRedis(), ttl, max_entries)
+    if backend != "memory":
+        print(f"WARNING: Unknown AI_CACHE_BACKEND '{backend}'. Falling back to in-memory cache.")
+    return MemoryLRUCache(ttl, max_entries)
+
+
+if __name__ == '__main__':
+    import tempfile
+
+    test_key = make_cache_key("gpt-4o", [{"role": "user", "content": "hello"}], 500, 0.7)
+    with tempfile.TemporaryDirectory() as tmp:
+        for cache in (
+            MemoryLRUCache(ttl=60, max_entries=2),
+            SQLiteCache(os.path.join(tmp, "cache.sqlite3"), ttl=60, max_entries=2),
+            ShelveCache(os.path.join(tmp, "cache.shelve"), ttl=60, max_entries=2),
+            RedisCache(FakeRedis(), ttl=60, max_entries=2),
+        ):
+            assert cache.get(test_key) is None
+            cache.set(test_key, "cached section")
+            assert cache.get(test_key) == "cached section"
+            cache.set("b", "2")
+            cache.set("c", "3")
+            print(cache.stats())
+
+    # Entries are counted per cache, not per Redis DB (which the rate limiter or job store may share)
+    shared_redis = FakeRedis()
+    shared_redis.set("aurapalm:jobs:1", "{}")
+    redis_cache = RedisCache(shared_redis, ttl=60)
+    redis_cache.set(test_key, "cached section")
+    assert len(redis_cache) == 1, len(redis_cache)
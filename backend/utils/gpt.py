@@ -1,18 +1,169 @@
 import os
+import json
+import time
+import asyncio
 import datetime
+import threading
+import contextlib
+import collections
+import weakref
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 import httpx # <--- ADD THIS IMPORT: import httpx
+from utils.cache import create_cache, make_cache_key
+from utils.images import image_data_url
+from utils import metrics, resilience
+from utils.rate_limit import estimate_tokens
+from utils.model_routing import route_section
 
 load_dotenv() # <--- THIS LINE MUST BE HERE, *OUTSIDE* THE if __name__ block
 
-# Initialize OpenAI client
+# --- Transport Configuration ---
+# 'async' uses AsyncOpenAI on a pooled httpx.AsyncClient; 'sync' keeps the blocking client as a fallback
+OPENAI_TRANSPORT = os.getenv("OPENAI_TRANSPORT", "async").lower()
+OPENAI_HTTP2 = os.getenv("OPENAI_HTTP2", "1") == "1"
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "30"))
+
+if OPENAI_HTTP2:
+    try:
+        import h2  # noqa: F401 -- httpx needs it for HTTP/2
+    except ImportError:
+        print("WARNING: OPENAI_HTTP2 is enabled but the 'h2' package is missing. Falling back to HTTP/1.1.")
+        OPENAI_HTTP2 = False
+
+# Initialize OpenAI client (blocking, used when OPENAI_TRANSPORT=sync).
+# The SDK's own retries are off on both clients; utils/resilience.py owns retries and timeouts.
 client = OpenAI(
+    max_retries=0,
     http_client=httpx.Client(
         trust_env=False # <--- ADD THIS LINE to prevent automatic proxy detection
     )
 )
 
+# One AsyncOpenAI client per event loop, as an httpx.AsyncClient must not be used across loops.
+# A client lives while its loop has an openai_session() open: under an ASGI server the app
+# holds one for the worker's lifetime (a single shared pool), while Flask[async], report jobs
+# and streams run each report on a short-lived loop whose client is closed with the report.
+_async_clients = weakref.WeakKeyDictionary()
+_session_users = weakref.WeakKeyDictionary()
+
+def get_async_client():
+    """
+    Returns the pooled AsyncOpenAI client bound to the running event loop. Call it within an
+    openai_session(), or the client (and its open connections) stays around until the process exits.
+    """
+    loop = asyncio.get_running_loop()
+    async_client = _async_clients.get(loop)
+    if async_client is None:
+        async_client = AsyncOpenAI(
+            max_retries=0,
+            http_client=httpx.AsyncClient(
+                trust_env=False,
+                http2=OPENAI_HTTP2,
+                limits=httpx.Limits(
+                    max_connections=OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+                ),
+            )
+        )
+        _async_clients[loop] = async_client
+    return async_client
+
+@contextlib.asynccontextmanager
+async def openai_session():
+    """
+    Keeps the running loop's AsyncOpenAI client open for the block. Sessions nest and overlap;
+    when the last one on the loop exits, the client and its pooled connections are closed.
+    """
+    loop = asyncio.get_running_loop()
+    _session_users[loop] = _session_users.get(loop, 0) + 1
+    try:
+        yield
+    finally:
+        _session_users[loop] -= 1
+        if not _session_users[loop]:
+            del _session_users[loop]
+            async_client = _async_clients.pop(loop, None)
+            if async_client is not None:
+                try:
+                    await async_client.close()
+                except BaseException as e: # Also when the report is cancelled meanwhile; the client is dropped either way
+                    print(f"WARNING: Could not close the OpenAI client cleanly: {e!r}")
+
+# Content-addressed cache of section outputs (see utils/cache.py for AI_CACHE_* settings)
+ai_cache = create_cache()
+
+# --- Concurrency Configuration ---
+# Max sections of a single report in flight at once, and max OpenAI calls in flight per process
+REPORT_SECTION_CONCURRENCY = int(os.getenv("REPORT_SECTION_CONCURRENCY", "6"))
+OPENAI_GLOBAL_CONCURRENCY = int(os.getenv("OPENAI_GLOBAL_CONCURRENCY", "24"))
+
+
+class _ProcessSlots:
+    """
+    Counting semaphore shared by every event loop in the process (Flask[async] runs each request
+    on a loop of its own). Waiters sleep on a future of their own loop and are woken in FIFO order,
+    with the slot handed straight to them.
+    """
+
+    def __init__(self, value):
+        self._value = value
+        self._waiters = collections.deque()
+        self._lock = threading.Lock()
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._value > 0 and not self._waiters:
+                self._value -= 1
+                return
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                try:
+                    self._waiters.remove(waiter)
+                    granted = False
+                except ValueError:
+                    granted = True # release() already handed this waiter the slot
+            if granted:
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            while self._waiters:
+                loop, future = self._waiters.popleft()
+                try:
+                    loop.call_soon_threadsafe(_wake_waiter, future)
+                    return
+                except RuntimeError:
+                    continue # The waiter's loop has closed; try the next one
+            self._value += 1
+
+
+def _wake_waiter(future):
+    # A waiter cancelled after being handed the slot gives it back itself (see acquire)
+    if not future.done():
+        future.set_result(None)
+
+
+_global_openai_slots = _ProcessSlots(max(1, OPENAI_GLOBAL_CONCURRENCY))
+
+
+# --- Palm Analysis Configuration ---
+# 'batched' reads every hand of a report in one multi-image request returning JSON;
+# 'per_hand' sends one vision request per palm image.
+PALM_ANALYSIS_MODE = os.getenv("PALM_ANALYSIS_MODE", "batched").lower()
+if PALM_ANALYSIS_MODE not in ("batched", "per_hand"):
+    print(f"WARNING: Unknown PALM_ANALYSIS_MODE '{PALM_ANALYSIS_MODE}'. Using per_hand.")
+    PALM_ANALYSIS_MODE = "per_hand"
+
 
 # --- Base Prompts and Instructions ---
 BASE_INSTRUCTIONS = (
@@ -23,21 +174,78 @@ BASE_INSTRUCTIONS = (
     "Ensure all interpretations are delivered with a kind and hopeful demeanor."
 )
 
+# Static reference shared by every section. Together with BASE_INSTRUCTIONS it forms a
+# byte-identical system prompt of well over 1024 tokens, which OpenAI caches automatically
+# across requests; everything user-specific goes into the user message that follows.
+REPORT_GUIDELINES = """
+## How to write every section
+- Write in the language requested in the user message, using natural, idiomatic phrasing for that language. Keep personal names exactly as given.
+- Address the reader directly and warmly. Use their name where it reads naturally, but not in every sentence.
+- Open each section with one or two sentences that set its theme, then develop it under short headings, with bullet points for lists of traits, strengths or suggestions. Close with an encouraging takeaway.
+- Keep each section self-contained: do not refer to "the previous section" or "as mentioned above", because sections are written independently and may be read in any order.
+- Do not repeat the section title as the first line; the report layout already shows it.
+- Never predict illness, accidents, death, divorce, financial ruin or any other misfortune. Reframe challenges as opportunities for growth and describe tendencies, never certainties.
+- Do not give medical, legal or financial advice. Do not mention that you are an AI or discuss the limits of palmistry and numerology; the report is offered for reflection and inspiration.
+- Avoid filler and generic horoscope phrasing. Ground every statement in the numbers or palm features provided.
+
+## Numerology reference (Pythagorean system)
+- Life Path Number: derived from the full date of birth; describes core nature, life lessons and the overall direction of the journey.
+- Destiny (Expression) Number: derived from the letters of the full birth name; describes natural talents, abilities and the potential the person is here to express.
+- Master Numbers 11, 22 and 33 are not reduced further and carry heightened potential along with heightened responsibility.
+- 1, The Leader: independence, initiative, originality, courage; growth through patience and collaboration.
+- 2, The Peacemaker: diplomacy, sensitivity, partnership, intuition; growth through self-confidence and healthy boundaries.
+- 3, The Communicator: creativity, self-expression, optimism, sociability; growth through focus and follow-through.
+- 4, The Builder: stability, discipline, reliability, practical effort; growth through flexibility and rest.
+- 5, The Explorer: freedom, curiosity, adaptability, change; growth through commitment and moderation.
+- 6, The Nurturer: responsibility, care, harmony, family and community; growth through receiving as well as giving.
+- 7, The Seeker: reflection, analysis, spirituality, wisdom; growth through trust and openness to others.
+- 8, The Achiever: ambition, leadership, material mastery, resilience; growth through balance and generosity.
+- 9, The Humanitarian: compassion, idealism, generosity, completion; growth through letting go and self-care.
+- 11, The Master Intuitive: inspiration, vision, spiritual insight, sensitivity; growth through grounding ideas in daily life.
+- 22, The Master Builder: turning large visions into lasting, practical results; growth through trusting their own scale of ambition.
+- 33, The Master Teacher: compassion in service, healing, uplifting others; growth through caring for themselves as much as for others.
+- When comparing two people, look at how their numbers complement each other (for example a 1 and a 2 balance initiative with cooperation) and name shared numbers as common ground.
+- Personal year cycles run from 1 (new beginnings) through 9 (completion and release); use them for forward-looking guidance.
+
+## Palmistry reference
+- Hand shapes: Earth (square palm, short fingers: practical, grounded), Air (square palm, long fingers: intellectual, communicative), Fire (long palm, short fingers: energetic, passionate), Water (long palm, long fingers: intuitive, emotional).
+- Left and right hands: the non-dominant hand is traditionally read as inherent potential and the dominant hand as how that potential is being developed. Unless the user message says otherwise, read the left hand as potential and the right hand as its expression.
+- Heart Line (the upper horizontal line): emotional life, affection and relationships. Long and curved suggests warmth and expressiveness; straight suggests a calm, considered approach to feelings.
+- Head Line (the middle horizontal line): thinking style and learning. Long suggests thoroughness; sloping suggests creativity and imagination; straight suggests logic and practicality.
+- Life Line (curving around the thumb): vitality, enthusiasm and the way major life changes are met. Its length never indicates lifespan; never interpret it that way.
+- Fate Line (vertical, towards the middle finger): sense of purpose and career path; its absence simply suggests a self-directed, flexible path.
+- Sun Line (vertical, towards the ring finger): creativity, recognition and fulfillment.
+- Mounts: Venus (base of the thumb: love, warmth, vitality), Jupiter (below the index finger: ambition, leadership), Saturn (below the middle finger: responsibility, wisdom), Apollo (below the ring finger: creativity, joy), Mercury (below the little finger: communication, commerce), Moon (outer base of the palm: imagination, intuition), Mars (courage and resilience).
+- Describe what is actually visible in the photo when it is clear. When a feature is faint, blurred or hidden by lighting, say the reading draws on its typical meaning rather than inventing detail.
+""".strip()
+
+# The static system prompt used by every section
+SYSTEM_PROMPT = f"{BASE_INSTRUCTIONS}\n\n{REPORT_GUIDELINES}"
+
+def _section_prompt(user_content):
+    """Static system prefix first, then the user- and section-specific content."""
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_content}
+    ]
+
 # --- Report Section Prompts ---
 
 def get_introduction_prompt(user_details, report_type, language='en'):
     """Generates the prompt for the introduction section."""
     if report_type == 'individual':
         name = user_details.get('name', 'valued client')
-        return [
-            {"role": "system", "content": f"{BASE_INSTRUCTIONS} Provide a welcoming and intriguing introduction to a personalized palmistry and numerology report in {language}. Set a positive and insightful tone for the journey ahead. Address the user by their name: {name}."}
-        ]
+        return _section_prompt(
+            f"Provide a welcoming and intriguing introduction to a personalized palmistry and numerology report in {language}. "
+            f"Set a positive and insightful tone for the journey ahead. Address the user by their name: {name}."
+        )
     elif report_type == 'couple':
         name1 = user_details.get('person1_name', 'first valued client')
         name2 = user_details.get('person2_name', 'second valued client')
-        return [
-            {"role": "system", "content": f"{BASE_INSTRUCTIONS} Provide a welcoming and intriguing introduction to a joint palmistry and numerology report for a couple in {language}. Set a positive and insightful tone for their shared journey. Address them as: {name1} and {name2}."}
-        ]
+        return _section_prompt(
+            f"Provide a welcoming and intriguing introduction to a joint palmistry and numerology report for a couple in {language}. "
+            f"Set a positive and insightful tone for their shared journey. Address them as: {name1} and {name2}."
+        )
     return []
 
 def get_numerology_insight_prompt(user_details, numerology_data, person_prefix, language='en', detailed=False):
@@ -56,40 +264,66 @@ def get_numerology_insight_prompt(user_details, numerology_data, person_prefix,
         "Discuss their strengths, challenges, and life purpose based on these numbers. "
         f"Output should be in {language}."
     )
-    return [
-        {"role": "system", "content": BASE_INSTRUCTIONS},
-        {"role": "user", "content": prompt_content}
-    ]
+    return _section_prompt(prompt_content)
 
-def get_palm_reading_prompt(user_details, image_base64, hand_type, person_prefix, language='en', detailed=False):
-    """
-    Generates the prompt for a palm reading section for an individual (or person in a couple).
-    Uses Vision API if image_base64 is provided.
-    """
+def _palm_subject(user_details, person_prefix):
+    """Name, gender and approximate age of the person whose palm is read."""
     name = user_details.get(f'{person_prefix}_name', 'valued client')
     gender = user_details.get(f'{person_prefix}_gender', 'individual')
     dob_str = user_details.get(f'{person_prefix}_dob')
     current_year = datetime.datetime.now().year
     age = current_year - int(dob_str.split('-')[0]) if dob_str else 'their age'
+    return name, gender, age
 
-    detail_level = "Provide a concise overview" if not detailed else "Provide a detailed and comprehensive analysis"
+def get_palm_reading_prompt(user_details, image_base64, hand_type, person_prefix, language='en', detailed=False):
+    """
+    Generates the prompt for a palm reading section for an individual (or person in a couple).
+    Uses Vision API if image_base64 is provided.
+    """
+    name, gender, age = _palm_subject(user_details, person_prefix)
 
-    prompt_messages = [
-        {"role": "system", "content": f"{BASE_INSTRUCTIONS} You are analyzing a {hand_type} palm for {name} ({gender}, approximately {age} years old). Provide a {detail_level.lower()} palm reading focusing on key lines (life, head, heart) and mounts (e.g., Venus, Jupiter) as they would typically appear. Interpret these features in a positive, guiding, and encouraging manner. Focus on general tendencies, potential, and areas for growth. Do not make any negative predictions. Your interpretation should be insightful and supportive. Output should be in {language}."}
-    ]
+    detail_level = "Provide a concise overview" if not detailed else "Provide a detailed and comprehensive analysis"
+    reading_instructions = (
+        f"You are analyzing a {hand_type} palm for {name} ({gender}, approximately {age} years old). "
+        f"Provide a {detail_level.lower()} palm reading focusing on key lines (life, head, heart) and mounts (e.g., Venus, Jupiter) "
+        "as they would typically appear. Interpret these features in a positive, guiding, and encouraging manner. "
+        "Focus on general tendencies, potential, and areas for growth. Do not make any negative predictions. "
+        f"Your interpretation should be insightful and supportive. Output should be in {language}."
+    )
 
     if image_base64:
-        prompt_messages.append(
-            {"role": "user", "content": [
-                {"type": "text", "text": f"Analyze this {hand_type} palm image for {name} and provide your insights based on typical palmistry principles. Focus on overall shape, prominent features, and the flow of the main lines (Life, Head, Heart)."},
-                {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}}
-            ]}
-        )
-    else:
-        prompt_messages.append(
-            {"role": "user", "content": f"No image provided. Please provide a general {detail_level.lower()} palm reading for a {hand_type} hand, considering the user's name ({name}), gender ({gender}), and age ({age}). Focus on common positive interpretations."}
-        )
-    return prompt_messages
+        return _section_prompt([
+            {"type": "text", "text": f"{reading_instructions} Analyze this {hand_type} palm image for {name} and provide your insights based on typical palmistry principles. Focus on overall shape, prominent features, and the flow of the main lines (Life, Head, Heart)."},
+            {"type": "image_url", "image_url": {"url": image_data_url(image_base64)}}
+        ])
+    return _section_prompt(
+        f"{reading_instructions} No image provided. Please provide a general {detail_level.lower()} palm reading for a {hand_type} hand, "
+        f"considering the user's name ({name}), gender ({gender}), and age ({age}). Focus on common positive interpretations."
+    )
+
+def get_batched_palm_reading_prompt(hands, language='en'):
+    """
+    Generates one multi-image prompt that reads several palms at once.
+    `hands` is a list of (section_key, user_details, person_prefix, hand_type, image_base64);
+    the model answers with a JSON object {"readings": {section_key: reading, ...}}.
+    """
+    section_keys = ", ".join(f'"{section_key}"' for section_key, _, _, _, _ in hands)
+    user_content = [{"type": "text", "text": (
+        f"You are analyzing {len(hands)} palm images. For each one, provide a detailed and comprehensive palm reading "
+        "focusing on key lines (life, head, heart) and mounts (e.g., Venus, Jupiter) as they would typically appear. "
+        "Interpret these features in a positive, guiding, and encouraging manner. Focus on general tendencies, potential, "
+        "and areas for growth. Do not make any negative predictions. Your interpretation should be insightful and supportive. "
+        f"Each reading should be in {language}. "
+        'Respond with a JSON object of the form {"readings": {"<key>": "<reading>"}} containing exactly one '
+        f"reading per image, using these keys: {section_keys}. Each reading is a complete, standalone section."
+    )}]
+    for section_key, user_details, person_prefix, hand_type, image_base64 in hands:
+        name, gender, age = _palm_subject(user_details, person_prefix)
+        user_content += [
+            {"type": "text", "text": f'Image for key "{section_key}": the {hand_type} palm of {name} ({gender}, approximately {age} years old). Focus on overall shape, prominent features, and the flow of the main lines (Life, Head, Heart).'},
+            {"type": "image_url", "image_url": {"url": image_data_url(image_base64)}},
+        ]
+    return _section_prompt(user_content)
 
 def get_relationship_compatibility_prompt(user_details, numerology_data_p1, numerology_data_p2, language='en'):
     """Generates the prompt for couple relationship compatibility."""
@@ -109,10 +343,7 @@ def get_relationship_compatibility_prompt(user_details, numerology_data_p1, nume
         "Maintain a positive, encouraging, and supportive tone throughout. "
         f"Output should be a detailed analysis in {language}."
     )
-    return [
-        {"role": "system", "content": BASE_INSTRUCTIONS},
-        {"role": "user", "content": prompt_content}
-    ]
+    return _section_prompt(prompt_content)
 
 def get_sectional_prompt(section_name, user_details, numerology_data, language='en'):
     """Generates a prompt for other specific report sections for individual reports."""
@@ -145,10 +376,7 @@ def get_sectional_prompt(section_name, user_details, numerology_data, language='
         )
     }
     content = prompts.get(section_name.lower(), f"Provide insightful analysis for the {section_name} section for {name} in {language}.")
-    return [
-        {"role": "system", "content": BASE_INSTRUCTIONS},
-        {"role": "user", "content": content}
-    ]
+    return _section_prompt(content)
 
 def get_couple_sectional_prompt(section_name, user_details, numerology_data_p1, numerology_data_p2, language='en'):
     """Generates a prompt for other specific report sections for couple reports."""
@@ -184,144 +412,521 @@ def get_couple_sectional_prompt(section_name, user_details, numerology_data_p1,
         )
     }
     content = prompts.get(section_name.lower(), f"Provide insightful analysis for the {section_name} section for {name1} and {name2} in {language}.")
-    return [
-        {"role": "system", "content": BASE_INSTRUCTIONS},
-        {"role": "user", "content": content}
-    ]
+    return _section_prompt(content)
 
 
 # --- Main API Call Function ---
-async def call_openai_api(messages, model="gpt-4o", max_tokens=1500, temperature=0.7):
+async def _cache_lookup(cache_key):
+    if ai_cache is None:
+        return None
+    if ai_cache.blocking:
+        return await asyncio.to_thread(ai_cache.get, cache_key)
+    return ai_cache.get(cache_key)
+
+async def _cache_store(cache_key, content):
+    if ai_cache is None:
+        return
+    try:
+        if ai_cache.blocking:
+            await asyncio.to_thread(ai_cache.set, cache_key, content)
+        else:
+            ai_cache.set(cache_key, content)
+    except Exception as e:
+        print(f"WARNING: Could not store AI section in cache: {e}")
+
+def _usage_counts(usage):
     """
-    Calls the OpenAI API with the given messages and configuration.
+    Token counts of an OpenAI usage object (or dict), or None without one.
+    cached_tokens is the part of the prompt served from OpenAI's prompt cache; SDK
+    versions that predate prompt_tokens_details expose it as a plain dict, or not at all (0).
+    """
+    if usage is None:
+        return None
+
+    def field(obj, name):
+        return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+
+    details = field(usage, "prompt_tokens_details")
+    return {
+        "prompt_tokens": field(usage, "prompt_tokens") or 0,
+        "cached_tokens": (field(details, "cached_tokens") if details is not None else 0) or 0,
+        "completion_tokens": field(usage, "completion_tokens") or 0,
+    }
+
+async def _complete(messages, model="gpt-4o", max_tokens=1500, temperature=0.7, response_format=None):
+    """
+    call_openai_api, also returning the token counts of the response (None for AI cache hits)
+    so callers can record prompt-cache effectiveness.
     """
+    cache_key = make_cache_key(model, messages, max_tokens, temperature, response_format)
+    extra_params = {"response_format": response_format} if response_format is not None else {}
     try:
-        response = client.chat.completions.create(
+        cached = await _cache_lookup(cache_key)
+    except Exception as e:
+        print(f"WARNING: AI cache lookup failed, calling OpenAI instead: {e}")
+        cached = None
+    metrics.AI_CACHE_REQUESTS.inc(result="hit" if cached is not None else "miss")
+    if cached is not None:
+        return cached, None
+
+    async def attempt():
+        if OPENAI_TRANSPORT == "sync":
+            return await asyncio.to_thread(
+                client.chat.completions.create,
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                timeout=resilience.OPENAI_ATTEMPT_TIMEOUT, # The worker thread can't be cancelled, so the SDK enforces it too
+                **extra_params,
+            )
+        return await get_async_client().chat.completions.create(
             model=model,
             messages=messages,
             max_tokens=max_tokens,
             temperature=temperature,
+            **extra_params,
         )
-        return response.choices[0].message.content
+
+    try:
+        response = await resilience.call_with_retries(
+            attempt, latency_key=(model, max_tokens), hedge=True, rate_cost=estimate_tokens(messages, max_tokens))
     except Exception as e:
         print(f"ERROR: OpenAI API call failed: {e}")
-        return f"AI generation failed for this section due to an error: {e}"
+        raise
+    content = response.choices[0].message.content
 
-# --- Report Generation Orchestration ---
+    # Empty answers are never cached, so a retried order gets a fresh attempt at those sections
+    if content:
+        await _cache_store(cache_key, content)
+    return content, _usage_counts(getattr(response, "usage", None))
 
-async def generate_full_report_content(user_details, numerology_data, left_palm_image_base64, right_palm_image_base64,
-                                        language='en', report_type='individual',
-                                        person2_details=None, numerology_data_p2=None,
-                                        person2_left_palm_image_base64=None, person2_right_palm_image_base64=None):
+async def call_openai_api(messages, model="gpt-4o", max_tokens=1500, temperature=0.7, response_format=None):
     """
-    Orchestrates the multiple OpenAI API calls to generate the full report content,
-    supporting both individual and couple reports.
+    Calls the OpenAI API with the given messages and configuration.
+    Identical requests (same model, messages incl. images, max_tokens and temperature) are served
+    from the AI section cache. With OPENAI_TRANSPORT=sync the blocking client runs in a worker
+    thread so the event loop stays free. `response_format` is passed through when set
+    (e.g. {"type": "json_object"}). Timeouts, 429s and 5xx are retried (see utils/resilience.py);
+    raises OpenAIUnavailableError once that gives up.
     """
-    report_sections = {}
-    model_to_use = "gpt-4o" # GPT-4o is powerful and can handle images for basic insights
+    content, _ = await _complete(messages, model, max_tokens, temperature, response_format)
+    return content
 
+async def stream_openai_api(messages, model="gpt-4o", max_tokens=1500, temperature=0.7, usage=None):
+    """
+    Streaming variant of call_openai_api (stream=True): an async generator that yields the
+    section text in chunks as the model produces them. Cached sections arrive as one chunk,
+    and the complete text is cached once the stream has finished. If a `usage` dict is
+    passed, it is filled with the token counts reported at the end of the stream.
+    Opening the stream is retried like call_openai_api; once text has been yielded it can't
+    be taken back, so a stream that breaks or stalls (OPENAI_ATTEMPT_TIMEOUT between chunks)
+    raises OpenAIUnavailableError instead.
+    """
+    if OPENAI_TRANSPORT == "sync":
+        # Iterating the blocking client would pin a thread per section; the sync fallback yields whole sections
+        content, counts = await _complete(messages, model=model, max_tokens=max_tokens, temperature=temperature)
+        if usage is not None and counts:
+            usage.update(counts)
+        yield content
+        return
+
+    cache_key = make_cache_key(model, messages, max_tokens, temperature)
+    try:
+        cached = await _cache_lookup(cache_key)
+    except Exception as e:
+        print(f"WARNING: AI cache lookup failed, calling OpenAI instead: {e}")
+        cached = None
+    metrics.AI_CACHE_REQUESTS.inc(result="hit" if cached is not None else "miss")
+    if cached is not None:
+        yield cached
+        return
+
+    async def open_stream():
+        """Opens the stream and waits for its first chunk, so a stalled start is retried too."""
+        stream = await get_async_client().chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True,
+            # The last chunk then carries the usage (prompt/cached tokens); passed as extra_body for older SDKs
+            extra_body={"stream_options": {"include_usage": True}},
+        )
+        chunks = stream.__aiter__()
+        try:
+            return chunks, await chunks.__anext__()
+        except StopAsyncIteration:
+            return chunks, None
+
+    def read_chunk(chunk):
+        counts = _usage_counts(getattr(chunk, "usage", None))
+        if usage is not None and counts:
+            usage.update(counts)
+        return chunk.choices[0].delta.content if chunk.choices else None
+
+    try:
+        chunks, chunk = await resilience.call_with_retries(
+            open_stream, description="OpenAI stream", rate_cost=estimate_tokens(messages, max_tokens))
+    except Exception as e:
+        print(f"ERROR: OpenAI streaming call failed: {e}")
+        raise
+
+    parts = []
+    try:
+        while chunk is not None:
+            delta = read_chunk(chunk)
+            if delta:
+                parts.append(delta)
+                yield delta
+            try:
+                chunk = await asyncio.wait_for(chunks.__anext__(), resilience.OPENAI_ATTEMPT_TIMEOUT)
+            except StopAsyncIteration:
+                chunk = None
+    except Exception as e:
+        print(f"ERROR: OpenAI stream broke off after {len(parts)} chunks: {e!r}")
+        if resilience.is_retryable(e):
+            resilience.openai_breaker.record_failure()
+        raise resilience.OpenAIUnavailableError(f"OpenAI stream broke off: {e!r}") from e
+
+    content = "".join(parts)
+    if content:
+        await _cache_store(cache_key, content)
+
+# --- Section Scheduling ---
+
+@contextlib.asynccontextmanager
+async def _global_openai_slot():
+    """
+    Holds one of the process-wide OpenAI slots for the duration of a call. Calls beyond
+    OPENAI_GLOBAL_CONCURRENCY wait in arrival order, whichever event loop they run on.
+    """
+    await _global_openai_slots.acquire()
+    try:
+        yield
+    finally:
+        _global_openai_slots.release()
+
+def build_report_plan(user_details, numerology_data, left_palm_image_base64, right_palm_image_base64,
+                      language='en', report_type='individual',
+                      person2_details=None, numerology_data_p2=None,
+                      person2_left_palm_image_base64=None, person2_right_palm_image_base64=None):
+    """
+    Returns the ordered list of (section_key, messages, max_tokens) needed for a report.
+    Sections are independent of each other, so the list can be fanned out concurrently.
+    """
     # Intro is always first
-    report_sections['introduction'] = await call_openai_api(
-        get_introduction_prompt(user_details, report_type, language),
-        model=model_to_use, max_tokens=500
-    )
+    plan = [('introduction', get_introduction_prompt(user_details, report_type, language), 500)]
 
     if report_type == 'individual':
-        print("INFO: Generating content for INDIVIDUAL report...")
-        report_sections['numerology_detailed'] = await call_openai_api(
-            get_numerology_insight_prompt(user_details, numerology_data, 'person1', language, detailed=True),
-            model=model_to_use, max_tokens=1500
-        )
-        report_sections['left_palm_detailed'] = await call_openai_api(
-            get_palm_reading_prompt(user_details, left_palm_image_base64, 'left', 'person1', language, detailed=True),
-            model=model_to_use, max_tokens=1500
-        )
-        report_sections['right_palm_detailed'] = await call_openai_api(
-            get_palm_reading_prompt(user_details, right_palm_image_base64, 'right', 'person1', language, detailed=True),
-            model=model_to_use, max_tokens=1500
-        )
+        plan += [
+            ('numerology_detailed', get_numerology_insight_prompt(user_details, numerology_data, 'person1', language, detailed=True), 1500),
+            ('left_palm_detailed', get_palm_reading_prompt(user_details, left_palm_image_base64, 'left', 'person1', language, detailed=True), 1500),
+            ('right_palm_detailed', get_palm_reading_prompt(user_details, right_palm_image_base64, 'right', 'person1', language, detailed=True), 1500),
+        ]
         # Premium sections
         if report_type == 'premium' or True: # Force premium sections for now if no basic/premium logic is set
-            report_sections['career_outlook'] = await call_openai_api(
-                get_sectional_prompt('career_outlook', user_details, numerology_data, language),
-                model=model_to_use, max_tokens=1000
-            )
-            report_sections['relationship_traits'] = await call_openai_api(
-                get_sectional_prompt('relationship_traits', user_details, numerology_data, language),
-                model=model_to_use, max_tokens=1000
-            )
-            report_sections['year_by_year_forecast'] = await call_openai_api(
-                get_sectional_prompt('year_by_year_forecast', user_details, numerology_data, language),
-                model=model_to_use, max_tokens=1200
-            )
-        report_sections['conclusion'] = await call_openai_api(
-            get_sectional_prompt('conclusion', user_details, numerology_data, language),
-            model=model_to_use, max_tokens=500
-        )
+            plan += [
+                ('career_outlook', get_sectional_prompt('career_outlook', user_details, numerology_data, language), 1000),
+                ('relationship_traits', get_sectional_prompt('relationship_traits', user_details, numerology_data, language), 1000),
+                ('year_by_year_forecast', get_sectional_prompt('year_by_year_forecast', user_details, numerology_data, language), 1200),
+            ]
+        plan.append(('conclusion', get_sectional_prompt('conclusion', user_details, numerology_data, language), 500))
 
     elif report_type == 'couple' and person2_details and numerology_data_p2:
-        print("INFO: Generating content for COUPLE report...")
+        plan += [
+            # Person 1: numerology and both palms
+            ('person1_numerology', get_numerology_insight_prompt(user_details, numerology_data, 'person1', language, detailed=True), 1500),
+            ('person1_left_palm', get_palm_reading_prompt(user_details, left_palm_image_base64, 'left', 'person1', language, detailed=True), 1500),
+            ('person1_right_palm', get_palm_reading_prompt(user_details, right_palm_image_base64, 'right', 'person1', language, detailed=True), 1500),
+            # Person 2: numerology and both palms
+            ('person2_numerology', get_numerology_insight_prompt(person2_details, numerology_data_p2, 'person2', language, detailed=True), 1500),
+            ('person2_left_palm', get_palm_reading_prompt(person2_details, person2_left_palm_image_base64, 'left', 'person2', language, detailed=True), 1500),
+            ('person2_right_palm', get_palm_reading_prompt(person2_details, person2_right_palm_image_base64, 'right', 'person2', language, detailed=True), 1500),
+            # Couple-specific sections
+            ('relationship_compatibility', get_relationship_compatibility_prompt(user_details, numerology_data, numerology_data_p2, language), 2000), # Longer for compatibility
+            ('combined_path_purpose', get_couple_sectional_prompt('combined_path_purpose', user_details, numerology_data, numerology_data_p2, language), 1000),
+            ('challenges_growth', get_couple_sectional_prompt('challenges_growth', user_details, numerology_data, numerology_data_p2, language), 1000),
+            ('shared_future_outlook', get_couple_sectional_prompt('shared_future_outlook', user_details, numerology_data, numerology_data_p2, language), 1200),
+            ('conclusion_couple', get_couple_sectional_prompt('conclusion_couple', user_details, numerology_data, numerology_data_p2, language), 600),
+        ]
 
-        # Numerology for Person 1
-        report_sections['person1_numerology'] = await call_openai_api(
-            get_numerology_insight_prompt(user_details, numerology_data, 'person1', language, detailed=True),
-            model=model_to_use, max_tokens=1500
-        )
-        # Palmistry for Person 1 (left)
-        report_sections['person1_left_palm'] = await call_openai_api(
-            get_palm_reading_prompt(user_details, left_palm_image_base64, 'left', 'person1', language, detailed=True),
-            model=model_to_use, max_tokens=1500
-        )
-        # Palmistry for Person 1 (right)
-        report_sections['person1_right_palm'] = await call_openai_api(
-            get_palm_reading_prompt(user_details, right_palm_image_base64, 'right', 'person1', language, detailed=True),
-            model=model_to_use, max_tokens=1500
-        )
+    return plan
 
-        # Numerology for Person 2
-        report_sections['person2_numerology'] = await call_openai_api(
-            get_numerology_insight_prompt(person2_details, numerology_data_p2, 'person2', language, detailed=True),
-            model=model_to_use, max_tokens=1500
-        )
-        # Palmistry for Person 2 (left)
-        report_sections['person2_left_palm'] = await call_openai_api(
-            get_palm_reading_prompt(person2_details, person2_left_palm_image_base64, 'left', 'person2', language, detailed=True),
-            model=model_to_use, max_tokens=1500
-        )
-        # Palmistry for Person 2 (right)
-        report_sections['person2_right_palm'] = await call_openai_api(
-            get_palm_reading_prompt(person2_details, person2_right_palm_image_base64, 'right', 'person2', language, detailed=True),
-            model=model_to_use, max_tokens=1500
-        )
+def build_palm_batch(user_details, left_palm_image_base64, right_palm_image_base64,
+                     language='en', report_type='individual', person2_details=None,
+                     person2_left_palm_image_base64=None, person2_right_palm_image_base64=None):
+    """
+    Returns (section_keys, messages, max_tokens) for reading every palm of a report in one
+    request, or None when batching does not apply (per_hand mode or a missing image).
+    """
+    if PALM_ANALYSIS_MODE != "batched":
+        return None
+    if report_type == 'individual':
+        hands = [
+            ('left_palm_detailed', user_details, 'person1', 'left', left_palm_image_base64),
+            ('right_palm_detailed', user_details, 'person1', 'right', right_palm_image_base64),
+        ]
+    elif report_type == 'couple' and person2_details:
+        hands = [
+            ('person1_left_palm', user_details, 'person1', 'left', left_palm_image_base64),
+            ('person1_right_palm', user_details, 'person1', 'right', right_palm_image_base64),
+            ('person2_left_palm', person2_details, 'person2', 'left', person2_left_palm_image_base64),
+            ('person2_right_palm', person2_details, 'person2', 'right', person2_right_palm_image_base64),
+        ]
+    else:
+        return None
+    if not all(image_base64 for _, _, _, _, image_base64 in hands):
+        return None # The no-image fallback prompt only exists per hand
+    section_keys = [section_key for section_key, _, _, _, _ in hands]
+    # Same output budget as the per-hand calls combined (1500 each)
+    return section_keys, get_batched_palm_reading_prompt(hands, language), 1500 * len(hands)
+
+def _parse_palm_readings(content, section_keys):
+    """Extracts {section_key: reading} from a batched palm response, skipping keys that are missing or empty."""
+    try:
+        readings = json.loads(content).get("readings", {})
+    except (TypeError, ValueError, AttributeError):
+        return {}
+    if not isinstance(readings, dict):
+        return {}
+    return {key: readings[key].strip() for key in section_keys
+            if isinstance(readings.get(key), str) and readings[key].strip()}
+
+def _record_usage(token_usage, section_key, route, counts, elapsed, content):
+    """
+    Stores a section's token counts (and model), records its latency/tokens/cost metrics and
+    returns the counts formatted for the log line.
+    """
+    metrics.observe_section(section_key, route.model, elapsed, counts, failed=not content)
+    if not counts:
+        return ""
+    token_usage[section_key] = {**counts, "model": route.model}
+    return f" ({route.model}, prompt {counts['prompt_tokens']} tokens, {counts['cached_tokens']} cached)"
 
-        # Couple-specific sections
-        report_sections['relationship_compatibility'] = await call_openai_api(
-            get_relationship_compatibility_prompt(user_details, numerology_data, numerology_data_p2, language),
-            model=model_to_use, max_tokens=2000 # Longer for compatibility
-        )
-        report_sections['combined_path_purpose'] = await call_openai_api(
-            get_couple_sectional_prompt('combined_path_purpose', user_details, numerology_data, numerology_data_p2, language),
-            model=model_to_use, max_tokens=1000
-        )
-        report_sections['challenges_growth'] = await call_openai_api(
-            get_couple_sectional_prompt('challenges_growth', user_details, numerology_data, numerology_data_p2, language),
-            model=model_to_use, max_tokens=1000
-        )
-        report_sections['shared_future_outlook'] = await call_openai_api(
-            get_couple_sectional_prompt('shared_future_outlook', user_details, numerology_data, numerology_data_p2, language),
-            model=model_to_use, max_tokens=1200
-        )
-        report_sections['conclusion_couple'] = await call_openai_api(
-            get_couple_sectional_prompt('conclusion_couple', user_details, numerology_data, numerology_data_p2, language),
-            model=model_to_use, max_tokens=600
-        )
+async def _generate_palm_batch(palm_batch, plan_by_key, report_slots, timings, token_usage):
+    """
+    Reads all palms of a report in one JSON-mode request and returns {section_key: reading}.
+    Hands the model left out (or an unparseable or failed answer) fall back to the per-hand prompts.
+    """
+    section_keys, messages, max_tokens = palm_batch
+    route = route_section('palm_batch', max_tokens)
+    async with report_slots:
+        async with _global_openai_slot():
+            started = time.perf_counter()
+            try:
+                content, counts = await _complete(messages, model=route.model, max_tokens=route.max_tokens,
+                                                  temperature=route.temperature, response_format={"type": "json_object"})
+            except Exception as e:
+                print(f"WARNING: Batched palm analysis failed: {e}")
+                content, counts = None, None
+            elapsed = time.perf_counter() - started
+    timings['palm_batch'] = elapsed
+    readings = _parse_palm_readings(content, section_keys)
+    print(f"INFO: Batched palm analysis ({len(readings)}/{len(section_keys)} hands) generated in {elapsed:.2f}s"
+          f"{_record_usage(token_usage, 'palm_batch', route, counts, elapsed, content)}")
+
+    missing = [key for key in section_keys if key not in readings]
+    if missing:
+        print(f"WARNING: Batched palm analysis missed {missing}. Falling back to per-hand calls.")
+        metrics.OPENAI_RETRIES.inc(len(missing), reason="palm_batch_fallback")
+        contents = await asyncio.gather(*(
+            _generate_section(key, plan_by_key[key][0], plan_by_key[key][1], report_slots, timings, token_usage)
+            for key in missing
+        ))
+        readings.update(zip(missing, contents))
+    return readings
+
+async def _generate_section(section_key, messages, max_tokens, report_slots, timings, token_usage):
+    """
+    Generates one section with the model, max_tokens and temperature of its route, under the
+    per-report and global concurrency caps, recording its latency and token counts.
+    Raises if the section can't be generated (see call_openai_api).
+    """
+    route = route_section(section_key, max_tokens)
+    async with report_slots:
+        async with _global_openai_slot():
+            started = time.perf_counter()
+            try:
+                content, counts = await _complete(messages, model=route.model, max_tokens=route.max_tokens,
+                                                  temperature=route.temperature)
+            except Exception:
+                metrics.SECTION_FAILURES.inc(section=section_key)
+                raise
+            elapsed = time.perf_counter() - started
+    timings[section_key] = elapsed
+    print(f"INFO: Section '{section_key}' generated in {elapsed:.2f}s{_record_usage(token_usage, section_key, route, counts, elapsed, content)}")
+    return content
+
+async def _stream_section(section_key, messages, max_tokens, report_slots, events, timings, token_usage):
+    """
+    Streams one section into the `events` queue under the same caps as _generate_section.
+    Finishes with a 'section' event carrying the full text, or an 'error' event if the
+    section could not be generated, so the consumer can count sections.
+    """
+    route = route_section(section_key, max_tokens)
+    parts = []
+    counts = {}
+    try:
+        async with report_slots:
+            async with _global_openai_slot():
+                started = time.perf_counter()
+                async for delta in stream_openai_api(messages, model=route.model, max_tokens=route.max_tokens,
+                                                       temperature=route.temperature, usage=counts):
+                    parts.append(delta)
+                    await events.put({"event": "delta", "section": section_key, "text": delta})
+                elapsed = time.perf_counter() - started
+        timings[section_key] = elapsed
+        usage_note = _record_usage(token_usage, section_key, route, counts, elapsed, "".join(parts))
+        print(f"INFO: Section '{section_key}' streamed in {elapsed:.2f}s{usage_note}")
+    except Exception as e:
+        print(f"ERROR: Streaming section '{section_key}' failed: {e}")
+        metrics.SECTION_FAILURES.inc(section=section_key)
+        await events.put({"event": "error", "section": section_key, "message": str(e)})
+        return
+    await events.put({"event": "section", "section": section_key, "text": "".join(parts)})
 
+async def _stream_palm_batch(palm_batch, plan_by_key, report_slots, events, timings, token_usage):
+    """
+    Runs the batched palm analysis for a streamed report. JSON output can't be shown while it
+    is being written, so each palm section arrives as a single delta once the batch is done.
+    """
+    try:
+        readings = await _generate_palm_batch(palm_batch, plan_by_key, report_slots, timings, token_usage)
+    except Exception as e:
+        print(f"ERROR: Batched palm analysis failed: {e}")
+        await events.put({"event": "error", "section": "palm_batch", "message": str(e)})
+        return
+    for section_key in palm_batch[0]:
+        await events.put({"event": "delta", "section": section_key, "text": readings[section_key]})
+        await events.put({"event": "section", "section": section_key, "text": readings[section_key]})
+
+# --- Report Generation Orchestration ---
+
+def _prompt_cache_summary(token_usage):
+    prompt_tokens = sum(counts["prompt_tokens"] for counts in token_usage.values())
+    if not prompt_tokens:
+        return ""
+    cached_tokens = sum(counts["cached_tokens"] for counts in token_usage.values())
+    return f", prompt cache hit {cached_tokens}/{prompt_tokens} tokens ({cached_tokens / prompt_tokens:.0%})"
+
+async def generate_full_report_content(user_details, numerology_data, left_palm_image_base64, right_palm_image_base64,
+                                        language='en', report_type='individual',
+                                        person2_details=None, numerology_data_p2=None,
+                                        person2_left_palm_image_base64=None, person2_right_palm_image_base64=None,
+                                        timings=None, token_usage=None):
+    """
+    Orchestrates the multiple OpenAI API calls to generate the full report content,
+    supporting both individual and couple reports.
+    Sections run concurrently (up to REPORT_SECTION_CONCURRENCY per report and
+    OPENAI_GLOBAL_CONCURRENCY per process), each on the model, max_tokens and temperature
+    its route in utils/model_routing.py gives it. If a `timings` dict is passed, it is filled
+    with the latency in seconds of every section plus the wall-clock 'total'; a `token_usage`
+    dict receives each section's prompt, cached and completion token counts and model.
+    A section that still fails after its retries raises OpenAIUnavailableError rather than
+    putting an error note into a paid PDF; with the AI cache on, retrying the order only
+    regenerates the sections that are missing.
+    """
+    timings = {} if timings is None else timings
+    token_usage = {} if token_usage is None else token_usage
+
+    plan = build_report_plan(
+        user_details, numerology_data, left_palm_image_base64, right_palm_image_base64,
+        language, report_type,
+        person2_details, numerology_data_p2,
+        person2_left_palm_image_base64, person2_right_palm_image_base64
+    )
+    print(f"INFO: Generating {len(plan)} sections for {report_type.upper()} report...")
+
+    palm_batch = build_palm_batch(
+        user_details, left_palm_image_base64, right_palm_image_base64, language, report_type,
+        person2_details, person2_left_palm_image_base64, person2_right_palm_image_base64
+    )
+    batched_keys = set(palm_batch[0]) if palm_batch else set()
+
+    report_slots = asyncio.Semaphore(max(1, REPORT_SECTION_CONCURRENCY))
+    started = time.perf_counter()
+    section_tasks = [
+        _generate_section(section_key, messages, max_tokens, report_slots, timings, token_usage)
+        for section_key, messages, max_tokens in plan if section_key not in batched_keys
+    ]
+    if palm_batch:
+        plan_by_key = {section_key: (messages, max_tokens) for section_key, messages, max_tokens in plan}
+        results = await asyncio.gather(_generate_palm_batch(palm_batch, plan_by_key, report_slots, timings, token_usage),
+                                       *section_tasks)
+        generated = dict(results[0])
+        generated.update(zip((k for k, _, _ in plan if k not in batched_keys), results[1:]))
+    else:
+        generated = dict(zip((section_key for section_key, _, _ in plan), await asyncio.gather(*section_tasks)))
+    timings['total'] = time.perf_counter() - started
+    print(f"INFO: {report_type.upper()} report content generated in {timings['total']:.2f}s "
+          f"(sum of sections: {sum(v for k, v in timings.items() if k != 'total'):.2f}s){_prompt_cache_summary(token_usage)}")
+
+    # Keep the dict in plan order so downstream consumers see the same layout as before
+    report_sections = {section_key: generated[section_key] for section_key, _, _ in plan}
     return report_sections
 
+async def stream_full_report_content(user_details, numerology_data, left_palm_image_base64, right_palm_image_base64,
+                                     language='en', report_type='individual',
+                                     person2_details=None, numerology_data_p2=None,
+                                     person2_left_palm_image_base64=None, person2_right_palm_image_base64=None,
+                                     timings=None, token_usage=None):
+    """
+    Streaming counterpart of generate_full_report_content. An async generator of event dicts:
+    first {'event': 'sections', 'sections': [keys in report order]}, then interleaved
+    {'event': 'delta', 'section', 'text'} chunks from the concurrently running sections, and a
+    {'event': 'section', 'section', 'text'} with the full text as each section completes.
+    Raises OpenAIUnavailableError (stopping the other sections) if a section fails for good.
+    `timings` and `token_usage` are filled as in generate_full_report_content.
+    """
+    timings = {} if timings is None else timings
+    token_usage = {} if token_usage is None else token_usage
+
+    plan = build_report_plan(
+        user_details, numerology_data, left_palm_image_base64, right_palm_image_base64,
+        language, report_type,
+        person2_details, numerology_data_p2,
+        person2_left_palm_image_base64, person2_right_palm_image_base64
+    )
+    print(f"INFO: Streaming {len(plan)} sections for {report_type.upper()} report...")
+    yield {"event": "sections", "sections": [section_key for section_key, _, _ in plan]}
+
+    palm_batch = build_palm_batch(
+        user_details, left_palm_image_base64, right_palm_image_base64, language, report_type,
+        person2_details, person2_left_palm_image_base64, person2_right_palm_image_base64
+    )
+    batched_keys = set(palm_batch[0]) if palm_batch else set()
+
+    events = asyncio.Queue()
+    report_slots = asyncio.Semaphore(max(1, REPORT_SECTION_CONCURRENCY))
+    started = time.perf_counter()
+    tasks = [
+        asyncio.create_task(_stream_section(section_key, messages, max_tokens, report_slots, events, timings, token_usage))
+        for section_key, messages, max_tokens in plan if section_key not in batched_keys
+    ]
+    if palm_batch:
+        plan_by_key = {section_key: (messages, max_tokens) for section_key, messages, max_tokens in plan}
+        tasks.append(asyncio.create_task(_stream_palm_batch(palm_batch, plan_by_key, report_slots, events, timings, token_usage)))
+    remaining = len(plan)
+    try:
+        while remaining:
+            event = await events.get()
+            if event["event"] == "error":
+                raise resilience.OpenAIUnavailableError(f"Section '{event['section']}' could not be generated: {event['message']}")
+            if event["event"] == "section":
+                remaining -= 1
+            yield event
+    finally:
+        # Stop generating if the consumer goes away early
+        for task in tasks:
+            task.cancel()
+    timings['total'] = time.perf_counter() - started
+    print(f"INFO: {report_type.upper()} report content streamed in {timings['total']:.2f}s{_prompt_cache_summary(token_usage)}")
+
 if __name__ == '__main__':
     import asyncio
     from dotenv import load_dotenv
-    from numerology import get_numerology_insights # Assuming numerology.py is in the same dir
+    from utils.numerology import get_numerology_insights # Run from backend/: python -m utils.gpt
 
     load_dotenv()
 
@@ -0,0 +1,215 @@
+import os
+import time
+import asyncio
+import hashlib
+import sqlite3
+import contextlib
+from utils.report_store import report_store, PDF_OUTPUT_DIR, REPORT_MAX_AGE
+
+# --- Idempotency Configuration ---
+# Report requests are keyed on their Razorpay order id, payment id and signature, so a resubmitted
+# payment (double click, client retry) attaches to the report already generating or generated for it.
+# The signature is an HMAC only Razorpay and this server can compute, so knowing a payment's ids
+# alone is not enough to be handed someone else's report.
+REPORT_IDEMPOTENCY = os.getenv("REPORT_IDEMPOTENCY", "sqlite").lower() # 'sqlite' (shared by all workers on the host) or 'off'
+REPORT_IDEMPOTENCY_DB_PATH = os.getenv("REPORT_IDEMPOTENCY_DB_PATH", "report_idempotency.sqlite3")
+REPORT_IDEMPOTENCY_TTL = int(os.getenv("REPORT_IDEMPOTENCY_TTL", str(REPORT_MAX_AGE))) # Seconds a finished report is replayed
+# Seconds a report may stay in flight before its claim is considered abandoned (e.g. the worker died)
+REPORT_IDEMPOTENCY_LEASE = int(os.getenv("REPORT_IDEMPOTENCY_LEASE", "600"))
+REPORT_IDEMPOTENCY_POLL_INTERVAL = float(os.getenv("REPORT_IDEMPOTENCY_POLL_INTERVAL", "0.5"))
+# Seconds a duplicate /api/generate-report waits for the original (Gunicorn's default worker timeout)
+# before answering 202 with a job to poll instead
+REPORT_DUPLICATE_WAIT = float(os.getenv("REPORT_DUPLICATE_WAIT", "30"))
+
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+_DOWNLOAD_PREFIX = "/api/download-report/"
+
+
+def make_idempotency_key(order_id, payment_id, signature):
+    return hashlib.sha256(f"{order_id}:{payment_id}:{signature}".encode("utf-8")).hexdigest()
+
+
+def report_idempotency_key(data):
+    """The idempotency key of a report payload, or None when it is off or the payment fields are missing."""
+    if report_idempotency is None or not isinstance(data, dict):
+        return None
+    order_id, payment_id = data.get('razorpay_order_id'), data.get('razorpay_payment_id')
+    signature = data.get('razorpay_signature')
+    if not order_id or not payment_id or not signature:
+        return None
+    return make_idempotency_key(order_id, payment_id, signature)
+
+
+def _report_available(download_url):
+    """Whether the PDF behind a download URL can still be served (disk reports are deleted once downloaded)."""
+    filename = os.path.basename(download_url.removeprefix(_DOWNLOAD_PREFIX))
+    if report_store is not None and report_store.get(filename) is not None:
+        return True
+    return os.path.exists(os.path.join(PDF_OUTPUT_DIR, filename))
+
+
+class ReportIdempotencyStore:
+    """
+    Claims on report generation, one per payment, in a local SQLite file so duplicates are
+    caught whichever worker they reach. The first request claims the key and runs the report;
+    later ones read the claim: a running report is waited on (or its job id returned), a
+    finished one is replayed, and a failed or abandoned one is claimed again and re-run.
+    """
+
+    def __init__(self, db_path=REPORT_IDEMPOTENCY_DB_PATH, ttl=REPORT_IDEMPOTENCY_TTL, lease=REPORT_IDEMPOTENCY_LEASE,
+                 poll_interval=REPORT_IDEMPOTENCY_POLL_INTERVAL):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.lease = lease
+        self.poll_interval = poll_interval
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS report_idempotency ("
+                " key TEXT PRIMARY KEY, status TEXT NOT NULL, job_id TEXT, download_url TEXT, error TEXT,"
+                " created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """A connection whose work is committed (or rolled back on error), then closed."""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _is_live(self, record, now):
+        """Running within its lease, or succeeded within the TTL with the PDF still downloadable."""
+        if record["status"] == RUNNING:
+            return record["created_at"] + self.lease > now
+        if record["status"] == SUCCEEDED:
+            return record["updated_at"] + self.ttl > now and _report_available(record["download_url"])
+        return False
+
+    def get(self, key):
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM report_idempotency WHERE key = ?", (key,)).fetchone()
+        return dict(row) if row else None
+
+    def find(self, key):
+        """The running or replayable record for `key`, or None if a new request should generate the report."""
+        record = self.get(key)
+        return record if record and self._is_live(record, time.time()) else None
+
+    def claim(self, key):
+        """
+        Claims `key` for the caller, who must then call complete() or fail(). Returns None when
+        claimed, or the live record of the request that got there first.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE") # Serializes claims across workers
+            row = conn.execute("SELECT * FROM report_idempotency WHERE key = ?", (key,)).fetchone()
+            if row is not None and self._is_live(dict(row), now):
+                return dict(row)
+            conn.execute(
+                "INSERT OR REPLACE INTO report_idempotency (key, status, job_id, download_url, error, created_at, updated_at)"
+                " VALUES (?, ?, NULL, NULL, NULL, ?, ?)",
+                (key, RUNNING, now, now)
+            )
+            # Forget payments whose reports are long gone
+            conn.execute("DELETE FROM report_idempotency WHERE updated_at < ?", (now - max(self.ttl, self.lease),))
+        return None
+
+    def _update(self, key, **fields):
+        assignments = [f"{field} = ?" for field in fields]
+        with self._connect() as conn:
+            conn.execute(f"UPDATE report_idempotency SET {', '.join(assignments)}, updated_at = ? WHERE key = ?",
+                         (*fields.values(), time.time(), key))
+
+    def attach_job(self, key, job_id):
+        """Records the /api/report-jobs job generating the claimed report, so duplicates get its id."""
+        self._update(key, job_id=job_id)
+
+    def complete(self, key, download_url):
+        self._update(key, status=SUCCEEDED, download_url=download_url)
+
+    def fail(self, key, error):
+        self._update(key, status=FAILED, error=error)
+
+    def _settled(self, key, deadline):
+        record = self.get(key)
+        if record is None or record["status"] != RUNNING or time.time() >= deadline:
+            return True, record
+        return False, record
+
+    def wait(self, key, timeout=None):
+        """Polls until the report for `key` finishes or `timeout` (default: the lease) passes. Returns its record."""
+        deadline = time.time() + (self.lease if timeout is None else timeout)
+        while True:
+            settled, record = self._settled(key, deadline)
+            if settled:
+                return record
+            time.sleep(self.poll_interval)
+
+    async def wait_async(self, key, timeout=None):
+        """wait() for callers on an event loop; each poll runs in a thread."""
+        deadline = time.time() + (self.lease if timeout is None else timeout)
+        while True:
+            settled, record = await asyncio.to_thread(self._settled, key, deadline)
+            if settled:
+                return record
+            await asyncio.sleep(self.poll_interval)
+
+
+def create_idempotency_store(kind=REPORT_IDEMPOTENCY):
+    """Builds the store selected by REPORT_IDEMPOTENCY. Returns None when it is off."""
+    if kind in ("off", "none", ""):
+        return None
+    if kind != "sqlite":
+        print(f"WARNING: Unknown REPORT_IDEMPOTENCY '{kind}'. Using the SQLite idempotency store.")
+    return ReportIdempotencyStore()
+
+
+report_idempotency = create_idempotency_store()
+
+
+# Answers for duplicate requests; each returns (response body, HTTP status) like utils/payments.py
+
+def duplicate_report_response(record):
+    """The /api/generate-report answer for a duplicate, once the original request's record has settled."""
+    if record is None:
+        return {"status": "error", "message": "The report for this payment could not be completed. Please retry."}, 500
+    if record["status"] == SUCCEEDED:
+        return {
+            "status": "success",
+            "message": "Report generated successfully.",
+            "download_url": record["download_url"]
+        }, 200
+    if record["status"] == FAILED:
+        return {"status": "error", "message": f"An error occurred during report generation: {record['error']}"}, 500
+    return {"status": "error", "message": "The report for this payment is still being generated. Please retry shortly."}, 409
+
+
+def job_accepted_response(job_id, job_status="queued", message="Report generation started."):
+    """The 202 answer of /api/report-jobs for `job_id`."""
+    return {
+        "status": "success",
+        "message": message,
+        "job_id": job_id,
+        "job_status": job_status,
+        "status_url": f"/api/report-jobs/{job_id}"
+    }, 202
+
+
+async def follow_report(idempotency_key):
+    """
+    Job pipeline for a /api/report-jobs duplicate whose payment was claimed by /api/generate-report
+    or its stream, which have no job to poll: waits for that request and returns its download URL.
+    """
+    record = await report_idempotency.wait_async(idempotency_key)
+    if record is not None and record["status"] == SUCCEEDED:
+        return record["download_url"]
+    body, _ = duplicate_report_response(record)
+    raise RuntimeError(body["message"])
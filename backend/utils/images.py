@@ -0,0 +1,138 @@
+import os
+import io
+import base64
+import hashlib
+import binascii
+from collections import namedtuple
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# --- Image Normalization Configuration ---
+PALM_IMAGE_FORMAT = os.getenv("PALM_IMAGE_FORMAT", "JPEG").upper() # 'JPEG' or 'WEBP'
+PALM_VISION_MAX_EDGE = int(os.getenv("PALM_VISION_MAX_EDGE", "1024")) # Long edge sent to the vision model
+PALM_PRINT_MAX_EDGE = int(os.getenv("PALM_PRINT_MAX_EDGE", "1600")) # Long edge embedded in the PDF
+PALM_VISION_QUALITY = int(os.getenv("PALM_VISION_QUALITY", "80"))
+PALM_PRINT_QUALITY = int(os.getenv("PALM_PRINT_QUALITY", "85"))
+
+if PALM_IMAGE_FORMAT not in ("JPEG", "WEBP"):
+    print(f"WARNING: Unsupported PALM_IMAGE_FORMAT '{PALM_IMAGE_FORMAT}'. Using JPEG.")
+    PALM_IMAGE_FORMAT = "JPEG"
+
+# MIME type of every normalized image, for data: URLs in prompts and the PDF template
+PALM_IMAGE_MIME = "image/webp" if PALM_IMAGE_FORMAT == "WEBP" else "image/jpeg"
+
+# One palm photo in two sizes: a small one for the vision model and a larger one for print
+PalmImageVariants = namedtuple("PalmImageVariants", ["for_vision", "for_print"])
+
+
+class PalmImage:
+    """
+    One encoded image variant, held as bytes once and shared by every prompt and the PDF.
+    Prompts use data_url(), which base64-encodes on first use and then reuses the string;
+    the PDF template references `url` (palm://<sha256>), which the renderer's url_fetcher
+    serves from `data`, so the print variant is never base64-encoded at all.
+    Pickles as the raw bytes only (e.g. for the render pool).
+    """
+
+    __slots__ = ("data", "mime_type", "url", "_data_url")
+
+    def __init__(self, data, mime_type=PALM_IMAGE_MIME):
+        self.data = bytes(data)
+        self.mime_type = mime_type
+        self.url = f"palm://{hashlib.sha256(self.data).hexdigest()}"
+        self._data_url = None
+
+    def data_url(self):
+        """The image as a data: URL, as the OpenAI vision API expects it. Built once."""
+        if self._data_url is None:
+            self._data_url = f"data:{self.mime_type};base64,{base64.b64encode(self.data).decode('ascii')}"
+        return self._data_url
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getstate__(self):
+        return self.data, self.mime_type, self.url
+
+    def __setstate__(self, state):
+        self.data, self.mime_type, self.url = state
+        self._data_url = None
+
+    def __repr__(self):
+        return f"<PalmImage {self.url[7:19]} {len(self.data)} bytes>"
+
+
+def image_data_url(image):
+    """data: URL of a palm image given as a PalmImage or, from older callers, a base64 string."""
+    if isinstance(image, PalmImage):
+        return image.data_url()
+    return f"data:{PALM_IMAGE_MIME};base64,{image}"
+
+
+class InvalidImageError(ValueError):
+    """Raised when an uploaded palm image cannot be decoded."""
+
+
+def _encode_variant(image, max_edge, quality):
+    """Downscales a copy of `image` to `max_edge` and returns it re-encoded, without metadata."""
+    variant = image.copy()
+    variant.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    buffer = io.BytesIO()
+    # Saving without exif/icc arguments strips the original metadata (GPS, device info, etc.)
+    variant.save(buffer, format=PALM_IMAGE_FORMAT, quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def normalize_image_file(fp):
+    """
+    Decodes a palm photo from a file object once, auto-orients it from EXIF, and returns
+    PalmImageVariants of raw bytes re-encoded in PALM_IMAGE_FORMAT with metadata stripped.
+    """
+    largest_edge = max(PALM_VISION_MAX_EDGE, PALM_PRINT_MAX_EDGE)
+    try:
+        image = Image.open(fp)
+        # Let the JPEG decoder skip straight to a reduced scale when the photo is much larger than needed
+        image.draft("RGB", (largest_edge, largest_edge))
+        image = ImageOps.exif_transpose(image)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+        raise InvalidImageError("Could not read palm image. Please upload a JPEG, PNG or WebP photo.") from e
+
+    return PalmImageVariants(
+        for_vision=_encode_variant(image, PALM_VISION_MAX_EDGE, PALM_VISION_QUALITY),
+        for_print=_encode_variant(image, PALM_PRINT_MAX_EDGE, PALM_PRINT_QUALITY),
+    )
+
+
+def wrap_variants(variants):
+    """Wraps both raw variants in PalmImage handles, as used in prompts and the PDF template."""
+    return PalmImageVariants(*(PalmImage(v) for v in variants))
+
+
+def normalize_image_bytes(raw_bytes):
+    """Normalizes raw image bytes and returns PalmImageVariants of PalmImage handles."""
+    return wrap_variants(normalize_image_file(io.BytesIO(raw_bytes)))
+
+
+def normalize_palm_image(image_base64):
+    """Same as normalize_image_bytes, for the base64 strings sent by the frontend."""
+    if image_base64.startswith("data:"):
+        image_base64 = image_base64.split(",", 1)[-1]
+    try:
+        raw_bytes = base64.b64decode(image_base64, validate=False)
+    except (binascii.Error, ValueError) as e:
+        raise InvalidImageError(f"Palm image is not valid base64: {e}") from e
+    return normalize_image_bytes(raw_bytes)
+
+
+if __name__ == '__main__':
+    # Round-trip a synthetic 4000x3000 "phone photo" and report the size reduction
+    photo = Image.new("RGB", (4000, 3000), (200, 160, 140))
+    buffer = io.BytesIO()
+    photo.save(buffer, format="JPEG", quality=95)
+    original_base64 = base64.b64encode(buffer.getvalue()).decode("ascii")
+
+    variants = normalize_palm_image(original_base64)
+    print(f"Original: {len(original_base64)} base64 chars")
+    print(f"Vision variant: {len(variants.for_vision)} bytes")
+    print(f"Print variant: {len(variants.for_print)} bytes")
@@ -0,0 +1,187 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import contextlib
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Job Configuration ---
+REPORT_JOB_STORE = os.getenv("REPORT_JOB_STORE", "memory").lower() # 'memory' or 'sqlite'
+REPORT_JOB_DB_PATH = os.getenv("REPORT_JOB_DB_PATH", "report_jobs.sqlite3")
+REPORT_JOB_WORKERS = int(os.getenv("REPORT_JOB_WORKERS", "4"))
+REPORT_JOB_MAX_PENDING = int(os.getenv("REPORT_JOB_MAX_PENDING", "100"))
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+
+class JobQueueFullError(RuntimeError):
+    """Raised when the worker pool already has REPORT_JOB_MAX_PENDING jobs waiting or running."""
+
+
+# --- Job Stores ---
+
+class InMemoryJobStore:
+    """
+    Keeps job state in a process-local dict.
+    Only suitable when a single web worker both accepts and answers status polls.
+    """
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, job_id, **fields):
+        now = time.time()
+        job = {"job_id": job_id, "status": JOB_QUEUED, "result": None, "error": None,
+               "created_at": now, "updated_at": now}
+        job.update(fields)
+        with self._lock:
+            self._jobs[job_id] = job
+        return dict(job)
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job.update(fields, updated_at=time.time())
+            return dict(job)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+
+class SQLiteJobStore:
+    """
+    Keeps job state in a local SQLite file so every Gunicorn worker on the host
+    can answer status polls, whichever worker is running the job.
+    """
+
+    def __init__(self, db_path=REPORT_JOB_DB_PATH):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS report_jobs ("
+                " job_id TEXT PRIMARY KEY, status TEXT NOT NULL, result TEXT, error TEXT,"
+                " created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def create(self, job_id, **fields):
+        now = time.time()
+        job = {"job_id": job_id, "status": JOB_QUEUED, "result": None, "error": None,
+               "created_at": now, "updated_at": now}
+        job.update(fields)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO report_jobs (job_id, status, result, error, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, job["status"], json.dumps(job["result"]), job["error"], job["created_at"], job["updated_at"])
+            )
+        return job
+
+    def update(self, job_id, **fields):
+        assignments = []
+        values = []
+        for key in ("status", "result", "error"):
+            if key in fields:
+                assignments.append(f"{key} = ?")
+                values.append(json.dumps(fields[key]) if key == "result" else fields[key])
+        assignments.append("updated_at = ?")
+        values.append(time.time())
+        with self._connect() as conn:
+            conn.execute(f"UPDATE report_jobs SET {', '.join(assignments)} WHERE job_id = ?", (*values, job_id))
+        return self.get(job_id)
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM report_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+
+def create_job_store(kind=REPORT_JOB_STORE):
+    """Builds the job store selected by REPORT_JOB_STORE."""
+    if kind == "sqlite":
+        return SQLiteJobStore()
+    if kind != "memory":
+        print(f"WARNING: Unknown REPORT_JOB_STORE '{kind}'. Falling back to in-memory job store.")
+    return InMemoryJobStore()
+
+
+# --- Worker Pool ---
+
+class ReportJobQueue:
+    """
+    Runs report pipelines on a pool of worker threads, each with its own event loop,
+    and records their progress in a job store. `context` is an optional callable returning
+    a context manager entered around every job (e.g. Flask's app.app_context).
+    """
+
+    def __init__(self, pipeline, store=None, max_workers=REPORT_JOB_WORKERS, max_pending=REPORT_JOB_MAX_PENDING,
+                 context=None):
+        self.pipeline = pipeline
+        self.context = context or contextlib.nullcontext
+        self.store = store or create_job_store()
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="report-job")
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+
+    @property
+    def pending(self):
+        """Number of jobs queued or running in this process."""
+        return self._pending
+
+    def submit(self, report_args, pipeline=None):
+        """Queues a report and returns its job id immediately. `pipeline` overrides the queue's own for this job."""
+        with self._pending_lock:
+            if self._pending >= self.max_pending:
+                raise JobQueueFullError("Too many reports are being generated right now. Please retry shortly.")
+            self._pending += 1
+
+        job_id = uuid.uuid4().hex
+        self.store.create(job_id)
+        try:
+            self._executor.submit(self._run, job_id, report_args, pipeline or self.pipeline)
+        except Exception:
+            self._finish()
+            self.store.update(job_id, status=JOB_FAILED, error="Could not schedule report generation.")
+            raise
+        print(f"INFO: Queued report job {job_id} (pending: {self._pending})")
+        return job_id
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def _finish(self):
+        with self._pending_lock:
+            self._pending -= 1
+
+    def _run(self, job_id, report_args, pipeline):
+        self.store.update(job_id, status=JOB_RUNNING)
+        try:
+            with self.context():
+                download_url = asyncio.run(pipeline(**report_args))
+            self.store.update(job_id, status=JOB_SUCCEEDED, result={"download_url": download_url})
+            print(f"INFO: Report job {job_id} succeeded.")
+        except Exception as e:
+            print(f"ERROR: Report job {job_id} failed: {e}")
+            self.store.update(job_id, status=JOB_FAILED, error=str(e))
+        finally:
+            self._finish()
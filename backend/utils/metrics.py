@@ -0,0 +1,210 @@
+import os
+import json
+import math
+import threading
+import contextlib
+import contextvars
+
+# --- Metrics Configuration ---
+# USD per million [input, cached input, output] tokens per model, for the estimated cost counter.
+# List prices by default; OPENAI_PRICES_PER_M takes a JSON object of the same shape to add or change models.
+OPENAI_PRICES_PER_M = {
+    "gpt-4o": [2.50, 1.25, 10.00],
+    "gpt-4o-mini": [0.15, 0.075, 0.60],
+    **json.loads(os.getenv("OPENAI_PRICES_PER_M", "{}")),
+}
+
+# `language` comes from the request body, so unknown values are folded into 'other' to bound label cardinality
+METRIC_LANGUAGES = {"en", "hi", "es"}
+METRIC_REPORT_TYPES = {"individual", "couple"}
+
+# report_type/language of the report being generated; asyncio tasks inherit it from the pipeline
+_report_labels = contextvars.ContextVar("report_labels", default={"report_type": "unknown", "language": "unknown"})
+
+
+@contextlib.contextmanager
+def report_context(report_type, language):
+    """Labels every metric recorded inside the block (and in tasks started from it) with this report's type and language."""
+    token = _report_labels.set({
+        "report_type": report_type if report_type in METRIC_REPORT_TYPES else "other",
+        "language": language if language in METRIC_LANGUAGES else "other",
+    })
+    try:
+        yield
+    finally:
+        _report_labels.reset(token)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    """Base of the hand-rolled Prometheus metrics: values per label set, guarded by one lock."""
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), report_labels=True):
+        self.name = name
+        self.documentation = documentation
+        # report_type and language are filled in from the current report context
+        self.labelnames = (("report_type", "language") if report_labels else ()) + tuple(labelnames)
+        self.report_labels = report_labels
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        if self.report_labels:
+            labels = {**_report_labels.get(), **labels}
+        return tuple((name, labels.get(name, "")) for name in self.labelnames)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            values = dict(self._values)
+        return self._header() + [f"{self.name}{_format_labels(key)} {_format_value(v)}" for key, v in sorted(values.items())]
+
+
+class Gauge(_Metric):
+    """A gauge that is either set directly or read from a callback at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), report_labels=False):
+        super().__init__(name, documentation, labelnames, report_labels)
+        self._function = None
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function):
+        self._function = function
+
+    def collect(self):
+        if self._function is not None:
+            try:
+                self.set(self._function())
+            except Exception as e:
+                print(f"WARNING: Could not read gauge {self.name}: {e}")
+        with self._lock:
+            values = dict(self._values)
+        return self._header() + [f"{self.name}{_format_labels(key)} {_format_value(v)}" for key, v in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, buckets, labelnames=(), report_labels=True):
+        super().__init__(name, documentation, labelnames, report_labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def collect(self):
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        lines = self._header()
+        for key, (counts, total) in sorted(values.items()):
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', _format_value(bound)),))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {counts[-1]}")
+        return lines
+
+
+REGISTRY = []
+
+# --- Report Metrics ---
+SECTION_LATENCY = Histogram(
+    "aurapalm_section_latency_seconds", "Time to generate one report section, from acquiring an OpenAI slot to the last token.",
+    buckets=(0.5, 1, 2.5, 5, 10, 15, 20, 30, 45, 60, 90, 120), labelnames=("section", "model"))
+SECTION_TOKENS = Counter(
+    "aurapalm_section_tokens_total", "OpenAI tokens per section; kind is prompt, cached (part of prompt) or completion.",
+    labelnames=("section", "model", "kind"))
+SECTION_COST = Counter(
+    "aurapalm_section_cost_usd_total", "Estimated OpenAI cost per section from OPENAI_PRICES_PER_M (models without a price are left out).",
+    labelnames=("section", "model"))
+SECTION_FAILURES = Counter(
+    "aurapalm_section_failures_total", "Sections that could not be generated.", labelnames=("section",))
+OPENAI_RETRIES = Counter(
+    "aurapalm_openai_retries_total", "OpenAI calls repeated after a failure, by reason.", labelnames=("reason",))
+OPENAI_HEDGES = Counter("aurapalm_openai_hedged_requests_total", "Duplicate OpenAI requests fired for slow calls.")
+OPENAI_RATE_LIMIT_WAIT = Histogram(
+    "aurapalm_openai_rate_limit_wait_seconds", "Time OpenAI calls waited for the shared token/request budget.",
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 20, 30, 60), labelnames=("priority",))
+OPENAI_BREAKER_OPEN = Gauge("aurapalm_openai_circuit_open", "1 while the OpenAI circuit breaker is open or half-open.")
+AI_CACHE_REQUESTS = Counter(
+    "aurapalm_ai_cache_requests_total", "AI section cache lookups by result (hit or miss).", labelnames=("result",))
+PDF_RENDER_SECONDS = Histogram(
+    "aurapalm_pdf_render_seconds", "Time to render a report PDF with WeasyPrint, including waiting for a render worker.",
+    buckets=(0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 60, 120))
+PDF_BYTES = Histogram(
+    "aurapalm_pdf_bytes", "Size of rendered report PDFs.",
+    buckets=(100e3, 250e3, 500e3, 1e6, 2e6, 4e6, 8e6, 16e6))
+REPORTS_TOTAL = Counter("aurapalm_reports_total", "Reports by outcome (succeeded or failed).", labelnames=("outcome",))
+RENDER_QUEUE_DEPTH = Gauge("aurapalm_render_queue_depth", "PDF renders queued or running in this process's render pool.")
+REPORT_JOBS_PENDING = Gauge("aurapalm_report_jobs_pending", "Background report jobs queued or running in this process.")
+
+
+def estimate_cost(model, counts):
+    """Estimated USD cost of one call's token counts, or None for a model without a price."""
+    prices = OPENAI_PRICES_PER_M.get(model)
+    if prices is None:
+        return None
+    input_price, cached_input_price, output_price = prices
+    uncached_tokens = counts["prompt_tokens"] - counts["cached_tokens"]
+    return (uncached_tokens * input_price + counts["cached_tokens"] * cached_input_price
+            + counts["completion_tokens"] * output_price) / 1e6
+
+
+def observe_section(section_key, model, elapsed, counts, failed=False):
+    """Records latency, tokens and estimated cost of one generated section."""
+    SECTION_LATENCY.observe(elapsed, section=section_key, model=model)
+    if failed:
+        SECTION_FAILURES.inc(section=section_key)
+    if not counts:
+        return
+    for kind in ("prompt", "cached", "completion"):
+        SECTION_TOKENS.inc(counts[f"{kind}_tokens"], section=section_key, model=model, kind=kind)
+    cost = estimate_cost(model, counts)
+    if cost is not None:
+        SECTION_COST.inc(cost, section=section_key, model=model)
+
+
+def render_metrics():
+    """All metrics of this process in the Prometheus text exposition format (0.0.4)."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,68 @@
+import os
+import json
+from collections import namedtuple
+
+# --- Model Routing Configuration ---
+# Routing table of per-section model, max_tokens and temperature, grouped into named profiles
+MODEL_ROUTING_PATH = os.getenv("MODEL_ROUTING_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "model_routing.json"))
+MODEL_ROUTING_PROFILE = os.getenv("MODEL_ROUTING_PROFILE") # Defaults to the file's default_profile
+# JSON object of per-section settings applied on top of the profile, e.g. '{"introduction": {"model": "gpt-4o-mini"}}'
+MODEL_ROUTING_OVERRIDES = os.getenv("MODEL_ROUTING_OVERRIDES")
+
+SectionRoute = namedtuple("SectionRoute", ["model", "max_tokens", "temperature"])
+
+ROUTE_FIELDS = ("model", "max_tokens", "temperature")
+
+
+class ModelRouter:
+    """
+    Resolves the model, max_tokens and temperature of a report section: the section's entry in
+    the profile, then the profile default, then the section's built-in max_tokens. The batched
+    palm request is routed as 'palm_batch'.
+    """
+
+    def __init__(self, profile_name, default, sections):
+        self.profile_name = profile_name
+        self.default = default
+        self.sections = sections
+
+    def route(self, section_key, max_tokens, temperature=0.7):
+        settings = {"max_tokens": max_tokens, "temperature": temperature, **self.default, **self.sections.get(section_key, {})}
+        return SectionRoute(settings["model"], int(settings["max_tokens"]), float(settings["temperature"]))
+
+
+def _route_settings(entry, where):
+    unknown = set(entry) - set(ROUTE_FIELDS)
+    if unknown:
+        print(f"WARNING: Ignoring unknown model routing fields {sorted(unknown)} in {where}.")
+    return {field: entry[field] for field in ROUTE_FIELDS if field in entry}
+
+
+def create_router(profile=MODEL_ROUTING_PROFILE, path=MODEL_ROUTING_PATH, overrides=MODEL_ROUTING_OVERRIDES):
+    """Builds the router for `profile` from the routing file, with the JSON `overrides` applied on top."""
+    with open(path, encoding="utf-8") as f:
+        table = json.load(f)
+    profiles = table["profiles"]
+    if profile and profile not in profiles:
+        print(f"WARNING: Unknown MODEL_ROUTING_PROFILE '{profile}'. Using '{table['default_profile']}'.")
+        profile = None
+    profile = profile or table["default_profile"]
+
+    entry = profiles[profile]
+    default = {"model": "gpt-4o", **_route_settings(entry.get("default", {}), f"profile '{profile}'")}
+    sections = {key: _route_settings(settings, f"section '{key}'") for key, settings in entry.get("sections", {}).items()}
+    if overrides:
+        try:
+            for key, settings in json.loads(overrides).items():
+                sections[key] = {**sections.get(key, {}), **_route_settings(settings, f"MODEL_ROUTING_OVERRIDES '{key}'")}
+        except (ValueError, AttributeError) as e:
+            print(f"WARNING: Could not parse MODEL_ROUTING_OVERRIDES, ignoring it: {e}")
+    return ModelRouter(profile, default, sections)
+
+
+model_router = create_router()
+
+
+def route_section(section_key, max_tokens):
+    """The SectionRoute of a report section under the active routing profile."""
+    return model_router.route(section_key, max_tokens)
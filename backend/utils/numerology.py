@@ -1,4 +1,8 @@
+import os
+import json
 import datetime
+import functools
+import unicodedata
 
 # Standard numerology mapping for letters (Pythagorean)
 NUMEROLOGY_MAP = {
@@ -16,6 +20,21 @@ NUMEROLOGY_MAP = {
 # Master Numbers
 MASTER_NUMBERS = {11, 22, 33}
 
+# Byte table for bytes.translate: each ASCII letter becomes its value, every other byte 0
+_LETTER_BYTES = bytearray(256)
+for _letter, _value in NUMEROLOGY_MAP.items():
+    _LETTER_BYTES[ord(_letter)] = _LETTER_BYTES[ord(_letter.lower())] = _value
+_LETTER_BYTES = bytes(_LETTER_BYTES)
+
+def _reduce_by_digits(num):
+    while num > 9 and num not in MASTER_NUMBERS:
+        s = str(num)
+        num = sum(int(digit) for digit in s)
+    return num
+
+# reduce_number for 0-9999: covers any year, day/month sums and names up to ~1000 letters
+REDUCTION_TABLE = tuple(_reduce_by_digits(n) for n in range(10000))
+
 def reduce_number(num):
     """
     Reduces a number to a single digit (1-9) or a master number (11, 22, 33).
@@ -23,10 +42,9 @@ def reduce_number(num):
     if not isinstance(num, int):
         raise ValueError("Input must be an integer.")
 
-    while num > 9 and num not in MASTER_NUMBERS:
-        s = str(num)
-        num = sum(int(digit) for digit in s)
-    return num
+    if 0 <= num < len(REDUCTION_TABLE):
+        return REDUCTION_TABLE[num]
+    return _reduce_by_digits(num)
 
 def calculate_life_path(dob_str):
     """
@@ -43,10 +61,27 @@ def calculate_life_path(dob_str):
     except ValueError:
         return None
 
-def calculate_destiny_number(full_name):
+def transliterate_name(full_name):
+    """
+    Maps a Unicode name onto the Pythagorean (A-Z) alphabet: accents are stripped ('José' -> 'Jose')
+    and letters that upper-case to several Latin letters are expanded ('ß' -> 'SS').
+    Letters with no Latin equivalent (e.g. Devanagari) are dropped.
+    """
+    decomposed = unicodedata.normalize("NFKD", full_name.upper())
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).encode("ascii", "ignore").decode("ascii")
+
+def calculate_destiny_number(full_name, transliterate=True):
     """
     Calculates the Destiny (Expression) Number from a full name.
+    Accented and other non-ASCII Latin letters are scored as their base letter ('José' as
+    'Jose'); with `transliterate=False` they score 0, as they did before.
     """
+    if transliterate and not full_name.isascii():
+        full_name = transliterate_name(full_name)
+    if full_name.isascii():
+        # Fast path: ASCII non-letters map to 0, so the translated bytes sum to the letter total
+        return reduce_number(sum(full_name.encode("ascii").translate(_LETTER_BYTES)))
+
     name_sum = 0
     # Clean name: remove spaces, convert to uppercase, keep only letters
     clean_name = "".join(filter(str.isalpha, full_name)).upper()
@@ -57,32 +92,61 @@ def calculate_destiny_number(full_name):
     destiny_number = reduce_number(name_sum)
     return destiny_number
 
-def get_numerology_insights(dob_str, full_name):
+# --- Interpretation Catalog ---
+NUMEROLOGY_MEMO_SIZE = int(os.getenv("NUMEROLOGY_MEMO_SIZE", "4096")) # (dob, name, language) results kept
+INTERPRETATIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "interpretations.json")
+DEFAULT_LANGUAGE = "en"
+
+def _load_interpretations(path=INTERPRETATIONS_PATH):
+    """
+    Expands the compact catalog (per-language templates plus a title and traits per number)
+    into ready-made summaries, so each lookup at request time is a dict access.
+    """
+    with open(path, encoding="utf-8") as f:
+        catalog = json.load(f)
+    interpretations = {}
+    for language, entry in catalog.items():
+        templates = entry["templates"]
+        summaries = {"templates": templates, "life_path": {}, "destiny": {}}
+        for number, (title, traits) in entry["numbers"].items():
+            for kind in ("life_path", "destiny"):
+                summaries[kind][int(number)] = templates[kind].format(number=number, title=title, traits=traits)
+        interpretations[language] = summaries
+    return interpretations
+
+INTERPRETATIONS = _load_interpretations()
+
+def get_summary(kind, number, language=DEFAULT_LANGUAGE):
+    """Summary text for a 'life_path' or 'destiny' number in `language` (English if not in the catalog)."""
+    summaries = INTERPRETATIONS.get(language) or INTERPRETATIONS[DEFAULT_LANGUAGE]
+    if number is None:
+        return summaries["templates"][f"{kind}_invalid"]
+    summary = summaries[kind].get(number)
+    if summary is None:
+        # Numbers without a catalog entry (0 from an all-zero date or a name with no Latin letters)
+        summary = summaries["templates"][f"{kind}_plain"].format(number=number)
+    return summary
+
+@functools.lru_cache(maxsize=NUMEROLOGY_MEMO_SIZE)
+def get_numerology_insights(dob_str, full_name, language=DEFAULT_LANGUAGE):
     """
     Calculates and returns Life Path and Destiny numbers,
-    along with basic summaries.
+    along with basic summaries in `language`.
+    Results are memoized per (dob, name, language): the same dict is returned for repeat
+    calls (couple flows, retries), so callers must treat it as read-only.
     """
     life_path = calculate_life_path(dob_str)
     destiny_number = calculate_destiny_number(full_name)
 
-    insights = {
+    return {
         "life_path_number": life_path,
         "destiny_number": destiny_number,
-        "interpretations": {}
+        "interpretations": {
+            "life_path_summary": get_summary("life_path", life_path, language),
+            "destiny_summary": get_summary("destiny", destiny_number, language),
+        }
     }
 
-    if life_path is not None:
-        insights["interpretations"]["life_path_summary"] = f"Your Life Path Number is {life_path}. This number highlights your fundamental nature and the major lessons you are here to learn. GPT will provide detailed interpretation based on this."
-    else:
-        insights["interpretations"]["life_path_summary"] = "Life Path Number could not be calculated due to invalid date of birth."
-    
-    if destiny_number is not None:
-        insights["interpretations"]["destiny_summary"] = f"Your Destiny (Expression) Number is {destiny_number}. This number reveals your natural abilities, talents, and potential. GPT will provide detailed interpretation based on this."
-    else:
-        insights["interpretations"]["destiny_summary"] = "Destiny Number could not be calculated due to invalid name."
-    
-    return insights
-
 if __name__ == '__main__':
     # Example Usage:
     test_dob_individual = "1990-05-15"
@@ -96,4 +160,8 @@ if __name__ == '__main__':
     test_name_invalid = "123Test" # Invalid name
     print(f"\nNumerology for {test_name_invalid} (DOB: {test_dob_invalid}):")
     invalid_insights = get_numerology_insights(test_dob_invalid, test_name_invalid)
-    print(invalid_insights)
\ No newline at end of file
+    print(invalid_insights)
+
+    print(f"\nHindi summaries for {test_name_individual}:")
+    print(get_numerology_insights(test_dob_individual, test_name_individual, 'hi')["interpretations"])
+    print(get_numerology_insights.cache_info())
\ No newline at end of file
@@ -0,0 +1,136 @@
+"""
+Vectorized Life Path and Destiny numbers for bulk jobs (analytics, CRM exports).
+Requires NumPy (optional dependency, not needed by the web app).
+
+Results agree exactly with calculate_life_path / calculate_destiny_number in
+utils/numerology.py. Rows in the common shapes (ASCII 'YYYY-MM-DD'-style dates and
+ASCII names) are computed with array arithmetic; anything else falls back to the scalar
+functions, so unusual input is still handled the same way.
+"""
+import re
+import numpy as np
+from utils.numerology import NUMEROLOGY_MAP, MASTER_NUMBERS, REDUCTION_TABLE, calculate_life_path, calculate_destiny_number
+
+INVALID = -1 # Marks rows where calculate_life_path would return None
+
+# Byte -> letter value for ASCII; every other byte scores 0, like non-letters in the scalar version
+_LETTER_TABLE = np.zeros(256, dtype=np.int64)
+for _letter, _value in NUMEROLOGY_MAP.items():
+    _LETTER_TABLE[ord(_letter)] = _value
+    _LETTER_TABLE[ord(_letter.lower())] = _value
+
+_MASTER_ARRAY = np.array(sorted(MASTER_NUMBERS), dtype=np.int64)
+_REDUCED = np.array(REDUCTION_TABLE, dtype=np.int64)
+# Plain ASCII digits only; up to 9 digits per part keeps every sum well inside int64
+_SIMPLE_DOB = re.compile(r"([0-9]{1,9})-([0-9]{1,9})-([0-9]{1,9})")
+
+
+def digit_sum(values):
+    """Sum of decimal digits of each (non-negative) value, without converting to strings."""
+    values = np.array(values, dtype=np.int64)
+    total = np.zeros_like(values)
+    while values.any():
+        total += values % 10
+        values //= 10
+    return total
+
+
+def reduce_numbers(values):
+    """Vectorized reduce_number: repeated digit sums down to 1-9, keeping 11, 22 and 33."""
+    values = np.array(values, dtype=np.int64)
+    in_table = (values >= 0) & (values < len(_REDUCED))
+    if in_table.all():
+        return _REDUCED[values]
+    values[in_table] = _REDUCED[values[in_table]]
+    pending = (values > 9) & ~np.isin(values, _MASTER_ARRAY)
+    while pending.any():
+        values[pending] = digit_sum(values[pending])
+        pending &= (values > 9) & ~np.isin(values, _MASTER_ARRAY)
+    return values
+
+
+def _parse_iso_dates(dobs):
+    """
+    Parses the rows that are exactly 'YYYY-MM-DD' (ASCII digits) as whole arrays.
+    Returns (mask of parsed rows, year, month, day) with the numbers for the parsed rows only.
+    """
+    candidates = np.fromiter((isinstance(dob, str) and len(dob) == 10 for dob in dobs), dtype=bool, count=len(dobs))
+    rows = np.flatnonzero(candidates)
+    codes = np.array([dobs[row] for row in rows], dtype="U10").view(np.uint32).reshape(-1, 10).astype(np.int64)
+    digits = codes - ord("0")
+    dashes = (codes[:, 4] == ord("-")) & (codes[:, 7] == ord("-"))
+    digit_columns = [0, 1, 2, 3, 5, 6, 8, 9]
+    all_digits = ((digits[:, digit_columns] >= 0) & (digits[:, digit_columns] <= 9)).all(axis=1)
+    parsed = dashes & all_digits
+    candidates[rows[~parsed]] = False
+    digits = digits[parsed]
+    year = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+    month = digits[:, 5] * 10 + digits[:, 6]
+    day = digits[:, 8] * 10 + digits[:, 9]
+    return candidates, year, month, day
+
+
+def batch_life_path(dobs):
+    """
+    Life Path Numbers for a sequence of 'YYYY-MM-DD' strings, as an int64 array.
+    Rows the scalar function rejects are INVALID (-1).
+    """
+    dobs = list(dobs)
+    result = np.full(len(dobs), INVALID, dtype=np.int64)
+    iso_rows, year, month, day = _parse_iso_dates(dobs)
+    result[iso_rows] = reduce_numbers(reduce_numbers(month) + reduce_numbers(day) + reduce_numbers(year))
+
+    # Other shapes: unpadded parts still go through the arrays, anything stranger
+    # (whitespace, '+' signs, non-ASCII digits, None...) through the scalar function
+    parts, simple_rows = [], []
+    for row in np.flatnonzero(~iso_rows):
+        dob = dobs[row]
+        match = _SIMPLE_DOB.fullmatch(dob) if isinstance(dob, str) else None
+        if match:
+            parts.append(match.groups())
+            simple_rows.append(row)
+        else:
+            life_path = calculate_life_path(dob) if isinstance(dob, str) else None
+            result[row] = INVALID if life_path is None else life_path
+    if simple_rows:
+        year, month, day = np.array([[int(part) for part in row] for row in parts], dtype=np.int64).T
+        result[simple_rows] = reduce_numbers(reduce_numbers(month) + reduce_numbers(day) + reduce_numbers(year))
+    return result
+
+
+def _score_ascii_names(names):
+    """Letter sums of ASCII names: one table lookup over all names, summed per name with np.add.reduceat."""
+    lengths = np.fromiter(map(len, names), dtype=np.int64, count=len(names))
+    scores = _LETTER_TABLE[np.frombuffer("".join(names).encode("ascii"), dtype=np.uint8)]
+    sums = np.zeros(len(names), dtype=np.int64)
+    non_empty = lengths > 0
+    if non_empty.any():
+        # reduceat needs strictly valid start offsets, so empty names are left at 0
+        starts = (np.cumsum(lengths) - lengths)[non_empty]
+        sums[non_empty] = np.add.reduceat(scores, starts)
+    return sums
+
+
+def batch_destiny(names):
+    """
+    Destiny (Expression) Numbers for a sequence of full names, as an int64 array.
+    ASCII names are scored as arrays; other names use the scalar function
+    (str.upper can expand some letters, e.g. 'ß' -> 'SS').
+    """
+    names = list(names)
+    if "".join(names).isascii():
+        return reduce_numbers(_score_ascii_names(names))
+
+    result = np.zeros(len(names), dtype=np.int64)
+    ascii_rows = [row for row, name in enumerate(names) if name.isascii()]
+    for row, name in enumerate(names):
+        if not name.isascii():
+            result[row] = calculate_destiny_number(name)
+    if ascii_rows:
+        result[ascii_rows] = reduce_numbers(_score_ascii_names([names[row] for row in ascii_rows]))
+    return result
+
+
+def batch_numerology(dobs, names):
+    """Returns (life_path_numbers, destiny_numbers) arrays for parallel sequences of DOBs and names."""
+    return batch_life_path(dobs), batch_destiny(names)
@@ -0,0 +1,106 @@
+import os
+import datetime
+import razorpay
+from dotenv import load_dotenv
+from razorpay.errors import BadRequestError, ServerError
+
+load_dotenv()
+
+# --- Razorpay Configuration (loaded from .env) ---
+RAZORPAY_KEY_ID = os.getenv("RAZORPAY_KEY_ID")
+RAZORPAY_KEY_SECRET = os.getenv("RAZORPAY_KEY_SECRET")
+RAZORPAY_BASE_URL = os.getenv("RAZORPAY_BASE_URL") # e.g. the local fake for load tests (benchmarks/fake_openai.py)
+
+# Initialize Razorpay client
+if RAZORPAY_KEY_ID and RAZORPAY_KEY_SECRET:
+    razorpay_options = {"base_url": RAZORPAY_BASE_URL} if RAZORPAY_BASE_URL else {}
+    razorpay_client = razorpay.Client(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET), **razorpay_options)
+else:
+    razorpay_client = None
+    print("WARNING: Razorpay API keys are not loaded. Payment functionality will be disabled.")
+
+
+# Shared by the Flask app (main.py) and the ASGI app (asgi.py). The Razorpay client is blocking,
+# so the ASGI app calls these from a worker thread. Each returns (response body, HTTP status).
+
+def create_payment_order(data):
+    """Creates a Razorpay order for an /api/create-order payload."""
+    if not razorpay_client:
+        return {"status": "error", "message": "Razorpay not configured."}, 500
+
+    amount_in_inr = (data or {}).get('amount')
+    if not amount_in_inr:
+        return {"status": "error", "message": "Amount is required."}, 400
+
+    amount_in_paise = int(amount_in_inr * 100) # Razorpay expects amount in smallest currency unit (paise)
+
+    try:
+        receipt_id = f"rcpt_{datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')}"
+        order_details = razorpay_client.order.create({
+            "amount": amount_in_paise,
+            "currency": "INR",
+            "receipt": receipt_id,
+            "payment_capture": '1' # Auto capture payment
+        })
+        print(f"DEBUG: Razorpay order created: {order_details}")
+
+        return {
+            "order_id": order_details['id'],
+            "amount": order_details['amount'],
+            "currency": order_details['currency'],
+            "key_id": RAZORPAY_KEY_ID # Send Key ID to frontend for checkout.js
+        }, 200
+    except BadRequestError as e:
+        print(f"ERROR: Razorpay BadRequestError: {e}")
+        return {"status": "error", "message": f"Razorpay error: {e.description}"}, 400
+    except ServerError as e:
+        print(f"ERROR: Razorpay ServerError: {e}")
+        return {"status": "error", "message": "Razorpay service is temporarily unavailable."}, 503
+    except Exception as e:
+        print(f"ERROR: Failed to create order: {e}")
+        return {"status": "error", "message": "Failed to create payment order."}, 500
+
+
+def handle_webhook_event(payload):
+    """Handles a Razorpay webhook payload."""
+    # Placeholder for webhook. For robust production, verify signature.
+    # from razorpay.utils import verify_webhook_signature
+    # WEBHOOK_SECRET = os.getenv("RAZORPAY_WEBHOOK_SECRET")
+    # try:
+    #     verify_webhook_signature(request.data, request.headers.get('X-Razorpay-Signature'), WEBHOOK_SECRET)
+    # except Exception as e:
+    #     print(f"ERROR: Webhook signature verification failed: {e}")
+    #     return {"status": "error", "message": "Invalid webhook signature."}, 400
+
+    event = payload.get('event')
+    print(f"DEBUG: Received Razorpay webhook event: {event}")
+
+    if event == 'payment.captured':
+        payment_id = payload['payload']['payment']['entity']['id']
+        order_id = payload['payload']['payment']['entity']['order_id']
+        amount = payload['payload']['payment']['entity']['amount']
+        print(f"INFO: Payment captured - Payment ID: {payment_id}, Order ID: {order_id}, Amount: {amount}")
+
+    return {"status": "success", "message": "Webhook received."}, 200
+
+
+def verify_payment(data):
+    """
+    For a production app, you would VERIFY the Razorpay payment details here again
+    using razorpay_client.utility.verify_payment_signature to prevent fraud.
+    Returns an error message, or None if the payment is accepted.
+    """
+    # We are skipping for quick setup, relying on frontend callback and webhook for now.
+    # from razorpay.utils import verify_payment_signature
+    # params_dict = {
+    #     'razorpay_order_id': data['razorpay_order_id'],
+    #     'razorpay_payment_id': data['razorpay_payment_id'],
+    #     'razorpay_signature': data['razorpay_signature']
+    # }
+    # try:
+    #     razorpay_client.utility.verify_payment_signature(params_dict)
+    #     print("DEBUG: Razorpay signature verified successfully.")
+    # except Exception as e:
+    #     print(f"ERROR: Razorpay signature verification failed: {e}")
+    #     return "Payment verification failed."
+    return None
@@ -1,35 +1,14 @@
 import os
-from flask import render_template_string
-from weasyprint import HTML, CSS
+import io
+import functools
+from jinja2 import Environment, DictLoader
+from weasyprint import HTML, CSS, default_url_fetcher
+from weasyprint.text.fonts import FontConfiguration
 from datetime import datetime
+from utils.images import PalmImage, image_data_url
 
-def generate_pdf_report(
-    user_details, numerology_data, report_content, left_palm_image_base64, right_palm_image_base64, language, report_type,
-    person2_details=None, numerology_data_p2=None, person2_left_palm_image_base64=None, person2_right_palm_image_base64=None
-):
-    """
-    Generates a PDF report for individual or couple, from AI-generated content and user details.
-    Uses an HTML template to structure the PDF.
-    """
-    output_dir = "temp_reports"
-    os.makedirs(output_dir, exist_ok=True)
-
-    # --- Generate dynamic PDF filename ---
-    if report_type == 'individual':
-        sanitized_name = "".join(e for e in user_details['person1_name'] if e.isalnum())
-        dob_for_filename = user_details['person1_dob'].replace('-', '')
-        pdf_filename = f"Palm_Path_Report_{sanitized_name}_{dob_for_filename}_{datetime.now().strftime('%Y%m%d%H%M%S')}.pdf"
-    elif report_type == 'couple' and person2_details:
-        sanitized_name1 = "".join(e for e in user_details['person1_name'] if e.isalnum())
-        sanitized_name2 = "".join(e for e in person2_details['person2_name'] if e.isalnum())
-        pdf_filename = f"Couple_Report_{sanitized_name1}_{sanitized_name2}_{datetime.now().strftime('%Y%m%d%H%M%S')}.pdf"
-    else:
-        pdf_filename = f"Report_{datetime.now().strftime('%Y%m%d%H%M%S')}.pdf" # Fallback
-
-    pdf_path = os.path.join(output_dir, pdf_filename)
-
-    # --- Basic CSS for the PDF ---
-    report_css = """
+# --- Basic CSS for the PDF ---
+REPORT_CSS = """
     @page { size: A4; margin: 1in; }
     body { font-family: 'Times New Roman', serif; line-height: 1.6; color: #333; }
     h1, h2, h3, h4 { color: #0056b3; font-family: 'Georgia', serif; margin-top: 1.5em; margin-bottom: 0.5em; }
@@ -57,34 +36,14 @@ def generate_pdf_report(
     .person-section { margin-top: 2em; border-left: 5px solid #007bff; padding-left: 1em; }
     """
 
-    # Prepare data for the template
-    template_data = {
-        'user': user_details,
-        'numerology': numerology_data,
-        'report_content': report_content,
-        'left_palm_image_base64': left_palm_image_base64,
-        'right_palm_image_base64': right_palm_image_base64,
-        'language': language,
-        'report_type': report_type,
-        'generated_date': datetime.now().strftime("%B %d, %Y"),
-        'person2': person2_details, # For couple reports
-        'numerology_p2': numerology_data_p2, # For couple reports
-        'person2_left_palm_image_base64': person2_left_palm_image_base64,
-        'person2_right_palm_image_base64': person2_right_palm_image_base64
-    }
-
-    # --- HTML Template for the PDF ---
-    # IMPORTANT: Removed the 'f' prefix here. This is a regular multi-line string
-    # that will be interpreted by Jinja2 via render_template_string.
-    html_content = """
+# --- HTML Template for the PDF ---
+# Rendered by Jinja2 (autoescaped, like Flask's render_template_string); covers both report types.
+REPORT_TEMPLATE = """
     <!DOCTYPE html>
-    <html lang="{language}">
+    <html lang="{{ language }}">
     <head>
         <meta charset="UTF-8">
         <title>Palm & Path AI Report - {% if report_type == 'individual' %}{{ user.person1_name }}{% else %}{{ user.person1_name }} & {{ person2.person2_name }}{% endif %}</title>
-        <style>
-            {report_css}
-        </style>
     </head>
     <body>
         <div class="header-info">
@@ -126,14 +85,14 @@ def generate_pdf_report(
                 <h2>Your Palmistry Insights</h2>
                 {% if left_palm_image_base64 %}
                 <h3 class="text-center">Left Palm Overview</h3>
-                <img class="img-fluid" src="data:image/jpeg;base64,{{ left_palm_image_base64 }}" alt="Left Palm" />
+                <img class="img-fluid" src="{{ left_palm_image_base64 | image_src }}" alt="Left Palm" />
                 {% endif %}
                 <h3>Detailed Left Palm Analysis</h3>
                 <p>{{ report_content.left_palm_detailed | safe }}</p>
 
                 {% if right_palm_image_base64 %}
                 <h3 class="text-center">Right Palm Insights</h3>
-                <img class="img-fluid" src="data:image/jpeg;base64,{{ right_palm_image_base64 }}" alt="Right Palm" />
+                <img class="img-fluid" src="{{ right_palm_image_base64 | image_src }}" alt="Right Palm" />
                 {% endif %}
                 <h3>Detailed Right Palm Analysis</h3>
                 <p>{{ report_content.right_palm_detailed | safe }}</p>
@@ -178,14 +137,14 @@ def generate_pdf_report(
                 <div class="person-section">
                     {% if left_palm_image_base64 %}
                     <h3 class="text-center">Left Palm Overview</h3>
-                    <img class="img-fluid" src="data:image/jpeg;base64,{{ left_palm_image_base64 }}" alt="Left Palm of {{ user.person1_name }}" />
+                    <img class="img-fluid" src="{{ left_palm_image_base64 | image_src }}" alt="Left Palm of {{ user.person1_name }}" />
                     {% endif %}
                     <h3>Detailed Left Palm Analysis</h3>
                     <p>{{ report_content.person1_left_palm | safe }}</p>
 
                     {% if right_palm_image_base64 %}
                     <h3 class="text-center">Right Palm Insights</h3>
-                    <img class="img-fluid" src="data:image/jpeg;base64,{{ right_palm_image_base64 }}" alt="Right Palm of {{ user.person1_name }}" />
+                    <img class="img-fluid" src="{{ right_palm_image_base64 | image_src }}" alt="Right Palm of {{ user.person1_name }}" />
                     {% endif %}
                     <h3>Detailed Right Palm Analysis</h3>
                     <p>{{ report_content.person1_right_palm | safe }}</p>
@@ -211,14 +170,14 @@ def generate_pdf_report(
                 <div class="person-section">
                     {% if person2_left_palm_image_base64 %}
                     <h3 class="text-center">Left Palm Overview</h3>
-                    <img class="img-fluid" src="data:image/jpeg;base64,{{ person2_left_palm_image_base64 }}" alt="Left Palm of {{ person2.person2_name }}" />
+                    <img class="img-fluid" src="{{ person2_left_palm_image_base64 | image_src }}" alt="Left Palm of {{ person2.person2_name }}" />
                     {% endif %}
                     <h3>Detailed Left Palm Analysis</h3>
                     <p>{{ report_content.person2_left_palm | safe }}</p>
 
                     {% if person2_right_palm_image_base64 %}
                     <h3 class="text-center">Right Palm Insights</h3>
-                    <img class="img-fluid" src="data:image/jpeg;base64,{{ person2_right_palm_image_base64 }}" alt="Right Palm of {{ person2.person2_name }}" />
+                    <img class="img-fluid" src="{{ person2_right_palm_image_base64 | image_src }}" alt="Right Palm of {{ person2.person2_name }}" />
                     {% endif %}
                     <h3>Detailed Right Palm Analysis</h3>
                     <p>{{ report_content.person2_right_palm | safe }}</p>
@@ -268,14 +227,123 @@ def generate_pdf_report(
     </body>
     </html>
     """
-    rendered_html = render_template_string(html_content, **template_data)
-    HTML(string=rendered_html).write_pdf(pdf_path, stylesheets=[CSS(string=report_css)])
 
-    return pdf_path
+def image_src(image):
+    """
+    The <img> src of a palm image: its palm:// URL for a PalmImage (served by palm_url_fetcher
+    from the shared bytes), or a data: URL for a plain base64 string.
+    """
+    return image.url if isinstance(image, PalmImage) else image_data_url(image)
+
+
+def palm_url_fetcher(images):
+    """
+    WeasyPrint url_fetcher that serves the palm:// URLs of `images` straight from their bytes,
+    instead of WeasyPrint decoding base64 data: URLs out of the HTML. Other URLs go to the default fetcher.
+    """
+    by_url = {image.url: image for image in images if isinstance(image, PalmImage)}
+
+    def fetch(url, timeout=10, ssl_context=None):
+        image = by_url.get(url)
+        if image is None:
+            return default_url_fetcher(url, timeout=timeout, ssl_context=ssl_context)
+        return {'string': image.data, 'mime_type': image.mime_type, 'redirected_url': url}
+
+    return fetch
+
+
+# Module-level template environment: each template is compiled on first use and reused afterwards
+_template_env = Environment(loader=DictLoader({'report.html': REPORT_TEMPLATE}), autoescape=True)
+_template_env.filters['image_src'] = image_src
+
+
+@functools.lru_cache(maxsize=None)
+def get_report_stylesheet():
+    """
+    Returns the parsed report stylesheet and its font configuration, built once per process.
+    WeasyPrint reuses the font configuration across renders, so fonts are only discovered once.
+    """
+    font_config = FontConfiguration()
+    return CSS(string=REPORT_CSS, font_config=font_config), font_config
+
+
+def render_report_html(template_data):
+    """Renders the report HTML from the precompiled template."""
+    return _template_env.get_template('report.html').render(**template_data)
+
+
+def build_report_filename(user_details, report_type, person2_details=None):
+    """Returns the download filename for a report."""
+    # --- Generate dynamic PDF filename ---
+    if report_type == 'individual':
+        sanitized_name = "".join(e for e in user_details['person1_name'] if e.isalnum())
+        dob_for_filename = user_details['person1_dob'].replace('-', '')
+        pdf_filename = f"Palm_Path_Report_{sanitized_name}_{dob_for_filename}_{datetime.now().strftime('%Y%m%d%H%M%S')}.pdf"
+    elif report_type == 'couple' and person2_details:
+        sanitized_name1 = "".join(e for e in user_details['person1_name'] if e.isalnum())
+        sanitized_name2 = "".join(e for e in person2_details['person2_name'] if e.isalnum())
+        pdf_filename = f"Couple_Report_{sanitized_name1}_{sanitized_name2}_{datetime.now().strftime('%Y%m%d%H%M%S')}.pdf"
+    else:
+        pdf_filename = f"Report_{datetime.now().strftime('%Y%m%d%H%M%S')}.pdf" # Fallback
+    return pdf_filename
+
+
+def generate_pdf_report(
+    user_details, numerology_data, report_content, left_palm_image_base64, right_palm_image_base64, language, report_type,
+    person2_details=None, numerology_data_p2=None, person2_left_palm_image_base64=None, person2_right_palm_image_base64=None,
+    target=None
+):
+    """
+    Generates a PDF report for individual or couple, from AI-generated content and user details.
+    Uses an HTML template to structure the PDF.
+    Palm images are PalmImage handles (base64 strings still work).
+    By default the PDF is written to temp_reports/ and its path is returned. If `target` is a
+    file-like object, the PDF is written into it instead and the download filename is returned.
+    """
+    pdf_filename = build_report_filename(user_details, report_type, person2_details)
+    if target is None:
+        output_dir = "temp_reports"
+        os.makedirs(output_dir, exist_ok=True)
+        pdf_path = os.path.join(output_dir, pdf_filename)
+
+    # Prepare data for the template
+    template_data = {
+        'user': user_details,
+        'numerology': numerology_data,
+        'report_content': report_content,
+        'left_palm_image_base64': left_palm_image_base64,
+        'right_palm_image_base64': right_palm_image_base64,
+        'language': language,
+        'report_type': report_type,
+        'generated_date': datetime.now().strftime("%B %d, %Y"),
+        'person2': person2_details, # For couple reports
+        'numerology_p2': numerology_data_p2, # For couple reports
+        'person2_left_palm_image_base64': person2_left_palm_image_base64,
+        'person2_right_palm_image_base64': person2_right_palm_image_base64,
+    }
+
+    stylesheet, font_config = get_report_stylesheet()
+    rendered_html = render_report_html(template_data)
+    url_fetcher = palm_url_fetcher([left_palm_image_base64, right_palm_image_base64,
+                                    person2_left_palm_image_base64, person2_right_palm_image_base64])
+    HTML(string=rendered_html, url_fetcher=url_fetcher).write_pdf(pdf_path if target is None else target,
+                                                                  stylesheets=[stylesheet], font_config=font_config)
+
+    return pdf_path if target is None else pdf_filename
+
+
+def generate_pdf_bytes(*args, **kwargs):
+    """
+    Same arguments as generate_pdf_report, but renders into memory and returns
+    (filename, pdf_bytes). Picklable, so it can run in the render pool.
+    """
+    buffer = io.BytesIO()
+    pdf_filename = generate_pdf_report(*args, target=buffer, **kwargs)
+    return pdf_filename, buffer.getvalue()
 
 if __name__ == '__main__':
     # This block allows you to test PDF generation directly
-    from numerology import get_numerology_insights
+    from utils.numerology import get_numerology_insights # Run from backend/: python -m utils.pdf
 
     # Dummy image base64
     dummy_image_base64 = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII="
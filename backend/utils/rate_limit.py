@@ -0,0 +1,178 @@
+import os
+import time
+import random
+import asyncio
+import sqlite3
+import threading
+from utils import metrics
+
+# --- Rate Limit Configuration ---
+# The account's OpenAI limits for the model in use; 0 turns that bucket off (both 0: no limiter).
+# Set them a little below the real limits, as token counts are estimated before the call.
+OPENAI_TPM_LIMIT = int(os.getenv("OPENAI_TPM_LIMIT", "0"))
+OPENAI_RPM_LIMIT = int(os.getenv("OPENAI_RPM_LIMIT", "0"))
+OPENAI_RATE_LIMIT_BACKEND = os.getenv("OPENAI_RATE_LIMIT_BACKEND", "sqlite").lower() # 'sqlite' (shared by all workers on the host) or 'memory'
+OPENAI_RATE_LIMIT_PATH = os.getenv("OPENAI_RATE_LIMIT_PATH", "openai_rate_limit.sqlite3")
+# Share of each bucket that only first attempts may use, so retries can't starve in-progress reports
+OPENAI_RATE_LIMIT_RETRY_RESERVE = float(os.getenv("OPENAI_RATE_LIMIT_RETRY_RESERVE", "0.2"))
+# Prompt tokens counted per image (a 1024px palm photo at high detail is 765 tokens)
+OPENAI_IMAGE_TOKEN_ESTIMATE = int(os.getenv("OPENAI_IMAGE_TOKEN_ESTIMATE", "765"))
+
+
+def estimate_tokens(messages, max_tokens):
+    """
+    Tokens a chat completion counts against the TPM limit: the prompt (about 4 characters per
+    token, plus a fixed cost per image) and max_tokens, which OpenAI reserves up front.
+    """
+    characters, images = 0, 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            characters += len(content)
+            continue
+        for part in content or ():
+            if part.get("type") == "image_url":
+                images += 1
+            else:
+                characters += len(part.get("text", ""))
+    return characters // 4 + 4 * len(messages) + images * OPENAI_IMAGE_TOKEN_ESTIMATE + max_tokens
+
+
+class _TokenBucketLimiter:
+    """
+    Token buckets for OpenAI tokens and requests per minute, refilled continuously. A request
+    takes from every bucket at once or waits. Retries must leave `retry_reserve` of each bucket
+    untouched. Subclasses keep the bucket state and run _take atomically.
+    """
+
+    # Whether _transaction may block on I/O (acquire then runs it in a thread)
+    blocking = False
+
+    def __init__(self, tokens_per_minute=OPENAI_TPM_LIMIT, requests_per_minute=OPENAI_RPM_LIMIT,
+                 retry_reserve=OPENAI_RATE_LIMIT_RETRY_RESERVE):
+        self.capacities = {name: limit for name, limit in (("tokens", tokens_per_minute), ("requests", requests_per_minute))
+                           if limit > 0}
+        self.retry_reserve = retry_reserve
+
+    def _take(self, state, tokens, retry, now):
+        """
+        Refills `state` ({bucket: (level, updated_at)}, missing buckets start full) and takes the
+        request's share if every bucket has it. Returns (new state, seconds to wait; 0 if taken).
+        """
+        costs = {"tokens": tokens, "requests": 1}
+        levels, wait = {}, 0.0
+        for name, capacity in self.capacities.items():
+            level, updated_at = state.get(name, (capacity, now))
+            rate = capacity / 60.0
+            levels[name] = min(capacity, level + max(0.0, now - updated_at) * rate)
+            # Requests larger than a whole bucket still go through once it is full
+            cost = min(costs[name], capacity)
+            needed = min(capacity, cost + (self.retry_reserve * capacity if retry else 0))
+            if levels[name] < needed:
+                wait = max(wait, (needed - levels[name]) / rate)
+        if wait == 0:
+            for name, capacity in self.capacities.items():
+                levels[name] -= min(costs[name], capacity)
+        return {name: (level, now) for name, level in levels.items()}, wait
+
+    def try_acquire(self, tokens, retry=False):
+        """Takes `tokens` (and one request) if available now. Returns the seconds to wait otherwise (0 when taken)."""
+        return self._transaction(lambda state, now: self._take(state, tokens, retry, now))
+
+    def drain(self):
+        """Empties the buckets, e.g. after OpenAI answered 429, so every worker backs off together."""
+        self._transaction(lambda state, now: ({name: (0.0, now) for name in self.capacities}, 0.0))
+
+    async def try_acquire_async(self, tokens, retry=False):
+        """try_acquire() for callers on an event loop; a blocking backend runs it in a thread."""
+        if self.blocking:
+            return await asyncio.to_thread(self.try_acquire, tokens, retry)
+        return self.try_acquire(tokens, retry)
+
+    async def drain_async(self):
+        """drain() for callers on an event loop; a blocking backend runs it in a thread."""
+        if self.blocking:
+            await asyncio.to_thread(self.drain)
+        else:
+            self.drain()
+
+    async def acquire(self, tokens, retry=False, timeout=None):
+        """Waits until the request fits in the buckets. Returns False if that would take longer than `timeout` seconds."""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        while True:
+            wait = await self.try_acquire_async(tokens, retry)
+            waited = loop.time() - started
+            if wait == 0:
+                if waited > 0:
+                    metrics.OPENAI_RATE_LIMIT_WAIT.observe(waited, priority="retry" if retry else "first_attempt")
+                return True
+            if timeout is not None and waited + wait > timeout:
+                return False
+            # Re-check at least every second; the jitter keeps waiting workers from waking in lockstep
+            await asyncio.sleep(min(wait, 1.0) * random.uniform(1.0, 1.2))
+
+
+class MemoryRateLimiter(_TokenBucketLimiter):
+    """Buckets local to this process (one worker, or tests)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._state = {}
+        self._lock = threading.Lock()
+
+    def _transaction(self, update):
+        with self._lock:
+            self._state, wait = update(self._state, time.time())
+        return wait
+
+
+class SQLiteRateLimiter(_TokenBucketLimiter):
+    """Buckets in a SQLite file, shared by every Gunicorn worker on the host."""
+
+    blocking = True
+
+    def __init__(self, path=OPENAI_RATE_LIMIT_PATH, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS rate_limit_buckets (name TEXT PRIMARY KEY, level REAL NOT NULL, updated_at REAL NOT NULL)")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _transaction(self, update):
+        conn = self._connect()
+        try:
+            # IMMEDIATE takes the write lock up front, so read-refill-take is atomic across processes
+            conn.execute("BEGIN IMMEDIATE")
+            state = {name: (level, updated_at) for name, level, updated_at in
+                     conn.execute("SELECT name, level, updated_at FROM rate_limit_buckets")}
+            state, wait = update(state, time.time())
+            conn.executemany("INSERT OR REPLACE INTO rate_limit_buckets (name, level, updated_at) VALUES (?, ?, ?)",
+                             [(name, level, updated_at) for name, (level, updated_at) in state.items()])
+            conn.execute("COMMIT")
+            return wait
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+
+def create_rate_limiter(backend=OPENAI_RATE_LIMIT_BACKEND, tokens_per_minute=OPENAI_TPM_LIMIT,
+                        requests_per_minute=OPENAI_RPM_LIMIT, path=OPENAI_RATE_LIMIT_PATH):
+    """Builds the limiter selected by OPENAI_RATE_LIMIT_BACKEND. Returns None when no limit is configured."""
+    if tokens_per_minute <= 0 and requests_per_minute <= 0:
+        return None
+    if backend == "sqlite":
+        return SQLiteRateLimiter(path, tokens_per_minute, requests_per_minute)
+    if backend != "memory":
+        print(f"WARNING: Unknown OPENAI_RATE_LIMIT_BACKEND '{backend}'. Falling back to a per-process limiter.")
+    return MemoryRateLimiter(tokens_per_minute, requests_per_minute)
+
+
+openai_rate_limiter = create_rate_limiter()
@@ -0,0 +1,134 @@
+import os
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from utils.pdf import generate_pdf_report, generate_pdf_bytes
+
+# --- Render Pool Configuration ---
+# Each web worker process owns one pool, so total render processes = web workers x PDF_RENDER_WORKERS.
+# PDF_RENDER_WORKERS=0 renders in a thread of the web worker instead (no extra processes).
+PDF_RENDER_WORKERS = int(os.getenv("PDF_RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_RENDER_QUEUE_DEPTH = int(os.getenv("PDF_RENDER_QUEUE_DEPTH", "32")) # Renders queued or running per pool
+PDF_RENDER_TIMEOUT = float(os.getenv("PDF_RENDER_TIMEOUT", "120")) # Seconds a caller waits for one render
+
+
+class RenderQueueFullError(RuntimeError):
+    """Raised when PDF_RENDER_QUEUE_DEPTH renders are already queued or running."""
+
+
+class RenderTimeoutError(TimeoutError):
+    """Raised when a render does not finish within PDF_RENDER_TIMEOUT."""
+
+
+_pool = None
+# Used when PDF_RENDER_WORKERS=0. WeasyPrint holds the GIL, so more threads would not help.
+_inline_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pdf-render")
+_pool_lock = threading.Lock()
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+
+
+def _warm_up_worker():
+    """
+    Runs once in every render process: imports WeasyPrint, parses the stylesheet, loads
+    fonts and lays out a tiny document, so the first real report doesn't pay for it.
+    """
+    from weasyprint import HTML
+    from utils.pdf import get_report_stylesheet
+    stylesheet, font_config = get_report_stylesheet()
+    HTML(string="<p>warm-up</p>").write_pdf(stylesheets=[stylesheet], font_config=font_config)
+
+
+def _ping():
+    return os.getpid()
+
+
+def start_render_pool():
+    """
+    Creates the render pool (if enabled) and pre-forks all of its workers.
+    Uses the 'spawn' start method: forking a multi-threaded web worker is unsafe.
+    """
+    global _pool
+    if PDF_RENDER_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=PDF_RENDER_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_warm_up_worker,
+            )
+            # Worker processes are otherwise started lazily; one task per worker starts them all now
+            for _ in range(PDF_RENDER_WORKERS):
+                _pool.submit(_ping)
+            print(f"INFO: Started PDF render pool with {PDF_RENDER_WORKERS} workers.")
+        return _pool
+
+
+def _reset_broken_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _release_slot(_future=None):
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight -= 1
+
+
+def render_queue_depth():
+    """Number of renders currently queued or running in this process's pool."""
+    return _in_flight
+
+
+async def _render(render_fn, *args, **kwargs):
+    """Runs `render_fn` in the render pool, enforcing the queue depth and timeout."""
+    global _in_flight
+    with _in_flight_lock:
+        if _in_flight >= PDF_RENDER_QUEUE_DEPTH:
+            raise RenderQueueFullError("PDF rendering is at capacity. Please retry shortly.")
+        _in_flight += 1
+
+    try:
+        executor = start_render_pool() or _inline_executor
+        try:
+            future = executor.submit(render_fn, *args, **kwargs)
+        except BrokenProcessPool:
+            # A worker died since the last render finished: the pool refuses new work, so replace it and retry once
+            print("ERROR: PDF render pool broke (a worker died). Recreating it.")
+            _reset_broken_pool(executor)
+            executor = start_render_pool()
+            future = executor.submit(render_fn, *args, **kwargs)
+    except BaseException:
+        _release_slot()
+        raise
+
+    # The slot is released when the render actually finishes, not when the caller gives up,
+    # so a timed-out render that is still occupying a worker keeps counting against the depth.
+    future.add_done_callback(_release_slot)
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), PDF_RENDER_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise RenderTimeoutError(f"PDF rendering took longer than {PDF_RENDER_TIMEOUT:.0f}s.") from None
+    except BrokenProcessPool:
+        print("ERROR: PDF render pool broke (a worker died). It will be recreated on the next render.")
+        _reset_broken_pool(executor)
+        raise
+
+
+async def render_pdf_report(*args, **kwargs):
+    """
+    Awaitable wrapper around generate_pdf_report that runs it in the render pool.
+    Takes the same arguments and returns the same result.
+    """
+    return await _render(generate_pdf_report, *args, **kwargs)
+
+
+async def render_pdf_bytes(*args, **kwargs):
+    """Awaitable wrapper around generate_pdf_bytes; returns (filename, pdf_bytes)."""
+    return await _render(generate_pdf_bytes, *args, **kwargs)
@@ -0,0 +1,405 @@
+import os
+import json
+import time
+import queue
+import asyncio
+import threading
+from utils.numerology import get_numerology_insights
+from utils.gpt import generate_full_report_content, stream_full_report_content, openai_session
+from utils.render_pool import render_pdf_report, render_pdf_bytes
+from utils.report_store import report_store
+from utils import metrics
+from utils.images import normalize_palm_image, InvalidImageError
+from utils.uploads import load_palm_upload, UnknownUploadError
+from utils.idempotency import report_idempotency, SUCCEEDED, FAILED
+
+
+class ReportRequestError(ValueError):
+    """Raised when a report request payload is missing or has invalid fields."""
+
+
+REQUIRED_FIELDS_COMMON = ['language', 'razorpay_payment_id', 'razorpay_order_id', 'razorpay_signature']
+REQUIRED_FIELDS_INDIVIDUAL = ['personal_details', 'left_palm_image_base64', 'right_palm_image_base64']
+REQUIRED_FIELDS_COUPLE = [
+    'person1_details', 'person1_left_palm_image_base64', 'person1_right_palm_image_base64',
+    'person2_details', 'person2_left_palm_image_base64', 'person2_right_palm_image_base64'
+]
+
+
+def _has_field(data, field):
+    """Image fields may be sent inline as *_image_base64 or as an uploaded *_image_id."""
+    if data.get(field):
+        return True
+    return field.endswith('_image_base64') and bool(data.get(field.replace('_image_base64', '_image_id')))
+
+
+def _load_palm_image(data, field):
+    """
+    Returns normalized PalmImageVariants for an image field, from an upload id or inline base64.
+    The inline base64 string is dropped from `data` once decoded, so it can be freed early.
+    """
+    image_id = data.get(field.replace('_image_base64', '_image_id'))
+    if image_id:
+        return load_palm_upload(image_id)
+    return normalize_palm_image(data.pop(field))
+
+
+def parse_report_request(data, require_payment=True):
+    """
+    Validates a /api/generate-report payload and returns the keyword arguments
+    for run_report_pipeline. Raises ReportRequestError on invalid input.
+    `require_payment=False` skips the Razorpay fields (offline batch orders).
+    """
+    if not data:
+        raise ReportRequestError("Request body must be JSON.")
+
+    # Determine report type and required fields
+    report_type = data.get('report_type')
+    if report_type not in ['individual', 'couple']:
+        raise ReportRequestError("Invalid report type specified.")
+
+    # Validate common fields
+    for field in REQUIRED_FIELDS_COMMON if require_payment else ['language']:
+        if not _has_field(data, field):
+            raise ReportRequestError(f"Missing common required data: {field}")
+
+    # Validate report-specific fields and prepare data structures
+    user_details = {}
+    person2_details = None
+    person2_left_palm_image_base64 = None
+    person2_right_palm_image_base64 = None
+
+    if report_type == 'individual':
+        for field in REQUIRED_FIELDS_INDIVIDUAL:
+            if not _has_field(data, field):
+                raise ReportRequestError(f"Missing individual report data: {field}")
+
+        user_details = data['personal_details'] # This is person1_details
+        user_details['person1_name'] = user_details.get('name') # Alias for consistency
+        user_details['person1_dob'] = user_details.get('dob')
+        user_details['person1_gender'] = user_details.get('gender')
+
+        left_palm_field, right_palm_field = 'left_palm_image_base64', 'right_palm_image_base64'
+
+    elif report_type == 'couple':
+        for field in REQUIRED_FIELDS_COUPLE:
+            if not _has_field(data, field):
+                raise ReportRequestError(f"Missing couple report data: {field}")
+
+        # Person 1 details
+        user_details = data['person1_details']
+        user_details['person1_name'] = user_details.get('name') # Alias for consistency
+        user_details['person1_dob'] = user_details.get('dob')
+        user_details['person1_gender'] = user_details.get('gender')
+        left_palm_field, right_palm_field = 'person1_left_palm_image_base64', 'person1_right_palm_image_base64'
+
+        # Person 2 details
+        person2_details = data['person2_details']
+        person2_details['person2_name'] = person2_details.get('name') # Alias for consistency
+        person2_details['person2_dob'] = person2_details.get('dob')
+        person2_details['person2_gender'] = person2_details.get('gender')
+
+    # Uploaded images are already normalized; inline ones are decoded, oriented, downscaled and recompressed once here
+    try:
+        left_palm_image_base64 = _load_palm_image(data, left_palm_field)
+        right_palm_image_base64 = _load_palm_image(data, right_palm_field)
+        if report_type == 'couple':
+            person2_left_palm_image_base64 = _load_palm_image(data, 'person2_left_palm_image_base64')
+            person2_right_palm_image_base64 = _load_palm_image(data, 'person2_right_palm_image_base64')
+    except (InvalidImageError, UnknownUploadError) as e:
+        raise ReportRequestError(str(e)) from e
+
+    return {
+        'user_details': user_details,
+        'left_palm_image_base64': left_palm_image_base64,
+        'right_palm_image_base64': right_palm_image_base64,
+        'language': data['language'],
+        'report_type': report_type,
+        'person2_details': person2_details,
+        'person2_left_palm_image_base64': person2_left_palm_image_base64,
+        'person2_right_palm_image_base64': person2_right_palm_image_base64,
+    }
+
+
+def _variant(palm_image, name):
+    """Picks one variant of a normalized palm image (None stays None)."""
+    return getattr(palm_image, name) if palm_image is not None else None
+
+
+def _calculate_numerology(user_details, report_type, person2_details, language):
+    """Numerology insights for person 1 and, for couple reports, person 2 (else None)."""
+    print(f"INFO: Calculating numerology for {user_details.get('person1_name')}...")
+    numerology_insights_p1 = get_numerology_insights(user_details['person1_dob'], user_details['person1_name'], language)
+
+    numerology_insights_p2 = None
+    if report_type == 'couple' and person2_details:
+        print(f"INFO: Calculating numerology for {person2_details.get('person2_name')}...")
+        numerology_insights_p2 = get_numerology_insights(person2_details['person2_dob'], person2_details['person2_name'], language)
+    return numerology_insights_p1, numerology_insights_p2
+
+
+async def _render_report(user_details, numerology_insights_p1, report_content_sections,
+                         left_palm_image_base64, right_palm_image_base64, language, report_type,
+                         person2_details, numerology_insights_p2,
+                         person2_left_palm_image_base64, person2_right_palm_image_base64):
+    """Renders the PDF (in the render pool, off the event loop) and returns its download URL."""
+    print("INFO: Generating PDF report...")
+    render_args = (
+        user_details, numerology_insights_p1, report_content_sections,
+        _variant(left_palm_image_base64, 'for_print'), _variant(right_palm_image_base64, 'for_print'),
+        language, report_type,
+        person2_details, numerology_insights_p2,
+        _variant(person2_left_palm_image_base64, 'for_print'), _variant(person2_right_palm_image_base64, 'for_print')
+    )
+    started = time.perf_counter()
+    if report_store is not None:
+        # In-memory output: no temp file, the download endpoint serves straight from the store
+        pdf_filename, pdf_bytes = await render_pdf_bytes(*render_args)
+        metrics.PDF_RENDER_SECONDS.observe(time.perf_counter() - started)
+        metrics.PDF_BYTES.observe(len(pdf_bytes))
+        report_key = await asyncio.to_thread(report_store.put, pdf_filename, pdf_bytes) # Off the loop: hashes (and for SQLite writes) MBs
+        print(f"INFO: PDF generated in memory ({len(pdf_bytes)} bytes) as {report_key}")
+        return f"/api/download-report/{report_key}"
+
+    pdf_path = await render_pdf_report(*render_args)
+    metrics.PDF_RENDER_SECONDS.observe(time.perf_counter() - started)
+    metrics.PDF_BYTES.observe(os.path.getsize(pdf_path))
+    print(f"INFO: PDF generated at {pdf_path}")
+
+    # Construct the download URL relative to the backend
+    download_filename = os.path.basename(pdf_path)
+    return f"/api/download-report/{download_filename}"
+
+
+async def run_report_pipeline(user_details, left_palm_image_base64, right_palm_image_base64, language, report_type,
+                              person2_details=None, person2_left_palm_image_base64=None, person2_right_palm_image_base64=None,
+                              idempotency_key=None):
+    """
+    Runs numerology -> AI content -> PDF for one report and returns the download URL.
+    Palm images are the PalmImageVariants produced by parse_report_request: the vision
+    variant goes to OpenAI and the print variant into the PDF. Metrics recorded along the
+    way are labeled with the report's type and language. `idempotency_key` is a key the
+    caller claimed in report_idempotency; the outcome is recorded there for duplicates.
+    """
+    with metrics.report_context(report_type, language):
+        try:
+            download_url = await _run_report_pipeline(
+                user_details, left_palm_image_base64, right_palm_image_base64, language, report_type,
+                person2_details, person2_left_palm_image_base64, person2_right_palm_image_base64)
+        except Exception as e:
+            metrics.REPORTS_TOTAL.inc(outcome="failed")
+            await _record_outcome(idempotency_key, FAILED, str(e))
+            raise
+        metrics.REPORTS_TOTAL.inc(outcome="succeeded")
+        await _record_outcome(idempotency_key, SUCCEEDED, download_url)
+        return download_url
+
+
+async def _record_outcome(idempotency_key, status, value):
+    """Settles a claimed idempotency key with the download URL or the error."""
+    if idempotency_key is None:
+        return
+    try:
+        if status == SUCCEEDED:
+            await asyncio.to_thread(report_idempotency.complete, idempotency_key, value)
+        else:
+            await asyncio.to_thread(report_idempotency.fail, idempotency_key, value)
+    except Exception as e:
+        # Duplicates then wait out the lease and re-run; the report itself is fine
+        print(f"ERROR: Could not record report outcome for idempotency: {e}")
+
+
+async def _run_report_pipeline(user_details, left_palm_image_base64, right_palm_image_base64, language, report_type,
+                               person2_details, person2_left_palm_image_base64, person2_right_palm_image_base64):
+    # 1. Calculate Numerology Insights
+    numerology_insights_p1, numerology_insights_p2 = _calculate_numerology(user_details, report_type, person2_details, language)
+
+    # 2. Generate Report Content via OpenAI (multiple calls)
+    print("INFO: Generating AI report content...")
+    # Reports usually run on a loop of their own; its OpenAI client is closed once the text is in
+    async with openai_session():
+        report_content_sections = await generate_full_report_content(
+            user_details, numerology_insights_p1,
+            _variant(left_palm_image_base64, 'for_vision'), _variant(right_palm_image_base64, 'for_vision'),
+            language, report_type,
+            person2_details, numerology_insights_p2,
+            _variant(person2_left_palm_image_base64, 'for_vision'), _variant(person2_right_palm_image_base64, 'for_vision')
+        )
+    print("INFO: AI report content generated.")
+
+    # 3. Generate PDF Report
+    return await _render_report(
+        user_details, numerology_insights_p1, report_content_sections,
+        left_palm_image_base64, right_palm_image_base64, language, report_type,
+        person2_details, numerology_insights_p2,
+        person2_left_palm_image_base64, person2_right_palm_image_base64
+    )
+
+
+async def stream_report_pipeline(user_details, left_palm_image_base64, right_palm_image_base64, language, report_type,
+                                 person2_details=None, person2_left_palm_image_base64=None, person2_right_palm_image_base64=None,
+                                 idempotency_key=None):
+    """
+    Streaming counterpart of run_report_pipeline. Yields the 'sections' and 'delta' events of
+    stream_full_report_content, a 'section_done' per finished section, 'rendering' once all text
+    is in, and finally {'event': 'done', 'download_url': ...}.
+    """
+    with metrics.report_context(report_type, language):
+        try:
+            async for event in _stream_report_pipeline(
+                user_details, left_palm_image_base64, right_palm_image_base64, language, report_type,
+                person2_details, person2_left_palm_image_base64, person2_right_palm_image_base64):
+                if event['event'] == 'done':
+                    await _record_outcome(idempotency_key, SUCCEEDED, event['download_url'])
+                yield event
+        except Exception as e:
+            metrics.REPORTS_TOTAL.inc(outcome="failed")
+            await _record_outcome(idempotency_key, FAILED, str(e))
+            raise
+        metrics.REPORTS_TOTAL.inc(outcome="succeeded")
+
+
+async def _stream_report_pipeline(user_details, left_palm_image_base64, right_palm_image_base64, language, report_type,
+                                  person2_details, person2_left_palm_image_base64, person2_right_palm_image_base64):
+    numerology_insights_p1, numerology_insights_p2 = _calculate_numerology(user_details, report_type, person2_details, language)
+
+    section_order = []
+    sections = {}
+    async with openai_session():
+        async for event in stream_full_report_content(
+            user_details, numerology_insights_p1,
+            _variant(left_palm_image_base64, 'for_vision'), _variant(right_palm_image_base64, 'for_vision'),
+            language, report_type,
+            person2_details, numerology_insights_p2,
+            _variant(person2_left_palm_image_base64, 'for_vision'), _variant(person2_right_palm_image_base64, 'for_vision')
+        ):
+            if event['event'] == 'sections':
+                section_order = event['sections']
+            elif event['event'] == 'section':
+                # The browser already has the text from the deltas; only the PDF needs it whole
+                sections[event['section']] = event['text']
+                event = {'event': 'section_done', 'section': event['section']}
+            yield event
+
+    yield {'event': 'rendering'}
+    report_content_sections = {key: sections[key] for key in section_order}
+    download_url = await _render_report(
+        user_details, numerology_insights_p1, report_content_sections,
+        left_palm_image_base64, right_palm_image_base64, language, report_type,
+        person2_details, numerology_insights_p2,
+        person2_left_palm_image_base64, person2_right_palm_image_base64
+    )
+    yield {'event': 'done', 'download_url': download_url}
+
+
+def format_sse_event(event):
+    """Formats one pipeline event as a Server-Sent Event (None becomes a keep-alive comment)."""
+    if event is None:
+        return ": keep-alive\n\n"
+    data = {key: value for key, value in event.items() if key != 'event'}
+    return f"event: {event['event']}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _pump_report_events(report_args, put, finished):
+    """Runs stream_report_pipeline, passing each event to `put`, then `finished`."""
+    try:
+        async for event in stream_report_pipeline(**report_args):
+            put(event)
+    except Exception as e:
+        print(f"ERROR: Error during streamed report generation: {e}")
+        put({'event': 'error', 'message': f"An error occurred during report generation: {e}"})
+    finally:
+        put(finished)
+
+
+def iter_report_events(report_args, keepalive_interval=15):
+    """
+    Runs stream_report_pipeline on its own event loop in a background thread and yields its
+    events to a synchronous caller (a streaming Flask response). Yields None after
+    `keepalive_interval` seconds without an event, and an 'error' event if the pipeline fails.
+    The report keeps generating if the caller stops iterating, so a paid PDF is never lost.
+    """
+    events = queue.Queue()
+    finished = object()
+    threading.Thread(target=asyncio.run, args=(_pump_report_events(report_args, events.put, finished),),
+                     name="report-stream", daemon=True).start()
+    while True:
+        try:
+            event = events.get(timeout=keepalive_interval)
+        except queue.Empty:
+            yield None
+            continue
+        if event is finished:
+            return
+        yield event
+
+
+def _duplicate_report_event(record):
+    """The closing event for a duplicate stream request, or None while the original report is still running."""
+    if record is None:
+        return {'event': 'error', 'message': "The report for this payment could not be completed. Please retry."}
+    if record['status'] == SUCCEEDED:
+        return {'event': 'done', 'download_url': record['download_url']}
+    if record['status'] == FAILED:
+        return {'event': 'error', 'message': f"An error occurred during report generation: {record['error']}"}
+    return None
+
+
+def iter_duplicate_report_events(idempotency_key, keepalive_interval=15):
+    """
+    Events for a stream request whose payment already has a report claimed: keep-alive Nones
+    while the original request generates it, then its 'done' (or an 'error'). Gives up with an
+    'error' once the claim's lease runs out.
+    """
+    deadline = time.time() + report_idempotency.lease
+    while True:
+        record = report_idempotency.wait(idempotency_key, timeout=keepalive_interval)
+        event = _duplicate_report_event(record)
+        if event is not None:
+            yield event
+            return
+        if time.time() >= deadline:
+            yield {'event': 'error', 'message': "The report for this payment is still being generated. Please retry shortly."}
+            return
+        yield None
+
+
+# Streamed reports running on the ASGI server's loop (a task with no reference could be garbage collected)
+_background_reports = set()
+
+
+async def aiter_report_events(report_args, keepalive_interval=15):
+    """
+    Async counterpart of iter_report_events for the ASGI app (asgi.py): runs the pipeline as
+    a task on the running event loop and yields its events, with the same keep-alive Nones.
+    The task keeps running if the client disconnects, so a paid PDF is never lost.
+    """
+    events = asyncio.Queue()
+    finished = object()
+    task = asyncio.create_task(_pump_report_events(report_args, events.put_nowait, finished))
+    _background_reports.add(task)
+    task.add_done_callback(_background_reports.discard)
+    while True:
+        try:
+            event = await asyncio.wait_for(events.get(), keepalive_interval)
+        except asyncio.TimeoutError:
+            yield None
+            continue
+        if event is finished:
+            return
+        yield event
+
+
+async def aiter_duplicate_report_events(idempotency_key, keepalive_interval=15):
+    """Async counterpart of iter_duplicate_report_events for the ASGI app."""
+    deadline = time.time() + report_idempotency.lease
+    while True:
+        record = await report_idempotency.wait_async(idempotency_key, timeout=keepalive_interval)
+        event = _duplicate_report_event(record)
+        if event is not None:
+            yield event
+            return
+        if time.time() >= deadline:
+            yield {'event': 'error', 'message': "The report for this payment is still being generated. Please retry shortly."}
+            return
+        yield None
@@ -0,0 +1,186 @@
+import os
+import time
+import uuid
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+# --- Report Output Configuration ---
+# 'disk' writes PDFs to temp_reports/ (one file per report); 'memory' keeps them in this process;
+# 'sqlite' keeps them as blobs in a local database shared by every web worker on the host.
+REPORT_OUTPUT_MODE = os.getenv("REPORT_OUTPUT_MODE", "disk").lower()
+REPORT_STORE_DB_PATH = os.getenv("REPORT_STORE_DB_PATH", "report_store.sqlite3")
+REPORT_MAX_AGE = int(os.getenv("REPORT_MAX_AGE", "3600")) # Seconds an unclaimed report is kept
+REPORT_STORE_MAX_BYTES = int(os.getenv("REPORT_STORE_MAX_BYTES", str(512 * 1024 * 1024)))
+REPORT_JANITOR_INTERVAL = int(os.getenv("REPORT_JANITOR_INTERVAL", "60"))
+PDF_OUTPUT_DIR = "temp_reports"
+
+
+def _new_report_key(filename):
+    # The random prefix keeps keys unguessable and unique even for identical filenames
+    return f"{uuid.uuid4().hex}-{filename}"
+
+
+def _etag(data):
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+class MemoryReportStore:
+    """Keeps rendered PDFs in this process. Only suitable with a single web worker."""
+
+    def __init__(self):
+        self._reports = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def put(self, filename, data):
+        """Stores a PDF and returns its download key."""
+        key = _new_report_key(filename)
+        entry = {"filename": filename, "data": data, "etag": _etag(data), "created_at": time.time(), "size": len(data)}
+        with self._lock:
+            self._reports[key] = entry
+            self._bytes += len(data)
+        return key
+
+    def get(self, key):
+        with self._lock:
+            return self._reports.get(key)
+
+    def total_bytes(self):
+        return self._bytes
+
+    def evict(self, max_age=REPORT_MAX_AGE, max_bytes=REPORT_STORE_MAX_BYTES):
+        """Drops reports older than `max_age`, then the oldest ones until under `max_bytes`."""
+        cutoff = time.time() - max_age
+        evicted = 0
+        with self._lock:
+            while self._reports:
+                key, entry = next(iter(self._reports.items()))
+                if entry["created_at"] > cutoff and self._bytes <= max_bytes:
+                    break
+                del self._reports[key]
+                self._bytes -= entry["size"]
+                evicted += 1
+        return evicted
+
+
+class SQLiteReportStore:
+    """Keeps rendered PDFs as blobs in a local SQLite file, shared by every web worker on the host."""
+
+    def __init__(self, db_path=REPORT_STORE_DB_PATH):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS reports ("
+                " key TEXT PRIMARY KEY, filename TEXT NOT NULL, data BLOB NOT NULL, etag TEXT NOT NULL,"
+                " size INTEGER NOT NULL, created_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS reports_created_at ON reports (created_at)")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def put(self, filename, data):
+        key = _new_report_key(filename)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO reports (key, filename, data, etag, size, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, filename, data, _etag(data), len(data), time.time())
+            )
+        return key
+
+    def get(self, key):
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM reports WHERE key = ?", (key,)).fetchone()
+        return dict(row) if row else None
+
+    def total_bytes(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COALESCE(SUM(size), 0) FROM reports").fetchone()[0]
+
+    def evict(self, max_age=REPORT_MAX_AGE, max_bytes=REPORT_STORE_MAX_BYTES):
+        with self._connect() as conn:
+            evicted = conn.execute("DELETE FROM reports WHERE created_at < ?", (time.time() - max_age,)).rowcount
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM reports").fetchone()[0]
+            for key, size in conn.execute("SELECT key, size FROM reports ORDER BY created_at").fetchall():
+                if total <= max_bytes:
+                    break
+                conn.execute("DELETE FROM reports WHERE key = ?", (key,))
+                total -= size
+                evicted += 1
+        return evicted
+
+
+def create_report_store(mode=REPORT_OUTPUT_MODE):
+    """Builds the store for REPORT_OUTPUT_MODE; None means PDFs go to disk."""
+    if mode == "memory":
+        return MemoryReportStore()
+    if mode == "sqlite":
+        return SQLiteReportStore()
+    if mode != "disk":
+        print(f"WARNING: Unknown REPORT_OUTPUT_MODE '{mode}'. Writing reports to disk.")
+    return None
+
+
+report_store = create_report_store()
+
+
+def sweep_report_files(output_dir=PDF_OUTPUT_DIR, max_age=REPORT_MAX_AGE, max_bytes=REPORT_STORE_MAX_BYTES):
+    """Deletes PDFs in temp_reports/ that were never downloaded, by age and then by total size."""
+    try:
+        entries = [e for e in os.scandir(output_dir) if e.is_file() and e.name.endswith(".pdf")]
+    except FileNotFoundError:
+        return 0
+    files = []
+    for entry in entries:
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, entry.path))
+    files.sort()
+
+    cutoff = time.time() - max_age
+    total = sum(size for _, size, _ in files)
+    removed = 0
+    for mtime, size, path in files:
+        if mtime >= cutoff and total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass # Downloaded (and deleted) meanwhile, or removed by another worker
+        total -= size
+    return removed
+
+
+def _janitor_loop(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            removed = sweep_report_files()
+            if report_store is not None:
+                removed += report_store.evict()
+            if removed:
+                print(f"INFO: Report janitor evicted {removed} unclaimed reports.")
+        except Exception as e:
+            print(f"ERROR: Report janitor failed: {e}")
+
+
+_janitor_started = False
+_janitor_lock = threading.Lock()
+
+
+def start_report_janitor(interval=REPORT_JANITOR_INTERVAL):
+    """Starts the background thread that evicts unclaimed reports (once per process)."""
+    global _janitor_started
+    with _janitor_lock:
+        if _janitor_started:
+            return
+        _janitor_started = True
+    threading.Thread(target=_janitor_loop, args=(interval,), name="report-janitor", daemon=True).start()
@@ -0,0 +1,316 @@
+import os
+import time
+import random
+import asyncio
+import threading
+import collections
+import email.utils
+import openai
+from utils import metrics
+from utils.rate_limit import openai_rate_limiter
+
+# --- Resilience Configuration ---
+# Whole budget for one OpenAI call incl. retries, and the limit for a single attempt
+OPENAI_CALL_DEADLINE = float(os.getenv("OPENAI_CALL_DEADLINE", "180"))
+OPENAI_ATTEMPT_TIMEOUT = float(os.getenv("OPENAI_ATTEMPT_TIMEOUT", "90"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "4"))
+# Exponential backoff with full jitter: sleep a random 0..min(max, base * 2^attempt) seconds
+OPENAI_BACKOFF_BASE = float(os.getenv("OPENAI_BACKOFF_BASE", "1.0"))
+OPENAI_BACKOFF_MAX = float(os.getenv("OPENAI_BACKOFF_MAX", "20"))
+# Hedged requests: fire a duplicate once an attempt runs longer than this latency quantile
+# of recent calls (e.g. 0.95). 0 disables hedging; it is off by default as it can double the spend on slow calls.
+OPENAI_HEDGE_QUANTILE = float(os.getenv("OPENAI_HEDGE_QUANTILE", "0"))
+OPENAI_HEDGE_MIN_SAMPLES = int(os.getenv("OPENAI_HEDGE_MIN_SAMPLES", "20"))
+OPENAI_HEDGE_WINDOW = int(os.getenv("OPENAI_HEDGE_WINDOW", "200"))
+# Circuit breaker: after this many consecutive server-side failures, fail fast for the cooldown
+OPENAI_BREAKER_THRESHOLD = int(os.getenv("OPENAI_BREAKER_THRESHOLD", "8"))
+OPENAI_BREAKER_COOLDOWN = float(os.getenv("OPENAI_BREAKER_COOLDOWN", "30"))
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class OpenAIUnavailableError(RuntimeError):
+    """Raised when an OpenAI call still fails after its retries, or its deadline runs out."""
+
+
+class CircuitOpenError(OpenAIUnavailableError):
+    """Raised without calling OpenAI while the circuit breaker is open."""
+
+
+# --- Circuit Breaker ---
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker. Closed: calls pass. Open (after `failure_threshold`
+    failures in a row): calls fail fast with CircuitOpenError for `cooldown` seconds.
+    Half-open: one probe call is let through; its success closes the breaker, its failure reopens it.
+    Thread-safe, as Flask[async] runs each request on its own event loop thread.
+    """
+
+    def __init__(self, failure_threshold=OPENAI_BREAKER_THRESHOLD, cooldown=OPENAI_BREAKER_COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half_open" if time.monotonic() - self._opened_at >= self.cooldown else "open"
+
+    def before_call(self):
+        """Raises CircuitOpenError if the call must not go out."""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < self.cooldown or self._probe_in_flight:
+                raise CircuitOpenError("OpenAI circuit breaker is open after repeated failures.")
+            self._probe_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                print("INFO: OpenAI circuit breaker closed.")
+            self._failures = 0
+            self._opened_at = None
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probe_in_flight or (self._opened_at is None and self._failures >= self.failure_threshold):
+                print(f"WARNING: OpenAI circuit breaker opened for {self.cooldown:.0f}s after {self._failures} failures.")
+                self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def release_probe(self):
+        """Frees the half-open probe slot after a call that neither succeeded nor failed server-side."""
+        with self._lock:
+            self._probe_in_flight = False
+
+
+openai_breaker = CircuitBreaker()
+metrics.OPENAI_BREAKER_OPEN.set_function(lambda: int(openai_breaker.state != "closed"))
+
+
+# --- Latency Tracking (for hedging) ---
+
+class LatencyTracker:
+    """Sliding window of successful call latencies per key (e.g. model and max_tokens)."""
+
+    def __init__(self, window=OPENAI_HEDGE_WINDOW, min_samples=OPENAI_HEDGE_MIN_SAMPLES):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, seconds):
+        with self._lock:
+            self._samples.setdefault(key, collections.deque(maxlen=self.window)).append(seconds)
+
+    def quantile(self, key, q):
+        """The q-quantile of recent latencies for `key`, or None until there are enough samples."""
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+latency_tracker = LatencyTracker()
+
+
+# --- Error Classification ---
+
+def _status_code(exc):
+    return getattr(exc, "status_code", None)
+
+
+def is_retryable(exc):
+    """Timeouts, connection errors, 429 and 5xx are worth another attempt; other 4xx are not."""
+    if isinstance(exc, (asyncio.TimeoutError, openai.APIConnectionError)):
+        return True
+    return _status_code(exc) in RETRYABLE_STATUS_CODES or (_status_code(exc) or 0) >= 500
+
+
+def _counts_against_breaker(exc):
+    # 429s mean "slow down", not "down"; they are handled by backoff and Retry-After alone
+    return is_retryable(exc) and _status_code(exc) != 429
+
+
+def retry_after(exc):
+    """Seconds to wait from the Retry-After / retry-after-ms headers of an API error, or None."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            retry_at = email.utils.parsedate_to_datetime(value) # HTTP-date form
+            return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, exc=None):
+    """Delay before retry number `attempt` (0-based): Retry-After when the server sent one, else jittered backoff."""
+    server_delay = retry_after(exc) if exc is not None else None
+    if server_delay is not None:
+        return server_delay + random.uniform(0, 0.1 * server_delay + 0.05)
+    return random.uniform(0, min(OPENAI_BACKOFF_MAX, OPENAI_BACKOFF_BASE * 2 ** attempt))
+
+
+def _retry_reason(exc):
+    if isinstance(exc, asyncio.TimeoutError):
+        return "timeout"
+    if isinstance(exc, openai.APIConnectionError):
+        return "timeout" if isinstance(exc, openai.APITimeoutError) else "connection"
+    return "rate_limited" if _status_code(exc) == 429 else "server_error"
+
+
+# --- Calls ---
+
+async def _hedged_attempt(attempt_fn, timeout, hedge_after, rate_cost=None):
+    """
+    Runs attempt_fn(); if it hasn't finished after `hedge_after` seconds, starts a duplicate
+    (when the rate limiter has room for it at retry priority). The first successful result
+    wins and the other call is cancelled.
+    """
+    loop = asyncio.get_running_loop()
+    give_up_at = loop.time() + timeout
+    tasks = {asyncio.ensure_future(attempt_fn())}
+    hedged = False
+    last_exc = None
+    try:
+        while tasks:
+            remaining = give_up_at - loop.time()
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            wait_for = remaining if hedged else min(remaining, hedge_after)
+            done, tasks = await asyncio.wait(tasks, timeout=wait_for, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                last_exc = task.exception()
+            if not done and not hedged:
+                # The first attempt is slower than usual: fire the duplicate
+                hedged = True
+                if rate_cost is not None and openai_rate_limiter is not None and await openai_rate_limiter.try_acquire_async(rate_cost, retry=True) > 0:
+                    continue # No budget to spare for a duplicate; keep waiting on the first attempt
+                metrics.OPENAI_HEDGES.inc()
+                tasks.add(asyncio.ensure_future(attempt_fn()))
+        raise last_exc
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def call_with_retries(attempt_fn, description="OpenAI call", latency_key=None, hedge=False, rate_cost=None,
+                            deadline=None, attempt_timeout=None, max_retries=None):
+    """
+    Awaits attempt_fn() (a coroutine factory) with a per-attempt timeout, retrying timeouts,
+    connection errors, 429 and 5xx with jittered exponential backoff (or the server's
+    Retry-After) until `deadline` seconds have passed. With `hedge`, attempts that run past
+    the OPENAI_HEDGE_QUANTILE latency of recent calls with the same `latency_key` are raced
+    against a duplicate. With a `rate_cost` (estimated tokens), every attempt first waits for
+    the shared OpenAI budget (utils/rate_limit.py), retries behind first attempts. Raises OpenAIUnavailableError (CircuitOpenError when the breaker is
+    open) once retries are exhausted; non-retryable errors such as 400 are raised as they are.
+    """
+    deadline = OPENAI_CALL_DEADLINE if deadline is None else deadline
+    attempt_timeout = OPENAI_ATTEMPT_TIMEOUT if attempt_timeout is None else attempt_timeout
+    max_retries = OPENAI_MAX_RETRIES if max_retries is None else max_retries
+    loop = asyncio.get_running_loop()
+    give_up_at = loop.time() + deadline
+
+    for attempt in range(max_retries + 1):
+        openai_breaker.before_call()
+        # Every exit from here must settle the breaker, or a half-open probe slot stays taken forever
+        try:
+            timeout = min(attempt_timeout, give_up_at - loop.time())
+            if timeout <= 0:
+                raise OpenAIUnavailableError(f"{description} ran out of its {deadline:.0f}s deadline.")
+            if rate_cost is not None and openai_rate_limiter is not None:
+                if not await openai_rate_limiter.acquire(rate_cost, retry=attempt > 0, timeout=give_up_at - loop.time()):
+                    raise OpenAIUnavailableError(f"{description} could not get OpenAI rate limit budget within its deadline.")
+                timeout = min(attempt_timeout, give_up_at - loop.time())
+            hedge_after = latency_tracker.quantile(latency_key, OPENAI_HEDGE_QUANTILE) if hedge and OPENAI_HEDGE_QUANTILE > 0 else None
+            started = loop.time()
+            if hedge_after is not None and hedge_after < timeout:
+                result = await _hedged_attempt(attempt_fn, timeout, hedge_after, rate_cost)
+            else:
+                result = await asyncio.wait_for(attempt_fn(), timeout)
+        except Exception as e:
+            if _counts_against_breaker(e):
+                openai_breaker.record_failure()
+            else:
+                openai_breaker.release_probe()
+            if not is_retryable(e):
+                raise
+            if _status_code(e) == 429 and openai_rate_limiter is not None:
+                # Our estimate ran ahead of OpenAI's count: make every worker back off, not just this call
+                await openai_rate_limiter.drain_async()
+            delay = backoff_delay(attempt, e)
+            if attempt == max_retries or loop.time() + delay >= give_up_at:
+                raise OpenAIUnavailableError(f"{description} failed after {attempt + 1} attempt(s): {e!r}") from e
+            reason = _retry_reason(e)
+            metrics.OPENAI_RETRIES.inc(reason=reason)
+            print(f"WARNING: {description} attempt {attempt + 1} failed ({reason}: {e!r}). Retrying in {delay:.1f}s.")
+            await asyncio.sleep(delay)
+            continue
+        except BaseException:
+            # Cancelled (a sibling section failed, or the losing side of a hedge): not the server's fault
+            openai_breaker.release_probe()
+            raise
+        openai_breaker.record_success()
+        if latency_key is not None:
+            latency_tracker.record(latency_key, loop.time() - started)
+        return result
+
+
+if __name__ == '__main__':
+    # Cancelling the half-open probe must free its slot, or the breaker never lets another call through
+    async def _check_cancelled_probe():
+        breaker = openai_breaker
+        breaker.failure_threshold, breaker.cooldown = 1, 0.05
+        breaker.record_failure()
+        assert breaker.state == "open"
+        await asyncio.sleep(breaker.cooldown)
+
+        async def hang():
+            await asyncio.sleep(3600)
+
+        probe = asyncio.ensure_future(call_with_retries(hang, "probe"))
+        await asyncio.sleep(0.01)
+        assert breaker._probe_in_flight
+        probe.cancel()
+        await asyncio.gather(probe, return_exceptions=True)
+        assert not breaker._probe_in_flight
+
+        async def ok():
+            return "ok"
+
+        assert await call_with_retries(ok, "trial") == "ok"
+        assert breaker.state == "closed"
+
+        # Running out of the deadline after the probe slot is taken must free it too
+        breaker.record_failure()
+        await asyncio.sleep(breaker.cooldown)
+        try:
+            await call_with_retries(ok, "expired", deadline=0)
+        except OpenAIUnavailableError:
+            pass
+        assert not breaker._probe_in_flight and breaker.state == "half_open"
+        print("Circuit breaker probe checks passed.")
+
+    asyncio.run(_check_cancelled_probe())
@@ -0,0 +1,121 @@
+import os
+import re
+import time
+import uuid
+import tempfile
+import threading
+from utils.images import PALM_IMAGE_FORMAT, PalmImageVariants, normalize_image_file, wrap_variants
+
+# --- Upload Configuration ---
+PALM_UPLOAD_DIR = os.getenv("PALM_UPLOAD_DIR", "temp_uploads")
+PALM_UPLOAD_MAX_BYTES = int(os.getenv("PALM_UPLOAD_MAX_BYTES", str(15 * 1024 * 1024))) # Per image
+PALM_UPLOAD_TTL = int(os.getenv("PALM_UPLOAD_TTL", "3600")) # Seconds an unused upload is kept
+# Largest request body either app accepts, chunked or not (Flask's MAX_CONTENT_LENGTH): by default
+# four palm photos inlined as base64 in a report payload, plus room for the other fields
+REQUEST_MAX_BYTES = int(os.getenv("REQUEST_MAX_BYTES", str(4 * (PALM_UPLOAD_MAX_BYTES * 4 // 3) + 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+_IMAGE_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+_VARIANT_EXTENSION = ".webp" if PALM_IMAGE_FORMAT == "WEBP" else ".jpg"
+_last_sweep = 0.0
+_sweep_lock = threading.Lock()
+
+
+class UploadTooLargeError(ValueError):
+    """Raised when an upload exceeds PALM_UPLOAD_MAX_BYTES."""
+
+
+class UnknownUploadError(LookupError):
+    """Raised when an image id does not refer to a stored upload."""
+
+
+def _variant_paths(image_id):
+    base = os.path.join(PALM_UPLOAD_DIR, image_id)
+    return PalmImageVariants(for_vision=f"{base}.vision{_VARIANT_EXTENSION}", for_print=f"{base}.print{_VARIANT_EXTENSION}")
+
+
+def _too_large(max_bytes):
+    return UploadTooLargeError(f"Palm image exceeds the {max_bytes // (1024 * 1024)} MB limit.")
+
+
+def _normalize_unseekable(stream, max_bytes):
+    """For a stream that can't seek: copies it in fixed-size chunks into a spooled buffer, enforcing `max_bytes`, then normalizes it."""
+    with tempfile.SpooledTemporaryFile(max_size=1024 * 1024, dir=PALM_UPLOAD_DIR) as spool:
+        received = 0
+        while True:
+            chunk = stream.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            received += len(chunk)
+            if received > max_bytes:
+                raise _too_large(max_bytes)
+            spool.write(chunk)
+        spool.seek(0)
+        return received, normalize_image_file(spool)
+
+
+def save_palm_upload(stream, max_bytes=PALM_UPLOAD_MAX_BYTES):
+    """
+    Normalizes an uploaded image stream and stores its vision and print variants on disk.
+    Returns the image id. Werkzeug and Starlette have already spooled the multipart file, so
+    it is measured and decoded where it is rather than copied into a buffer of our own;
+    anything over `max_bytes` is rejected before decoding.
+    """
+    os.makedirs(PALM_UPLOAD_DIR, exist_ok=True)
+    _sweep_stale_uploads()
+
+    try:
+        stream.seek(0, os.SEEK_END)
+        received = stream.tell()
+        stream.seek(0)
+    except (AttributeError, OSError): # Not seekable (io.UnsupportedOperation is an OSError)
+        received, variants = _normalize_unseekable(stream, max_bytes)
+    else:
+        if received > max_bytes:
+            raise _too_large(max_bytes)
+        variants = normalize_image_file(stream)
+
+    image_id = uuid.uuid4().hex
+    for path, data in zip(_variant_paths(image_id), variants):
+        # Write then rename, so a concurrent reader never sees a partial file
+        partial_path = f"{path}.part"
+        with open(partial_path, "wb") as f:
+            f.write(data)
+        os.replace(partial_path, path)
+    print(f"INFO: Stored palm upload {image_id} ({received} bytes received)")
+    return image_id
+
+
+def load_palm_upload(image_id):
+    """Returns the PalmImageVariants (PalmImage handles) for a stored upload."""
+    if not isinstance(image_id, str) or not _IMAGE_ID_PATTERN.match(image_id):
+        raise UnknownUploadError("Invalid palm image id.")
+    variants = []
+    for path in _variant_paths(image_id):
+        try:
+            with open(path, "rb") as f:
+                variants.append(f.read())
+        except FileNotFoundError:
+            raise UnknownUploadError("Palm image not found or expired. Please upload it again.") from None
+    return wrap_variants(variants)
+
+
+def _sweep_stale_uploads():
+    """Deletes uploads older than PALM_UPLOAD_TTL. Runs at most once a minute per process."""
+    global _last_sweep
+    now = time.time()
+    with _sweep_lock:
+        if now - _last_sweep < 60:
+            return
+        _last_sweep = now
+    try:
+        entries = list(os.scandir(PALM_UPLOAD_DIR))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        try:
+            if entry.is_file() and now - entry.stat().st_mtime > PALM_UPLOAD_TTL:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass # Removed by another worker
+
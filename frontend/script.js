@@ -87,6 +87,121 @@ document.addEventListener('DOMContentLoaded', () => {
     // Initial setup
     toggleReportSections(); // Set initial visibility and required fields
 
+    // --- Report Job Polling ---
+    const JOB_POLL_INTERVAL_MS = 3000;
+    const JOB_POLL_TIMEOUT_MS = 15 * 60 * 1000;
+
+    async function pollReportJob(statusUrl) {
+        const deadline = Date.now() + JOB_POLL_TIMEOUT_MS;
+        while (Date.now() < deadline) {
+            await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+            const statusResponse = await fetch(`${BACKEND_URL}${statusUrl}`);
+            const statusData = await statusResponse.json();
+            if (!statusResponse.ok) {
+                throw new Error(statusData.message || 'Failed to check report status.');
+            }
+            if (statusData.job_status === 'succeeded') {
+                return statusData;
+            }
+            if (statusData.job_status === 'failed') {
+                throw new Error(statusData.error || 'Report generation failed. Please contact support.');
+            }
+        }
+        throw new Error('Report generation is taking longer than expected. Please contact support.');
+    }
+
+    // --- Streamed Report Generation ---
+    const liveReport = document.getElementById('liveReport');
+
+    function sectionTitle(sectionKey) {
+        return sectionKey.split('_').map(word => word.charAt(0).toUpperCase() + word.slice(1)).join(' ');
+    }
+
+    // Lays out one (initially empty) block per section, in report order
+    function prepareLiveReport(sectionKeys) {
+        liveReport.innerHTML = '';
+        sectionKeys.forEach(sectionKey => {
+            const heading = document.createElement('h5');
+            heading.textContent = sectionTitle(sectionKey);
+            const text = document.createElement('div');
+            text.className = 'section-text';
+            text.dataset.section = sectionKey;
+            liveReport.append(heading, text);
+        });
+        liveReport.classList.remove('d-none');
+    }
+
+    function appendSectionText(sectionKey, text) {
+        const block = liveReport.querySelector(`.section-text[data-section="${sectionKey}"]`);
+        if (block) {
+            block.textContent += text;
+        }
+    }
+
+    // POSTs the payload to the SSE endpoint and renders text as it arrives; resolves with the 'done' event data
+    async function streamReport(payload) {
+        const response = await fetch(`${BACKEND_URL}/api/generate-report/stream`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(payload)
+        });
+        if (!response.ok) {
+            const errorData = await response.json();
+            throw new Error(errorData.message || 'Failed to generate report. Please check backend console.');
+        }
+
+        const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += value;
+
+            // Events are separated by a blank line; keep any incomplete tail for the next chunk
+            const rawEvents = buffer.split('\n\n');
+            buffer = rawEvents.pop();
+            for (const rawEvent of rawEvents) {
+                let eventName = 'message';
+                let data = '';
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event: ')) eventName = line.slice(7);
+                    else if (line.startsWith('data: ')) data += line.slice(6);
+                });
+                if (!data) continue; // Keep-alive comment
+
+                const eventData = JSON.parse(data);
+                if (eventName === 'sections') {
+                    prepareLiveReport(eventData.sections);
+                } else if (eventName === 'delta') {
+                    appendSectionText(eventData.section, eventData.text);
+                } else if (eventName === 'rendering') {
+                    loadingSpinner.querySelector('p').textContent = 'Your report is written. Preparing the PDF...';
+                } else if (eventName === 'done') {
+                    return eventData;
+                } else if (eventName === 'error') {
+                    throw new Error(eventData.message || 'Report generation failed. Please contact support.');
+                }
+            }
+        }
+        throw new Error('Connection closed before the report was ready. Please contact support.');
+    }
+
+    // Older browsers without streaming fetch fall back to the background job endpoint
+    async function generateReportViaJob(payload) {
+        const submitJobResponse = await fetch(`${BACKEND_URL}/api/report-jobs`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(payload)
+        });
+
+        if (!submitJobResponse.ok) {
+            const errorData = await submitJobResponse.json();
+            throw new Error(errorData.message || 'Failed to generate report. Please check backend console.');
+        }
+        const jobData = await submitJobResponse.json();
+        return pollReportJob(jobData.status_url);
+    }
+
     // --- Form Submission Logic ---
     reportForm.addEventListener('submit', async (event) => {
         event.preventDefault(); // Prevent default form submission
@@ -103,14 +218,19 @@ document.addEventListener('DOMContentLoaded', () => {
             let amount = 0;
             let payload = {};
 
-            // Helper to convert file to Base64
-            const getBase64 = (file) => {
-                return new Promise((resolve, reject) => {
-                    const reader = new FileReader();
-                    reader.readAsDataURL(file);
-                    reader.onload = () => resolve(reader.result.split(',')[1]);
-                    reader.onerror = error => reject(error);
+            // Helper to upload one palm photo as multipart/form-data; returns its image id
+            const uploadPalmImage = async (file) => {
+                const formData = new FormData();
+                formData.append('image', file);
+                const uploadResponse = await fetch(`${BACKEND_URL}/api/palm-images`, {
+                    method: 'POST',
+                    body: formData
                 });
+                const uploadData = await uploadResponse.json();
+                if (!uploadResponse.ok) {
+                    throw new Error(uploadData.message || 'Failed to upload palm image.');
+                }
+                return uploadData.image_id;
             };
 
             if (reportType === 'individual') {
@@ -133,8 +253,8 @@ document.addEventListener('DOMContentLoaded', () => {
                         dob: dob1,
                         gender: gender1
                     },
-                    left_palm_image_base64: await getBase64(leftPalm1),
-                    right_palm_image_base64: await getBase64(rightPalm1)
+                    left_palm_image_id: await uploadPalmImage(leftPalm1),
+                    right_palm_image_id: await uploadPalmImage(rightPalm1)
                 };
 
             } else if (reportType === 'couple') {
@@ -164,15 +284,15 @@ document.addEventListener('DOMContentLoaded', () => {
                         dob: dobP1,
                         gender: genderP1
                     },
-                    person1_left_palm_image_base64: await getBase64(leftPalmP1),
-                    person1_right_palm_image_base64: await getBase64(rightPalmP1),
+                    person1_left_palm_image_id: await uploadPalmImage(leftPalmP1),
+                    person1_right_palm_image_id: await uploadPalmImage(rightPalmP1),
                     person2_details: {
                         name: fullNameP2,
                         dob: dobP2,
                         gender: genderP2
                     },
-                    person2_left_palm_image_base64: await getBase64(leftPalmP2),
-                    person2_right_palm_image_base64: await getBase64(rightPalmP2)
+                    person2_left_palm_image_id: await uploadPalmImage(leftPalmP2),
+                    person2_right_palm_image_id: await uploadPalmImage(rightPalmP2)
                 };
             }
 
@@ -207,18 +327,9 @@ document.addEventListener('DOMContentLoaded', () => {
                     payload.razorpay_order_id = response.razorpay_order_id;
                     payload.razorpay_signature = response.razorpay_signature;
 
-                    // 4. On successful payment, trigger report generation on backend
-                    const generateReportResponse = await fetch(`${BACKEND_URL}/api/generate-report`, {
-                        method: 'POST',
-                        headers: { 'Content-Type': 'application/json' },
-                        body: JSON.stringify(payload)
-                    });
-
-                    if (!generateReportResponse.ok) {
-                        const errorData = await generateReportResponse.json();
-                        throw new Error(errorData.message || 'Failed to generate report. Please check backend console.');
-                    }
-                    const reportResult = await generateReportResponse.json();
+                    // 4. On successful payment, generate the report, showing its text as it is written
+                    const canStream = typeof TextDecoderStream !== 'undefined' && 'body' in Response.prototype;
+                    const reportResult = canStream ? await streamReport(payload) : await generateReportViaJob(payload);
 
                     // 5. Trigger PDF download
                     if (reportResult.download_url) {